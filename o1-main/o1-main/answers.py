@@ -0,0 +1,36 @@
+import re
+
+# The number a final answer commits to, shared by the accuracy harness (bench/accuracy.py) and the
+# self-consistency vote (consistency.py)
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12,
+}
+NUMBER = r"-?\d{1,3}(?:,\d{3})+(?:\.\d+)?|-?\d+(?:\.\d+)?|\b(?:" + "|".join(NUMBER_WORDS) + r")\b"
+NUMBERS = re.compile(NUMBER, re.IGNORECASE)
+# "the answer is 9", "Answer: 9", "17 x 24 = 408"
+STATED = re.compile(r"(?:\banswer\s*(?:is|:)|=)\s*(?:about\s+|approximately\s+|exactly\s+)?\$?(" + NUMBER + ")", re.IGNORECASE)
+# "2 or maybe 3", "either 4 or 5": more than one candidate is no answer
+HEDGE = re.compile(r"(" + NUMBER + r")\W*(?:\w+\W+){0,2}?or\s+(?:maybe\s+|possibly\s+|perhaps\s+)?\$?(" + NUMBER + ")", re.IGNORECASE)
+# Justifications that follow the answer and restate numbers from the question: "9 are left, because 8 died"
+JUSTIFICATION = re.compile(r"\b(?:because|since|given that|due to)\b[^.!?\n]*", re.IGNORECASE)
+
+def to_number(text):
+    text = text.lower().replace(",", "")
+    return float(NUMBER_WORDS[text]) if text in NUMBER_WORDS else float(text)
+
+def hedged(text):
+    return any(to_number(match.group(1)) != to_number(match.group(2)) for match in HEDGE.finditer(text))
+
+def final_number(text):
+    # The number after the last "answer is" or "=", else the last number outside the justifications;
+    # None when there is none or the answer hedges between several
+    text = str(text)
+    if hedged(text):
+        return None
+    stated = STATED.findall(text)
+    if stated:
+        return to_number(stated[-1])
+    numbers = NUMBERS.findall(JUSTIFICATION.sub("", text))
+    return to_number(numbers[-1]) if numbers else None
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from aiohttp import web
+from dotenv import load_dotenv
+import reasoning
+import consistency
+import tree
+import decompose
+from tracing import span
+from metrics import REGISTRY
+
+# Load environment variables
+load_dotenv()
+
+# API service configuration
+COT_API_HOST = os.getenv('COT_API_HOST', '0.0.0.0')
+COT_API_PORT = int(os.getenv('COT_API_PORT', '8000'))
+# Chains running at once; further chains wait in the queue. Chains are asyncio tasks, so this
+# can sit well above Ollama's parallel slots; OLLAMA_CONNECTIONS bounds the requests in flight.
+COT_MAX_CHAINS = int(os.getenv('COT_MAX_CHAINS', '256'))
+# Finished chains kept in memory for GET /chains/{id}
+COT_RETAIN_CHAINS = int(os.getenv('COT_RETAIN_CHAINS', '1000'))
+SSE_KEEPALIVE = 15
+
+# Options a client may pass through to reasoning.agenerate_response, samples/agreement for a
+# self-consistency vote (consistency.py), search "tree" with branches/beam/token_budget for tree search (tree.py)
+# and search "decompose" for solving sub-questions concurrently (decompose.py); tools turns the tool layer on or off (tools.py)
+# and retrieval the worked example from similar stored chains (retrieval.py)
+CHAIN_OPTIONS = ("system_prompt", "model", "max_steps", "backend", "route", "depth", "tools", "retrieval", "samples", "agreement",
+                 "search", "branches", "beam", "token_budget")
+SEARCH_OPTIONS = ("samples", "agreement", "search", "branches", "beam", "token_budget")
+FINISHED = ("done", "error", "cancelled")
+
+def step_to_dict(step):
+    title, content, thinking_time, raw_content, metrics = step
+    return {"title": title, "content": content, "thinking_time": thinking_time, "raw_content": raw_content, "metrics": metrics}
+
+class Chain:
+    # State lives on the event loop; the chain's task is the only writer
+
+    def __init__(self, prompt, options):
+        self.chain_id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.options = options
+        self.status = "queued"
+        self.steps = []
+        self.total_time = None
+        self.error = None
+        self.created_at = time.time()
+        self.task = None
+        self.changed = asyncio.Event()
+
+    def update(self, status, steps=None, total_time=None, error=None):
+        self.status = status
+        if steps is not None:
+            self.steps = steps
+        if total_time is not None:
+            self.total_time = total_time
+        if error is not None:
+            self.error = error
+        # Wake every subscriber, then arm a fresh event for the next change
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "chain_id": self.chain_id,
+            "prompt": self.prompt,
+            "options": self.options,
+            "status": self.status,
+            "created_at": self.created_at,
+            "steps": [step_to_dict(step) for step in self.steps],
+            "total_time": self.total_time,
+            "error": self.error,
+        }
+
+def chain_generator(prompt, options):
+    if options.get("search", "chain") not in ("chain", "tree", "decompose"):
+        raise ValueError(f"Unknown search {options['search']!r}; expected chain, tree or decompose")
+    if options.get("search") == "tree":
+        return tree.agenerate_tree(prompt, **{key: options[key] for key in tree.TREE_OPTIONS if key in options})
+    if options.get("search") == "decompose":
+        return decompose.agenerate_decomposed(prompt, **{key: options[key] for key in decompose.DECOMPOSE_OPTIONS if key in options})
+    chain_options = {key: value for key, value in options.items() if key not in SEARCH_OPTIONS}
+    if options.get("samples", 1) > 1:
+        return consistency.agenerate_consistent(prompt, samples=options["samples"], agreement=options.get("agreement", consistency.CONSISTENCY_AGREEMENT),
+                                                **chain_options)
+    return reasoning.agenerate_response(prompt, **chain_options)
+
+class ChainStore:
+    def __init__(self, max_chains=COT_MAX_CHAINS, retain=COT_RETAIN_CHAINS):
+        self.chains = OrderedDict()
+        self.retain = retain
+        self.slots = asyncio.Semaphore(max_chains)
+
+    def start(self, prompt, options):
+        chain = Chain(prompt, options)
+        self.chains[chain.chain_id] = chain
+        self.evict()
+        chain.task = asyncio.get_running_loop().create_task(self.run(chain))
+        return chain
+
+    def evict(self):
+        finished = [chain_id for chain_id, chain in self.chains.items() if chain.status in FINISHED]
+        for chain_id in finished[:max(0, len(self.chains) - self.retain)]:
+            del self.chains[chain_id]
+
+    def count(self, status):
+        return sum(1 for chain in self.chains.values() if chain.status == status)
+
+    async def run(self, chain):
+        try:
+            async with self.slots:
+                chain.update("running")
+                # The chain id doubles as the trace id
+                with span("api.chain", trace_id=chain.chain_id):
+                    async for steps, total_time in chain_generator(chain.prompt, chain.options):
+                        chain.update("running", list(steps), total_time)
+            chain.update("done")
+        except asyncio.CancelledError:
+            chain.update("cancelled")
+        except Exception as e:
+            chain.update("error", error=str(e))
+
+routes = web.RouteTableDef()
+
+def get_chain(request):
+    chain = request.app["store"].chains.get(request.match_info["chain_id"])
+    if chain is None:
+        raise web.HTTPNotFound(text=json.dumps({"error": "unknown chain"}), content_type="application/json")
+    return chain
+
+@routes.post("/chains")
+async def create_chain(request):
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "body must be JSON"}), content_type="application/json")
+    prompt = body.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise web.HTTPBadRequest(text=json.dumps({"error": "prompt is required"}), content_type="application/json")
+    options = {key: body[key] for key in CHAIN_OPTIONS if body.get(key) is not None}
+    chain = request.app["store"].start(prompt, options)
+    return web.json_response({
+        "chain_id": chain.chain_id,
+        "status": chain.status,
+        "state_url": f"/chains/{chain.chain_id}",
+        "events_url": f"/chains/{chain.chain_id}/events",
+    }, status=202)
+
+@routes.get("/chains/{chain_id}")
+async def chain_state(request):
+    return web.json_response(get_chain(request).to_dict())
+
+@routes.delete("/chains/{chain_id}")
+async def cancel_chain(request):
+    chain = get_chain(request)
+    if chain.status not in FINISHED:
+        # Interrupts the Ollama request in progress; a queued chain never starts
+        chain.task.cancel()
+    return web.json_response({"chain_id": chain.chain_id, "status": chain.status}, status=202)
+
+@routes.get("/chains/{chain_id}/events")
+async def chain_events(request):
+    chain = get_chain(request)
+    # A reconnecting client resumes after the last step it received; checked before the stream starts,
+    # while an error can still be sent as a status
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID", -1))
+    except ValueError:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Last-Event-ID must be a step index"}), content_type="application/json")
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+
+    async def send(event, data, event_id=None):
+        message = (f"id: {event_id}\n" if event_id is not None else "") + f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        await response.write(message.encode())
+
+    sent = max(last_event_id, -1) + 1
+    try:
+        while True:
+            changed = chain.changed
+            while sent < len(chain.steps):
+                await send("step", {"index": sent, "step": step_to_dict(chain.steps[sent])}, sent)
+                sent += 1
+            if chain.status == "done":
+                await send("done", {"chain_id": chain.chain_id, "total_time": chain.total_time})
+                break
+            if chain.status in FINISHED:
+                await send("error", {"chain_id": chain.chain_id, "status": chain.status, "error": chain.error})
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                await response.write(b": keep-alive\n\n")
+    except ConnectionResetError:
+        pass  # Client went away; the chain keeps running
+    return response
+
+@routes.get("/health")
+async def health(request):
+    store = request.app["store"]
+    return web.json_response({"status": "ok", "running": store.count("running"), "queued": store.count("queued"), "chains": len(store.chains)})
+
+@routes.get("/metrics")
+async def metrics(request):
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+def create_app(store=None):
+    app = web.Application()
+    app["store"] = store or ChainStore()
+    app.add_routes(routes)
+
+    async def close_connections(app):
+        await reasoning.close_connections()
+    app.on_cleanup.append(close_connections)
+    return app
+
+def main():
+    web.run_app(create_app(), host=COT_API_HOST, port=COT_API_PORT)
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,15 @@
 import streamlit as st
-import groq
 import os
-import json
-import time
+import reasoning
+from metrics import start_exporters
 
-client = groq.Groq()
+GROQ_MODEL = os.getenv('GROQ_MODEL', "llama-3.1-70b-versatile")
 
-def make_api_call(messages, max_tokens, is_final_answer=False):
-    for attempt in range(3):
-        try:
-            response = client.chat.completions.create(
-                model="llama-3.1-70b-versatile",
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=0.2,
-                response_format={"type": "json_object"}
-            )
-            return json.loads(response.choices[0].message.content)
-        except Exception as e:
-            if attempt == 2:
-                if is_final_answer:
-                    return {"title": "Error", "content": f"Failed to generate final answer after 3 attempts. Error: {str(e)}"}
-                else:
-                    return {"title": "Error", "content": f"Failed to generate step after 3 attempts. Error: {str(e)}", "next_action": "final_answer"}
-            time.sleep(1)  # Wait for 1 second before retrying
+# Prometheus endpoint / textfile export (METRICS_PORT, METRICS_FILE)
+start_exporters()
 
-def generate_response(prompt):
-    messages = [
-        {"role": "system", "content": """You are an expert AI assistant with advanced reasoning capabilities. Your task is to provide detailed, step-by-step explanations of your thought process. For each step:
+# Each chain runs in the shared engine (reasoning.py); this app picks the backend, model and prompt
+SYSTEM_PROMPT = """You are an expert AI assistant with advanced reasoning capabilities. Your task is to provide detailed, step-by-step explanations of your thought process. For each step:
 
 1. Provide a clear, concise title describing the current reasoning phase.
 2. Elaborate on your thought process in the content section.
@@ -56,46 +38,10 @@ Example of a valid JSON response:
     "content": "To approach this problem effectively, I'll first break down the given information into key components. This involves identifying...[detailed explanation]... By structuring the problem this way, we can systematically address each aspect.",
     "next_action": "continue"
 }```
-"""},
-        {"role": "user", "content": prompt},
-        {"role": "assistant", "content": "Thank you! I will now think step by step following my instructions, starting at the beginning after decomposing the problem."}
-    ]
-    
-    steps = []
-    step_count = 1
-    total_thinking_time = 0
-    
-    while True:
-        start_time = time.time()
-        step_data = make_api_call(messages, 300)
-        end_time = time.time()
-        thinking_time = end_time - start_time
-        total_thinking_time += thinking_time
-        
-        steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time))
-        
-        messages.append({"role": "assistant", "content": json.dumps(step_data)})
-        
-        if step_data['next_action'] == 'final_answer':
-            break
-        
-        step_count += 1
-
-        # Yield after each step for Streamlit to update
-        yield steps, None  # We're not yielding the total time until the end
-
-    # Generate final answer
-    messages.append({"role": "user", "content": "Please provide the final answer based on your reasoning above."})
-    
-    start_time = time.time()
-    final_data = make_api_call(messages, 200, is_final_answer=True)
-    end_time = time.time()
-    thinking_time = end_time - start_time
-    total_thinking_time += thinking_time
-    
-    steps.append(("Final Answer", final_data['content'], thinking_time))
+"""
 
-    yield steps, total_thinking_time
+def generate_response(prompt):
+    return reasoning.generate_response(prompt, system_prompt=SYSTEM_PROMPT, model=GROQ_MODEL, backend="groq")
 
 def main():
     st.set_page_config(page_title="g1 prototype", page_icon="🧠", layout="wide")
@@ -122,7 +68,7 @@ def main():
         # Generate and display the response
         for steps, total_thinking_time in generate_response(user_query):
             with response_container.container():
-                for i, (title, content, thinking_time) in enumerate(steps):
+                for i, (title, content, thinking_time, raw_content, metrics) in enumerate(steps):
                     if title.startswith("Final Answer"):
                         st.markdown(f"### {title}")
                         st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
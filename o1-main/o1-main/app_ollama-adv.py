@@ -1,13 +1,16 @@
 import streamlit as st
 import json
 import time
-import requests
 from dotenv import load_dotenv
 import os
-import re
-import traceback
-import subprocess
+from datetime import datetime, timezone
 from pymongo import MongoClient
+import reasoning
+from reasoning import parse_json
+from ollama_client import describe_metrics
+from tracing import current_trace_id, span, trace_generator
+from metrics import CHAIN_LATENCY, STEP_LATENCY, DB_WRITE_LATENCY, start_exporters
+from step_rater import STEP_RATING, StepRater
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +19,9 @@ load_dotenv()
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2')
 
+# Prometheus endpoint / textfile export (METRICS_PORT, METRICS_FILE)
+start_exporters()
+
 def get_mongo_client():
     client = MongoClient("mongodb://localhost:27017/")  # Replace with your MongoDB connection string
     return client
@@ -30,74 +36,19 @@ def check_for_follow_up(raw_content, step_data):
         return 'continue' + important_message
     return None
 
-def extract_json_objects(text):
-    # This regex pattern matches JSON-like structures without using recursive patterns
-    json_pattern = re.compile(r'\{(?:[^{}]|\{[^{}]*\})*\}')
-    return json_pattern.findall(text)
-
-def clean_json_string(json_string):
-    # Remove any text before the first '{'
-    json_string = re.sub(r'^[^{]*', '', json_string)
-
-
-
-    
-    # Remove any text after the last '}'
-    json_string = re.sub(r'[^}]*$', '', json_string)
-    # Remove any trailing commas before closing braces or brackets
-    json_string = re.sub(r',\s*([\]}])', r'\1', json_string)
-    return json_string
-
-def parse_json_safely(json_string):
-    cleaned_json = clean_json_string(json_string)
-    json_objects = extract_json_objects(cleaned_json)
-    
-    if json_objects:
-        try:
-            # Try to parse the last JSON object found
-            return json.loads(json_objects[-1])
-        except json.JSONDecodeError as e:
-            st.error(f"Failed to parse JSON: {str(e)}")
-    
-    st.error("No valid JSON object found in the response")
-    # return None  # hide if cannot find
-    st.text("Raw response:")
-    st.code(json_string)
-    return {"title": "Error", "content": "Failed to parse response", "next_action": "final_answer"}
+def show_errors(metrics):
+    # Failed attempts behind a step: API errors, retries and unparseable responses
+    for error in metrics.get("errors", []):
+        st.error(error["message"])
+        st.code(error["detail"])
 
 def make_api_call(messages, max_tokens, is_final_answer=False):
-    for attempt in range(3):
-        try:
-            response = requests.post(
-                f"{OLLAMA_URL}/api/chat",
-                json={
-                    "model": OLLAMA_MODEL,
-                    "messages": messages,
-                    "stream": False,
-                    "options": {
-                        "num_predict": max_tokens,
-                        "temperature": 0.2
-                    }
-                }
-            )
-            response.raise_for_status()
-            raw_content = response.json()["message"]["content"]
-            parsed_data = parse_json_safely(raw_content)
-            return parsed_data, raw_content
-        except requests.exceptions.RequestException as e:
-            st.error(f"API call failed: {str(e)}")
-            st.text("Response content:")
-            st.code(response.text if hasattr(response, 'text') else "No response text available")
-        except Exception as e:
-            st.error(f"An error occurred: {str(e)}")
-            st.text("Traceback:")
-            st.code(traceback.format_exc())
-        
-        if attempt == 2:
-            error_message = f"Failed to generate {'final answer' if is_final_answer else 'step'} after 3 attempts."
-            return {"title": "Error", "content": error_message, "next_action": "final_answer"}
-        time.sleep(1)  # Wait for 1 second before retrying
+    # Retries, parsing and the HTTP client are shared with the other apps (reasoning.make_api_call)
+    step_data, raw_content, metrics = reasoning.call(messages, max_tokens, is_final_answer, model=OLLAMA_MODEL)
+    show_errors(metrics)
+    return step_data, raw_content, metrics
 
+@trace_generator("chain", backend="ollama", model=OLLAMA_MODEL)
 def generate_response(prompt):
     client = get_mongo_client()
     db = get_database(client, "COTlike-llama")
@@ -114,15 +65,23 @@ def generate_response(prompt):
     step_count = 1
     total_thinking_time = 0
     final_answer_detected = False
+    # Optional pipelined rating of each step on the rater box
+    step_rater = StepRater(prompt) if STEP_RATING else None
 
     while True:
         start_time = time.time()
-        step_data, raw_content = make_api_call(messages, 500)
+        with span("step", step=step_count) as step_span:
+            step_data, raw_content, metrics = make_api_call(messages, 500)
+            step_span.set(title=step_data['title'], tokens=metrics.get("eval_count"))
         end_time = time.time()
         thinking_time = end_time - start_time
         total_thinking_time += thinking_time
+        STEP_LATENCY.observe(thinking_time, backend="ollama", model=OLLAMA_MODEL)
 
-        steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time, raw_content))
+        steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time, raw_content, metrics))
+        if step_rater:
+            # Rated while the next step is generated
+            step_rater.submit(len(steps) - 1, step_data['title'], step_data['content'])
 
         messages.append({"role": "assistant", "content": json.dumps(step_data)})
 
@@ -133,9 +92,13 @@ def generate_response(prompt):
         # Check if a follow-up is needed
         follow_up = check_for_follow_up(raw_content, step_data)
         if follow_up:
-            messages.append({"role": "user", "content": follow_up})
+            # Low step ratings that arrived in the meantime trigger an early correction
+            correction = step_rater.correction_prompt() if step_rater else ""
+            messages.append({"role": "user", "content": correction + follow_up})
             if follow_up.startswith("continue"):
                 step_count += 1
+            if step_rater:
+                yield steps, None, step_rater.ratings()
             continue  # Skip to the next iteration without incrementing step_count
 
         if step_data['next_action'] == 'final_answer':
@@ -145,26 +108,51 @@ def generate_response(prompt):
         step_count += 1
 
         # Yield after each step for Streamlit to update
-        yield steps, None  # We're not yielding the total time until the end
+        yield steps, None, step_rater.ratings() if step_rater else {}  # We're not yielding the total time until the end
 
     # Generate final answer
-    messages.append({"role": "user", "content": "Please provide the final answer based on your reasoning above. Remember to respond with a single, well-formatted JSON object."})
+    correction = step_rater.correction_prompt() if step_rater else ""
+    messages.append({"role": "user", "content": correction + "Please provide the final answer based on your reasoning above. Remember to respond with a single, well-formatted JSON object."})
 
     start_time = time.time()
-    final_data, raw_content = make_api_call(messages, 300, is_final_answer=True)
+    with span("step", step="final") as step_span:
+        final_data, raw_content, metrics = make_api_call(messages, 300, is_final_answer=True)
+        step_span.set(title=final_data['title'], tokens=metrics.get("eval_count"))
     end_time = time.time()
     thinking_time = end_time - start_time
     total_thinking_time += thinking_time
+    STEP_LATENCY.observe(thinking_time, backend="ollama", model=OLLAMA_MODEL)
+    CHAIN_LATENCY.observe(total_thinking_time, backend="ollama", model=OLLAMA_MODEL)
+
+    steps.append(("Final Answer", final_data['content'], thinking_time, raw_content, metrics))
 
-    steps.append(("Final Answer", final_data['content'], thinking_time, raw_content))
+    # The last step's rating overlapped with the final answer
+    step_ratings = step_rater.wait_all() if step_rater else []
 
     # Store the final answer in MongoDB
     # collection.insert_one(final_data)
-    collection.insert_one({"steps": steps})
-
-    yield steps, total_thinking_time
-    # if final_answer_detected:
-    #     subprocess.run(["python", "ollama-rater.py"])
+    persist_start = time.perf_counter()
+    with span("db.insert", collection="steps"):
+        result = collection.insert_one({
+            "chain_id": current_trace_id(),
+            "steps": steps,
+            "prompt": prompt,
+            "model": OLLAMA_MODEL,
+            "step_ratings": step_ratings,
+            "created_at": datetime.now(timezone.utc)
+        })
+    persist_time = time.perf_counter() - persist_start
+    DB_WRITE_LATENCY.observe(persist_time, collection="steps")
+    collection.update_one({"_id": result.inserted_id}, {"$set": {"persist_time": persist_time}})
+
+    # Rating is picked up from the steps collection by ollama-rater-daemon.py
+    yield steps, total_thinking_time, {rating["index"]: rating for rating in step_ratings}
+
+def format_step_rating(rating):
+    if rating.get("error"):
+        return f"*Step rating failed: {rating['error']}*"
+    scores = " · ".join(f"{criterion} {value:.2f}" for criterion, value in rating["ratings"].items())
+    return f"*Step rating: {scores}*"
 
 def main():
     st.set_page_config(page_title="COTlike-llama", page_icon="🧠", layout="wide")
@@ -200,9 +188,9 @@ def main():
         time_container = st.empty()
 
         # Generate and display the response
-        for steps, total_thinking_time in generate_response(user_query):
+        for steps, total_thinking_time, step_ratings in generate_response(user_query):
             with response_container.container():
-                for i, (title, content, thinking_time, raw_content) in enumerate(steps):
+                for i, (title, content, thinking_time, raw_content, metrics) in enumerate(steps):
                     if title.startswith("Final Answer"):
                         st.markdown(f"### {title}")
                         st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
@@ -214,7 +202,7 @@ def main():
 
                             # Check if a follow-up was sent
                             # follow_up = check_for_follow_up(raw_content, json.loads(raw_content))
-                            parsed_data = parse_json_safely(raw_content)
+                            parsed_data, _ = parse_json(raw_content)
                             follow_up = check_for_follow_up(raw_content, parsed_data)
                             if follow_up:
                                 if follow_up.startswith("continue"):
@@ -222,7 +210,11 @@ def main():
                                 else:
                                     st.markdown(f"*Follow-up prompt sent: '{follow_up}'*")
 
-                    st.markdown(f"*Thinking time: {thinking_time:.2f} seconds*")
+                            if i in step_ratings:
+                                st.markdown(format_step_rating(step_ratings[i]))
+
+                    summary = describe_metrics(metrics)
+                    st.markdown(f"*Thinking time: {thinking_time:.2f} seconds*" + (f" · *{summary}*" if summary else ""))
 
             # Only show total time when it's available at the end
             if total_thinking_time is not None:
@@ -1,146 +1,54 @@
+import uuid
 import streamlit as st
-import json
-import time
-import requests
-from dotenv import load_dotenv
-import os
-import re
-import traceback
-
-# Load environment variables
-load_dotenv()
-
-# Get configuration from .env file
-OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
-OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2')
-
-def check_for_follow_up(raw_content, step_data):
-    if "Please let me know" in raw_content:
-        return "Continue, Consider ALL" + important_message
-    elif isinstance(step_data, dict) and step_data.get('next_action') == 'continue':
-        return 'continue' + important_message
-    return None
-
-def extract_json_objects(text):
-    # This regex pattern matches JSON-like structures without using recursive patterns
-    json_pattern = re.compile(r'\{(?:[^{}]|\{[^{}]*\})*\}')
-    return json_pattern.findall(text)
-
-def clean_json_string(json_string):
-    # Remove any text before the first '{'
-    json_string = re.sub(r'^[^{]*', '', json_string)
-
-
-
-    
-    # Remove any text after the last '}'
-    json_string = re.sub(r'[^}]*$', '', json_string)
-    # Remove any trailing commas before closing braces or brackets
-    json_string = re.sub(r',\s*([\]}])', r'\1', json_string)
-    return json_string
-
-def parse_json_safely(json_string):
-    cleaned_json = clean_json_string(json_string)
-    json_objects = extract_json_objects(cleaned_json)
-    
-    if json_objects:
-        try:
-            # Try to parse the last JSON object found
-            return json.loads(json_objects[-1])
-        except json.JSONDecodeError as e:
-            st.error(f"Failed to parse JSON: {str(e)}")
-    
-    st.error("No valid JSON object found in the response")
-    # return None  # hide if cannot find
-    st.text("Raw response:")
-    st.code(json_string)
-    return {"title": "Error", "content": "Failed to parse response", "next_action": "final_answer"}
-
-def make_api_call(messages, max_tokens, is_final_answer=False):
-    for attempt in range(3):
-        try:
-            response = requests.post(
-                f"{OLLAMA_URL}/api/chat",
-                json={
-                    "model": OLLAMA_MODEL,
-                    "messages": messages,
-                    "stream": False,
-                    "options": {
-                        "num_predict": max_tokens,
-                        "temperature": 0.2
-                    }
-                }
-            )
-            response.raise_for_status()
-            raw_content = response.json()["message"]["content"]
-            parsed_data = parse_json_safely(raw_content)
-            return parsed_data, raw_content
-        except requests.exceptions.RequestException as e:
-            st.error(f"API call failed: {str(e)}")
-            st.text("Response content:")
-            st.code(response.text if hasattr(response, 'text') else "No response text available")
-        except Exception as e:
-            st.error(f"An error occurred: {str(e)}")
-            st.text("Traceback:")
-            st.code(traceback.format_exc())
-        
-        if attempt == 2:
-            error_message = f"Failed to generate {'final answer' if is_final_answer else 'step'} after 3 attempts."
-            return {"title": "Error", "content": error_message, "next_action": "final_answer"}
-        time.sleep(1)  # Wait for 1 second before retrying
-
-def generate_response(prompt):
-    messages = [
-        # {"role": "system", "content": SYSTEM_PROMPT + important_message},
-        # {"role": "user", "content": "Here is my first query: " + prompt },
-        {"role": "system", "content": ""},
-        {"role": "user", "content": SYSTEM_PROMPT + important_message + "Here is my first query: " + prompt },
-        {"role": "assistant", "content": "Understood. I will now think step by step following the instructions, starting with decomposing the problem. I will provide my response in a single, well-formatted JSON object for each step."}
-    ]
-
-    steps = []
-    step_count = 1
-    total_thinking_time = 0
-
-    while True:
-        start_time = time.time()
-        step_data, raw_content = make_api_call(messages, 300)
-        end_time = time.time()
-        thinking_time = end_time - start_time
-        total_thinking_time += thinking_time
-
-        steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time, raw_content))
-
-        messages.append({"role": "assistant", "content": json.dumps(step_data)})
-
-        # Check if a follow-up is needed
-        follow_up = check_for_follow_up(raw_content, step_data)
-        if follow_up:
-            messages.append({"role": "user", "content": follow_up})
-            if follow_up.startswith("continue"):
-                step_count += 1
-            continue  # Skip to the next iteration without incrementing step_count
-
-        if step_data['next_action'] == 'final_answer':
-            break
-
-        step_count += 1
-
-        # Yield after each step for Streamlit to update
-        yield steps, None  # We're not yielding the total time until the end
-
-    # Generate final answer
-    messages.append({"role": "user", "content": "Please provide the final answer based on your reasoning above. Remember to respond with a single, well-formatted JSON object."})
-
-    start_time = time.time()
-    final_data, raw_content = make_api_call(messages, 200, is_final_answer=True)
-    end_time = time.time()
-    thinking_time = end_time - start_time
-    total_thinking_time += thinking_time
-
-    steps.append(("Final Answer", final_data['content'], thinking_time, raw_content))
-
-    yield steps, total_thinking_time
+import reasoning
+from reasoning import OLLAMA_URL, OLLAMA_MODEL, CHECKPOINT_CHAINS, check_for_follow_up, parse_json
+from reasoning_client import COT_API_URL, stream_chain
+from routing import ROUTE
+from depth import DEPTH
+from tools import TOOLS, TOOLS_ENABLED, describe_call
+from retrieval import RETRIEVAL
+from consistency import CONSISTENCY_SAMPLES, generate_consistent
+from tree import TREE_BRANCHES, TREE_BEAM, generate_tree
+from decompose import generate_decomposed
+from ollama_client import describe_metrics
+from metrics import start_exporters
+
+# Prometheus endpoint / textfile export (METRICS_PORT, METRICS_FILE)
+start_exporters()
+
+def generate_response(prompt, system_prompt=None, model=OLLAMA_MODEL, max_steps=None, route=ROUTE, depth=DEPTH, samples=1, search="chain"):
+    # Runs the chain on the reasoning API service when COT_API_URL is set, in-process otherwise.
+    # samples > 1 runs that many chains and answers with their majority (consistency.py);
+    # search="tree" searches a tree of candidate steps instead (tree.py), search="decompose" solves
+    # sub-questions concurrently (decompose.py).
+    if COT_API_URL:
+        return stream_chain(prompt, system_prompt=system_prompt, model=model, max_steps=max_steps, route=route, depth=depth,
+                            samples=samples if samples > 1 else None, search=search)
+    if search == "tree":
+        return generate_tree(prompt, system_prompt=system_prompt, model=model, max_steps=max_steps)
+    if search == "decompose":
+        return generate_decomposed(prompt, model=model, max_steps=max_steps, route=route)
+    if samples > 1:
+        return generate_consistent(prompt, samples=samples, system_prompt=system_prompt, model=model, max_steps=max_steps, route=route, depth=depth)
+    return reasoning.generate_response(prompt, system_prompt=system_prompt, model=model, max_steps=max_steps, route=route, depth=depth)
+
+def checkpointed_chain():
+    # The chain id sits in the URL, so a reload, even after a restart of this process, resumes the chain
+    chain_id = st.query_params.get("chain")
+    return chain_id, reasoning.get_checkpoint(chain_id) if chain_id else None
+
+def show_vote(consistency):
+    # Every sampled chain's answer next to the consensus
+    with st.expander(f"Self-consistency: {consistency['agreement']:.0%} of {consistency['answered']} answers agree"):
+        for number, chain in enumerate(consistency["chains"], 1):
+            answer = chain.get("answer") or chain.get("error") or ""
+            st.markdown(f"**Chain {number}** (temperature {chain['temperature']:.2f}, {chain['status']}): {answer[:300]}")
+
+def show_errors(metrics):
+    # Failed attempts behind a step: API errors, retries and unparseable responses
+    for error in metrics.get("errors", []):
+        st.error(error["message"])
+        st.code(error["detail"])
 
 def main():
     st.set_page_config(page_title="COTlike-llama", page_icon="🧠", layout="wide")
@@ -164,9 +72,25 @@ def main():
     st.markdown(f"**Current Configuration:**")
     st.markdown(f"- Ollama URL: `{OLLAMA_URL}`")
     st.markdown(f"- Ollama Model: `{OLLAMA_MODEL}`")
+    if ROUTE:
+        st.markdown(f"- Model route: `{ROUTE}`")
+    st.markdown(f"- Reasoning depth: `{DEPTH}`")
+    st.markdown(f"- Tools: `{', '.join(TOOLS) if TOOLS_ENABLED else 'off'}`")
+    st.markdown(f"- Worked examples from similar chains: `{'on' if RETRIEVAL else 'off'}`")
+    if COT_API_URL:
+        st.markdown(f"- Reasoning API: `{COT_API_URL}`")
+
+    # Checkpointed chains run in-process; the reasoning API service keeps its own chains
+    resumable = CHECKPOINT_CHAINS and not COT_API_URL
+    chain_id, saved = checkpointed_chain() if resumable else (None, None)
 
     # Text input for user query
-    user_query = st.text_input("Enter your query:", placeholder="e.g., How many 'R's are in the word strawberry?")
+    user_query = st.text_input("Enter your query:", value=saved["prompt"] if saved else "", placeholder="e.g., How many 'R's are in the word strawberry?")
+    mode = st.radio("Reasoning", ["Single chain", f"Self-consistency ({CONSISTENCY_SAMPLES} chains)", f"Tree search ({TREE_BRANCHES} branches, beam {TREE_BEAM})",
+                                  "Decomposition"],
+                    horizontal=True, help="Self-consistency runs several chains at once and answers with their majority; "
+                                          "tree search rates several candidate steps at each level and follows the best; "
+                                          "decomposition splits the query into sub-questions and solves them concurrently")
 
     if user_query:
         st.write("Generating response...")
@@ -175,22 +99,43 @@ def main():
         response_container = st.empty()
         time_container = st.empty()
 
+        if mode.startswith("Self-consistency"):
+            chain = generate_response(user_query, samples=CONSISTENCY_SAMPLES)
+        elif mode.startswith("Tree search"):
+            chain = generate_response(user_query, search="tree")
+        elif mode == "Decomposition":
+            chain = generate_response(user_query, search="decompose")
+        elif resumable:
+            if saved is None or saved["prompt"] != user_query:
+                chain_id = uuid.uuid4().hex
+                st.query_params["chain"] = chain_id
+            elif saved["status"] != "done":
+                st.info(f"Resuming after step {len(saved['steps'])}")
+            chain = reasoning.resume_chain(chain_id, user_query)
+        else:
+            chain = generate_response(user_query)
+
         # Generate and display the response
-        for steps, total_thinking_time in generate_response(user_query):
+        steps = []
+        for steps, total_thinking_time in chain:
             with response_container.container():
-                for i, (title, content, thinking_time, raw_content) in enumerate(steps):
+                for i, (title, content, thinking_time, raw_content, metrics) in enumerate(steps):
                     if title.startswith("Final Answer"):
                         st.markdown(f"### {title}")
                         st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
                     else:
                         with st.expander(title, expanded=True):
                             st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+                            if metrics.get("branch_steps"):
+                                st.markdown("**Branch steps:**\n" + "\n".join(f"- {step['title']}" for step in metrics["branch_steps"]))
                             st.markdown("**Raw Output:**")
                             st.code(raw_content, language="json")
 
+                            if metrics.get("tool"):
+                                st.markdown(f"*Tool result sent: '{describe_call(metrics['tool'])}'*")
+
                             # Check if a follow-up was sent
-                            # follow_up = check_for_follow_up(raw_content, json.loads(raw_content))
-                            parsed_data = parse_json_safely(raw_content)
+                            parsed_data, _ = parse_json(raw_content)
                             follow_up = check_for_follow_up(raw_content, parsed_data)
                             if follow_up:
                                 if follow_up.startswith("continue"):
@@ -198,44 +143,19 @@ def main():
                                 else:
                                     st.markdown(f"*Follow-up prompt sent: '{follow_up}'*")
 
-                    st.markdown(f"*Thinking time: {thinking_time:.2f} seconds*")
+                    if metrics.get("consistency"):
+                        show_vote(metrics["consistency"])
+                    show_errors(metrics)
+                    summary = describe_metrics(metrics)
+                    st.markdown(f"*Thinking time: {thinking_time:.2f} seconds*" + (f" · *{summary}*" if summary else ""))
 
             # Only show total time when it's available at the end
             if total_thinking_time is not None:
                 time_container.markdown(f"**Total thinking time: {total_thinking_time:.2f} seconds**")
 
-SYSTEM_PROMPT = """You are an expert AI assistant with advanced reasoning capabilities. Your task is to provide detailed, step-by-step explanations of your thought process. For each step:
-
-1. Provide a clear, concise title describing the current reasoning phase.
-2. Elaborate on your thought process in the content section.
-3. Decide whether to continue reasoning or provide a final answer.
-
-Response Format:
-Use JSON with keys: 'title', 'content', 'next_action' (values: 'continue' or 'final_answer')
-
-Key Instructions:
-- Employ at least 5 distinct reasoning steps such as Edge Case Consideration, Precision Consideration, Alternative Hypothesis or Approach Evaluation and Elimination, etc.
-- Acknowledge your limitations as an AI and explicitly state what you can and cannot do.
-- Actively explore and evaluate alternative answers or approaches.
-- Critically assess your own reasoning; identify potential flaws or biases.
-- When re-examining, employ a fundamentally different approach or perspective.
-- Utilize at least 4 diverse methods to derive or verify your answer.
-- Incorporate relevant domain knowledge and best practices in your reasoning.
-- Quantify certainty levels for each step and the final conclusion when applicable.
-- Consider potential edge cases or exceptions to your reasoning.
-- Provide clear justifications for eliminating alternative hypotheses.
-
-"""
-important_message=""" 
-IMPORTANT: Respond STRICTLY with a single, well-formatted JSON object for each step. Do not include any text outside the JSON object. Think STEP by STEP. 
-
-Response Format:
-Use JSON with keys: 'title', 'content', 'next_action' (values: 'continue' or 'final_answer')
-
-Example of a valid JSON response:
-{"title": "Initial Problem Analysis", "content": "To approach this problem effectively, I'll first break down the given information into key components. This involves identifying...[detailed explanation]... By structuring the problem this way, we can systematically address each aspect.", "next_action": "continue"}
-
-"""
+        # The checkpoint stops before the first failed step; a rerun continues from there
+        if resumable and any(reasoning.is_failed(step) for step in steps):
+            st.button("Resume from the last completed step")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
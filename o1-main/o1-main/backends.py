@@ -0,0 +1,267 @@
+import os
+import abc
+import json
+import time
+import asyncio
+from contextlib import aclosing
+import aiohttp
+from dotenv import load_dotenv
+from metrics import REQUEST_LATENCY, TIME_TO_FIRST_TOKEN, TOKENS_GENERATED
+import tracing
+import cassette
+import ollama_client
+
+# Load environment variables
+load_dotenv()
+
+# What a backend can do beyond plain chat; the engine asks, the backend decides
+JSON_MODE = "json_mode"
+STREAM = "stream"
+EMBED = "embed"
+
+class BackendError(Exception):
+    pass
+
+class BackendHTTPError(BackendError):
+    def __init__(self, backend, status, text):
+        super().__init__(f"{status} error from {backend}: {text}")
+        self.status = status
+        self.text = text
+
+class Backend(abc.ABC):
+    # Interface of a chat backend. chat returns (content, metrics) with the metric keys of
+    # ollama_client (network, ttft, eval_count, tokens_per_second, ...) where the provider reports them;
+    # attempt is the caller's retry number, kept on the request's http span.
+    name = None
+    capabilities = frozenset()
+
+    def __init__(self, default_model, embed_model=None):
+        self.default_model = default_model
+        self.embed_model = embed_model
+
+    def supports(self, capability):
+        return capability in self.capabilities
+
+    def http_error(self, status, text):
+        return BackendHTTPError(self.name, status, text)
+
+    async def post_lines(self, session, path, payload, headers=None):
+        # The non-empty lines of a POST's (streamed) body; pass a shared aiohttp session so requests reuse its
+        # connection pool. Every request of every backend goes through here, so CASSETTE_MODE=record saves
+        # the exchange and CASSETTE_MODE=replay answers it from disk.
+        start = time.perf_counter()
+        request = {"backend": self.name, "path": path, "payload": payload}
+        if cassette.CASSETTE_MODE == "replay":
+            take = cassette.next_take(request)
+            await asyncio.sleep(cassette.replay_delay(take.get("headers_after", 0), start))
+            if take["status"] >= 400:
+                raise self.http_error(take["status"], take.get("text", ""))
+            async for line in cassette.areplay_lines(take, start):
+                yield line
+            return
+
+        own_session = session is None
+        if own_session:
+            session = aiohttp.ClientSession()
+        take = None
+        try:
+            async with session.post(f"{self.base_url}{path}", json=payload, headers=headers) as response:
+                if cassette.CASSETTE_MODE == "record":
+                    take = cassette.new_take(response.status, start)
+                if response.status >= 400:
+                    text = await response.text()
+                    if take is not None:
+                        take["text"] = text
+                    raise self.http_error(response.status, text)
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if take is not None:
+                        cassette.add_line(take, line, start)
+                    yield line
+        except aiohttp.ClientPayloadError as e:
+            if take is not None:
+                take["error"] = str(e)
+            raise
+        finally:
+            if take is not None:
+                await cassette.asave_take(request, take)
+            if own_session:
+                await session.close()
+
+    async def post_json(self, session, path, payload, headers=None):
+        async with aclosing(self.post_lines(session, path, payload, headers)) as lines:
+            return json.loads(b"\n".join([line async for line in lines]))
+
+    @abc.abstractmethod
+    async def chat(self, messages, model=None, max_tokens=300, temperature=0.2, json_mode=False, session=None, on_token=None, seed=None, attempt=None):
+        pass
+
+    async def stream(self, messages, model=None, max_tokens=300, temperature=0.2, json_mode=False, session=None):
+        # Content pieces as they arrive, built on chat's on_token callback
+        pieces = asyncio.Queue()
+        request = asyncio.create_task(self.chat(messages, model, max_tokens, temperature, json_mode, session, pieces.put_nowait))
+        request.add_done_callback(lambda _: pieces.put_nowait(None))
+        try:
+            while (piece := await pieces.get()) is not None:
+                yield piece
+            await request
+        finally:
+            request.cancel()
+
+    async def embed(self, texts, model=None, session=None):
+        raise BackendError(f"{self.name} has no embeddings endpoint")
+
+class OllamaBackend(Backend):
+    name = "ollama"
+    # Ollama's format=json is left off; the engine's JSON repair handles its replies as before
+    capabilities = frozenset({STREAM, EMBED})
+
+    def __init__(self, url, default_model, embed_model=None):
+        super().__init__(default_model, embed_model)
+        self.base_url = url.rstrip("/")
+
+    def http_error(self, status, text):
+        return ollama_client.OllamaHTTPError(status, text)
+
+    async def chat(self, messages, model=None, max_tokens=300, temperature=0.2, json_mode=False, session=None, on_token=None, seed=None, attempt=None):
+        # Streams the reply so time-to-first-token is measured on the client; one span per HTTP attempt,
+        # so retries show up separately in a trace
+        model = model or self.default_model
+        with tracing.span("http", backend=self.name, model=model, max_tokens=max_tokens, attempt=attempt) as http_span:
+            stream = ollama_client.ChatStream(on_token)
+            async with aclosing(self.post_lines(session, "/api/chat", ollama_client.chat_payload(messages, model, max_tokens, temperature, seed))) as lines:
+                # Read on to the end of the body after the done message, so the connection goes back to the pool
+                async for line in lines:
+                    stream.feed(line)
+            content, metrics = stream.result(model)
+            ollama_client.record_http_span(http_span, metrics)
+            return content, metrics
+
+    async def embed(self, texts, model=None, session=None):
+        # One /api/embed request for a batch of texts; returns one vector per text
+        model = model or self.embed_model
+        with tracing.span("http.embed", backend=self.name, model=model, texts=len(texts)):
+            return (await self.post_json(session, "/api/embed", ollama_client.embed_payload(texts, model)))["embeddings"]
+
+class OpenAICompatibleBackend(Backend):
+    # /chat/completions with SSE streaming: OpenAI, Groq and Perplexity
+
+    def __init__(self, name, base_url, api_key, default_model, capabilities, embed_model=None, strict_roles=False, stream_usage=False):
+        super().__init__(default_model, embed_model)
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.capabilities = frozenset(capabilities)
+        # Perplexity rejects empty messages and consecutive messages of the same role
+        self.strict_roles = strict_roles
+        # OpenAI only reports usage on a stream when asked to
+        self.stream_usage = stream_usage
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def prepare_messages(self, messages):
+        if not self.strict_roles:
+            return messages
+        merged = []
+        for message in messages:
+            if not message["content"]:
+                continue
+            if merged and merged[-1]["role"] == message["role"]:
+                merged[-1] = {"role": message["role"], "content": merged[-1]["content"] + "\n\n" + message["content"]}
+            else:
+                merged.append(dict(message))
+        return merged
+
+    async def chat(self, messages, model=None, max_tokens=300, temperature=0.2, json_mode=False, session=None, on_token=None, seed=None, attempt=None):
+        model = model or self.default_model
+        payload = {
+            "model": model,
+            "messages": self.prepare_messages(messages),
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+        if json_mode and self.supports(JSON_MODE):
+            payload["response_format"] = {"type": "json_object"}
+        if self.stream_usage:
+            payload["stream_options"] = {"include_usage": True}
+        if seed is not None:
+            payload["seed"] = seed
+
+        with tracing.span("http", backend=self.name, model=model, max_tokens=max_tokens, attempt=attempt) as http_span:
+            start = time.perf_counter()
+            first_token_at = None
+            chunks, usage = [], None
+            async with aclosing(self.post_lines(session, "/chat/completions", payload, self.headers())) as lines:
+                async for line in lines:
+                    line = line.decode()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    # Read on to the end of the body, so the connection goes back to the pool
+                    if data == "[DONE]":
+                        continue
+                    chunk = json.loads(data)
+                    # Groq reports usage under x_groq on the last chunk
+                    usage = chunk.get("usage") or chunk.get("x_groq", {}).get("usage") or usage
+                    for choice in chunk.get("choices", []):
+                        content = choice.get("delta", {}).get("content")
+                        if content:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            chunks.append(content)
+                            if on_token:
+                                on_token(content)
+            end = time.perf_counter()
+
+            metrics = {"network": end - start, "ttft": (first_token_at or end) - start,
+                       "eval_count": None, "prompt_eval_count": None, "load_duration": None}
+            if usage:
+                metrics["eval_count"] = usage.get("completion_tokens")
+                metrics["prompt_eval_count"] = usage.get("prompt_tokens")
+                # Client-side rate: generated tokens over the time after the first one
+                if metrics["eval_count"] and first_token_at and end > first_token_at:
+                    metrics["tokens_per_second"] = metrics["eval_count"] / (end - first_token_at)
+            REQUEST_LATENCY.observe(metrics["network"], backend=self.name, model=model)
+            TIME_TO_FIRST_TOKEN.observe(metrics["ttft"], backend=self.name, model=model)
+            TOKENS_GENERATED.inc(metrics["eval_count"] or 0, backend=self.name, model=model)
+            ollama_client.record_http_span(http_span, metrics)
+            return "".join(chunks), metrics
+
+    async def embed(self, texts, model=None, session=None):
+        if not self.supports(EMBED):
+            return await super().embed(texts, model, session)
+        model = model or self.embed_model
+        with tracing.span("http.embed", backend=self.name, model=model, texts=len(texts)):
+            body = await self.post_json(session, "/embeddings", {"model": model, "input": texts}, self.headers())
+        return [item["embedding"] for item in sorted(body["data"], key=lambda item: item["index"])]
+
+def create_backend(name):
+    # Configuration is read when a backend is first used, so callers such as the benchmarks can set it first
+    if name == "ollama":
+        return OllamaBackend(os.getenv('OLLAMA_URL', 'http://localhost:11434'), os.getenv('OLLAMA_MODEL', 'llama3.2'),
+                             os.getenv('OLLAMA_EMBED_MODEL', 'nomic-embed-text'))
+    if name == "groq":
+        # Same variables as the groq SDK
+        return OpenAICompatibleBackend("groq", f"{os.getenv('GROQ_BASE_URL', 'https://api.groq.com')}/openai/v1", os.getenv('GROQ_API_KEY'),
+                                       os.getenv('GROQ_MODEL', 'llama-3.1-70b-versatile'), {JSON_MODE, STREAM})
+    if name == "openai":
+        return OpenAICompatibleBackend("openai", os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1'), os.getenv('OPENAI_API_KEY'),
+                                       os.getenv('OPENAI_MODEL', 'gpt-4o'), {JSON_MODE, STREAM, EMBED},
+                                       embed_model=os.getenv('OPENAI_EMBED_MODEL', 'text-embedding-3-small'), stream_usage=True)
+    if name == "perplexity":
+        return OpenAICompatibleBackend("perplexity", os.getenv('PERPLEXITY_URL', 'https://api.perplexity.ai'), os.getenv('PERPLEXITY_API_KEY'),
+                                       os.getenv('PERPLEXITY_MODEL', 'llama-3.1-sonar-small-128k-online'), {STREAM}, strict_roles=True)
+    raise BackendError(f"Unknown backend {name!r}; expected one of {', '.join(BACKEND_NAMES)}")
+
+BACKEND_NAMES = ("ollama", "groq", "openai", "perplexity")
+_backends = {}
+
+def get_backend(name):
+    backend = _backends.get(name)
+    if backend is None:
+        backend = _backends[name] = create_backend(name)
+    return backend
@@ -0,0 +1,107 @@
+import io
+import os
+import sys
+import json
+import logging
+import argparse
+import importlib
+import contextlib
+from datetime import datetime, timezone
+
+from mock_ollama import MockConfig, start_server
+from bench.workloads import BACKENDS, CONCURRENCY_LEVELS, mock_environment
+
+def format_value(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+def print_results(results):
+    print(f"\n{'backend':<11} {'conc':>4} {'chains':>6} {'chains/min':>10} {'step p50':>9} {'step p95':>9} {'step p99':>9} "
+          f"{'chain p50':>9} {'chain p95':>9} {'chain p99':>9} {'ttft p95':>9} {'tok/s p50':>9} {'parse fail':>10} {'api fail':>9}")
+    for r in results:
+        print(f"{r['backend']:<11} {r['concurrency']:>4} {r['chains']:>6} {format_value(r['chains_per_min'], 1):>10} "
+              f"{format_value(r['step_latency']['p50']):>9} {format_value(r['step_latency']['p95']):>9} {format_value(r['step_latency']['p99']):>9} "
+              f"{format_value(r['chain_latency']['p50']):>9} {format_value(r['chain_latency']['p95']):>9} {format_value(r['chain_latency']['p99']):>9} "
+              f"{format_value(r['ttft']['p95'], 3):>9} {format_value(r['tokens_per_second']['p50'], 1):>9} "
+              f"{format_value(r['parse_failure_rate'] * 100 if r['parse_failure_rate'] is not None else None, 1):>9}% "
+              f"{format_value(r['api_failure_rate'] * 100 if r.get('api_failure_rate') is not None else None, 1):>8}%")
+
+def print_comparison(rows):
+    print(f"\n{'backend':<11} {'conc':>4} {'metric':<24} {'baseline':>10} {'current':>10} {'change':>8}")
+    for backend, concurrency, path, old, new, change, regressed in rows:
+        change_text = "-" if change is None else f"{change:+.1%}"
+        print(f"{backend:<11} {concurrency:>4} {path:<24} {old:>10.3f} {new:>10.3f} {change_text:>8}{'  REGRESSION' if regressed else ''}")
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Latency and throughput benchmark of generate_response per backend")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated subset of " + ",".join(BACKENDS))
+    parser.add_argument("--concurrency", default=",".join(map(str, CONCURRENCY_LEVELS)), help="concurrent sessions per level")
+    parser.add_argument("--chains-per-session", type=int, default=2)
+    parser.add_argument("--live", action="store_true", help="use the backends configured in .env instead of the mock server")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="mock generation rate")
+    parser.add_argument("--ttft", type=float, default=0.05, help="mock time to first token")
+    parser.add_argument("--prompt-rate", type=float, default=2000.0, help="mock prompt evaluation tokens per second")
+    parser.add_argument("--steps", type=int, default=5, help="mock steps per chain")
+    parser.add_argument("--mock-parallel", type=int, default=16, help="mock parallel slots, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock injected error rate")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench-results.json", help="machine-readable results")
+    parser.add_argument("--baseline", help="results file to compare against; exits 1 on a regression")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="relative change allowed before a regression")
+    parser.add_argument("--verbose", action="store_true", help="keep the apps' console output")
+    args = parser.parse_args()
+
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    mock = None
+    if not args.live:
+        mock_config = MockConfig(tokens_per_second=args.tokens_per_second, ttft=args.ttft, prompt_rate=args.prompt_rate,
+                                 steps=args.steps, parallel=args.mock_parallel, max_queue=max(levels) * 2,
+                                 error_rate=args.error_rate, seed=args.seed)
+        mock, url = start_server(config=mock_config)
+        os.environ.update(mock_environment(url))
+        print(f"Mock server on {url}")
+
+    # Streamlit calls outside `streamlit run` only log warnings
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    from bench.runner import compare, run_level
+
+    results = []
+    for backend in backends:
+        module = importlib.import_module(BACKENDS[backend])
+        for concurrency in levels:
+            print(f"{backend}: {concurrency} sessions x {args.chains_per_session} chains", flush=True)
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with output:
+                results.append(run_level(backend, module, concurrency, args.chains_per_session))
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "target": "live" if args.live else "mock",
+        "mock": None if mock is None else {key: value for key, value in vars(mock.config).items() if key != "script"},
+        "chains_per_session": args.chains_per_session,
+        "results": results,
+    }
+    print_results(results)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.tolerance)
+        print_comparison(rows)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} against {args.baseline}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import time
+import logging
+import argparse
+import importlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from mock_ollama import MockConfig, start_server
+from bench.prompts import prompt_variants
+from bench.workloads import mock_environment
+from depth import DEPTH_MODES
+from answers import final_number, hedged
+
+DATASET = os.path.join(os.path.dirname(__file__), "dataset.jsonl")
+
+def load_dataset(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def grade(item, answer):
+    # Lenient on wording: a number answer counts when the one number it commits to (answers.final_number)
+    # is the expected value, or it gives an alias without hedging; a text answer when any alias appears
+    text = answer.lower()
+    aliases = [item["answer"]] + item.get("aliases", [])
+    if item.get("kind") == "number":
+        if any(alias.lower() in text for alias in item.get("aliases", [])) and not hedged(text):
+            return True
+        value = final_number(answer)
+        return value is not None and abs(value - float(item["answer"])) < 1e-6
+    return any(re.search(rf"\b{re.escape(alias.lower())}\b", text) for alias in aliases)
+
+def run_question(module, item, variant, system_prompt, model, max_steps, depth="full"):
+    # A model containing ">" is a route (routing.py), e.g. llama3.2>llama3.1:70b@0.6
+    route = model if ">" in model else None
+    started = time.perf_counter()
+    steps = []
+    for steps, _ in module.generate_response(item["question"], system_prompt=system_prompt, model=None if route else model,
+                                             max_steps=max_steps, route=route, depth=depth):
+        pass
+    wall = time.perf_counter() - started
+    title, answer = steps[-1][0], steps[-1][1]
+    metrics = [step[4] for step in steps]
+    # Classifier tokens are part of what adaptive depth costs
+    chosen = metrics[-1].get("depth", {})
+    route_time = defaultdict(float)
+    for m in metrics:
+        if m.get("route"):
+            route_time[m["route"]] += m.get("network") or 0
+    return {
+        "variant": variant,
+        "model": model,
+        "max_steps": max_steps,
+        "depth": depth,
+        "mode": chosen.get("mode"),
+        "mode_source": chosen.get("source"),
+        "question": item["question"],
+        "expected": item["answer"],
+        "answer": answer,
+        "correct": title == "Final Answer" and grade(item, str(answer)),
+        "steps": len(steps) - 1,
+        "escalated": sum(1 for m in metrics if m.get("escalation")),
+        "escalation_reasons": [m["escalation"]["reason"] for m in metrics if m.get("escalation")],
+        "route_time": dict(route_time),
+        "tool_calls": sum(1 for m in metrics if m.get("tool")),
+        "example_similarity": metrics[-1].get("retrieval", {}).get("similarity"),
+        "tool_time_saved": metrics[-1].get("tools", {}).get("time_saved", 0.0),
+        # Escalated steps also paid for the small model's discarded attempt
+        "generated_tokens": sum((m.get("eval_count") or 0) + (m.get("escalation", {}).get("eval_count") or 0) for m in metrics)
+                            + (chosen.get("eval_count") or 0),
+        "prompt_tokens": sum(m.get("prompt_eval_count") or 0 for m in metrics) + (chosen.get("prompt_eval_count") or 0),
+        "wall_time": wall,
+    }
+
+def rate(values):
+    return sum(values) / len(values) if values else None
+
+def summarise(records):
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record["variant"], record["model"], record["max_steps"], record["depth"])].append(record)
+    rows = []
+    for (variant, model, max_steps, depth), group in groups.items():
+        count = len(group)
+        modes = defaultdict(int)
+        for record in group:
+            modes[record["mode"]] += 1
+        rows.append({
+            "variant": variant,
+            "model": model,
+            "max_steps": max_steps,
+            "depth": depth,
+            "n": count,
+            "accuracy": sum(record["correct"] for record in group) / count,
+            "mean_steps": sum(record["steps"] for record in group) / count,
+            "mean_generated_tokens": sum(record["generated_tokens"] for record in group) / count,
+            "mean_prompt_tokens": sum(record["prompt_tokens"] for record in group) / count,
+            "mean_wall_time": sum(record["wall_time"] for record in group) / count,
+            "escalation_rate": sum(record["escalated"] for record in group) / max(1, sum(record["steps"] for record in group)) if ">" in model else None,
+            # Accuracy of chains with and without an escalated step, for tuning the route's thresholds
+            "accuracy_escalated": rate([record["correct"] for record in group if record["escalated"]]),
+            "accuracy_not_escalated": rate([record["correct"] for record in group if not record["escalated"]]) if ">" in model else None,
+            "modes": dict(modes),
+            "example_rate": sum(record["example_similarity"] is not None for record in group) / count,
+            "mean_tool_calls": sum(record["tool_calls"] for record in group) / count,
+            "mean_tool_time_saved": sum(record["tool_time_saved"] for record in group) / count,
+            "mean_route_time": {route: sum(record["route_time"].get(route, 0) for record in group) / count
+                                for route in sorted({route for record in group for route in record["route_time"]})},
+        })
+    return sorted(rows, key=lambda row: row["mean_wall_time"])
+
+def cheapest(rows, target):
+    # Rows are sorted by mean wall-clock; the first one meeting the bar is the cheapest
+    return next((row for row in rows if row["accuracy"] >= target), None)
+
+def depth_comparisons(rows):
+    # Adaptive depth against full chains of the same configuration: it should save tokens without losing accuracy
+    full = {(row["variant"], row["model"], row["max_steps"]): row for row in rows if row["depth"] == "full"}
+    comparisons = []
+    for row in rows:
+        baseline = full.get((row["variant"], row["model"], row["max_steps"]))
+        if row["depth"] == "full" or baseline is None:
+            continue
+        comparisons.append({
+            "variant": row["variant"],
+            "model": row["model"],
+            "max_steps": row["max_steps"],
+            "depth": row["depth"],
+            "accuracy_change": row["accuracy"] - baseline["accuracy"],
+            "generated_tokens_change": row["mean_generated_tokens"] / baseline["mean_generated_tokens"] - 1 if baseline["mean_generated_tokens"] else None,
+            "wall_time_change": row["mean_wall_time"] / baseline["mean_wall_time"] - 1 if baseline["mean_wall_time"] else None,
+        })
+    return comparisons
+
+def print_report(rows, target):
+    print(f"\n{'variant':<10} {'model':<22} {'max steps':>9} {'depth':>6} {'n':>4} {'accuracy':>8} {'steps':>6} {'gen tok':>8} {'prompt tok':>10} {'wall s':>7} {'escalated':>9} {'tools':>5}")
+    for row in rows:
+        max_steps = row["max_steps"] or "-"
+        escalated = "-" if row["escalation_rate"] is None else f"{row['escalation_rate']:.0%}"
+        print(f"{row['variant']:<10} {row['model'][:22]:<22} {max_steps:>9} {row['depth']:>6} {row['n']:>4} {row['accuracy']:>8.0%} {row['mean_steps']:>6.1f} "
+              f"{row['mean_generated_tokens']:>8.0f} {row['mean_prompt_tokens']:>10.0f} {row['mean_wall_time']:>7.1f} {escalated:>9} {row['mean_tool_calls']:>5.1f}")
+    for comparison in depth_comparisons(rows):
+        tokens = "-" if comparison["generated_tokens_change"] is None else f"{comparison['generated_tokens_change']:+.0%}"
+        verdict = "regression" if comparison["accuracy_change"] < 0 else "no regression"
+        print(f"\n{comparison['depth']} depth vs full ({comparison['variant']} / {comparison['model']} / max steps {comparison['max_steps'] or '-'}): "
+              f"accuracy {comparison['accuracy_change']:+.0%}, generated tokens {tokens}: {verdict}")
+    best = cheapest(rows, target)
+    if best:
+        print(f"\nCheapest configuration with accuracy >= {target:.0%}: {best['variant']} / {best['model']} / max steps {best['max_steps'] or '-'} / {best['depth']} depth")
+    else:
+        print(f"\nNo configuration reached {target:.0%} accuracy")
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.accuracy", description="Accuracy against steps, tokens and wall-clock per prompt variant, model and step budget")
+    parser.add_argument("--dataset", default=DATASET, help="JSONL with question, answer, kind (number|text) and optional aliases")
+    parser.add_argument("--variants", default="min5,min3,no-min,concise", help="comma separated prompt variants (bench/prompts.py)")
+    parser.add_argument("--models", help="comma separated Ollama models or small>large[@min_certainty] routes (default: OLLAMA_MODEL)")
+    parser.add_argument("--max-steps", default="0", help="comma separated step budgets, 0 for no budget")
+    parser.add_argument("--depth", default="full,auto", help="comma separated reasoning depths (depth.py); auto is compared against full")
+    parser.add_argument("--repeats", type=int, default=1, help="runs per question and configuration")
+    parser.add_argument("--workers", type=int, default=4, help="questions evaluated in parallel")
+    parser.add_argument("--target", type=float, default=0.7, help="accuracy bar for picking the cheapest configuration")
+    parser.add_argument("--output", default="accuracy-results.json")
+    parser.add_argument("--mock", action="store_true", help="run against the in-process mock server (smoke test; answers are random)")
+    args = parser.parse_args()
+
+    if args.mock:
+        _, url = start_server(config=MockConfig(tokens_per_second=0, ttft=0, prompt_rate=0, seed=1))
+        os.environ.update(mock_environment(url))
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    app = importlib.import_module("app_ollama")
+    from reasoning import SYSTEM_PROMPT
+
+    variants = prompt_variants(SYSTEM_PROMPT)
+    names = [name.strip() for name in args.variants.split(",") if name.strip()]
+    unknown = set(names) - set(variants)
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(sorted(unknown))}")
+    models = [model.strip() for model in (args.models or app.OLLAMA_MODEL).split(",") if model.strip()]
+    budgets = [int(budget) or None for budget in args.max_steps.split(",")]
+    depths = [depth.strip() for depth in args.depth.split(",") if depth.strip()]
+    unknown = set(depths) - {"auto", *DEPTH_MODES}
+    if unknown:
+        parser.error(f"unknown depths: {', '.join(sorted(unknown))}")
+    dataset = load_dataset(args.dataset)
+
+    jobs = [(item, name, model, budget, depth) for name in names for model in models for budget in budgets for depth in depths
+            for item in dataset for _ in range(args.repeats)]
+    print(f"{len(jobs)} chains: {len(dataset)} questions x {len(names)} variants x {len(models)} models x {len(budgets)} budgets x {len(depths)} depths x {args.repeats} repeats")
+
+    records = []
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="accuracy") as executor:
+        futures = [executor.submit(run_question, app, item, name, variants[name], model, budget, depth) for item, name, model, budget, depth in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            records.append(future.result())
+            print(f"\r{done}/{len(jobs)}", end="", flush=True)
+    print()
+
+    rows = summarise(records)
+    print_report(rows, args.target)
+    with open(args.output, "w") as f:
+        json.dump({"created_at": datetime.now(timezone.utc).isoformat(), "target": args.target,
+                   "summary": rows, "depth_comparisons": depth_comparisons(rows), "records": records}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import sys
+
+from bench.accuracy import DATASET, grade, load_dataset
+
+# Hand-written final answers for every question of bench/dataset.jsonl, keyed by the start of the
+# question: answers that must grade as correct, and wrong or hedged ones that must not.
+# Run with python -m bench.check_grader after changing the grader or the dataset.
+CASES = {
+    "How many 'R's": (
+        ["There are 3 R's in strawberry.", "The word strawberry contains three r's.", "The answer is 3, counting s-t-r-a-w-b-e-r-r-y."],
+        ["There are 2 R's in strawberry.", "2 or maybe 3", "There are either 2 or 3 R's."],
+    ),
+    "How many times does the letter 'e'": (
+        ["The letter 'e' appears 4 times in 'excellence'.", "Answer: 4"],
+        ["It appears 3 times.", "3 or 4 times"],
+    ),
+    "A bat and a ball": (
+        ["The ball costs $0.05.", "The ball costs 5 cents, because the bat then costs $1.05.", "ball = 0.05"],
+        ["The ball costs $0.10.", "The ball costs 5 cents or 10 cents."],
+    ),
+    "If it takes 5 machines": (
+        ["It takes 5 minutes, since each machine makes 1 widget in 5 minutes.", "With 100 machines making 100 widgets, it still takes 5 minutes."],
+        ["It takes 100 minutes.", "It takes 5 or 100 minutes."],
+    ),
+    "In a lake": (
+        ["The lake is half covered on day 47.", "On day 47, since the patch doubles to cover it all on day 48."],
+        ["On day 24.", "Day 24 or maybe 47"],
+    ),
+    "Sally has 3 brothers": (
+        ["Sally has 1 sister.", "Each brother has 2 sisters, Sally and one other, so Sally has one sister."],
+        ["Sally has 2 sisters.", "1 or 2 sisters"],
+    ),
+    "A farmer has 17 sheep": (
+        ["9 sheep are left, because 8 of them died.", "Of the 17 sheep, 9 are left.", "The answer is 9."],
+        ["8 sheep are left.", "17 - 9 = 8", "9 or 8 sheep"],
+    ),
+    "What is 17 multiplied by 24": (
+        ["17 x 24 = 408", "The product is 408."],
+        ["17 x 24 = 418", "408 or 418"],
+    ),
+    "How many days are there in February 2024": (
+        ["February 2024 has 29 days, since 2024 is a leap year.", "There are 29 days."],
+        ["There are 28 days.", "28 or 29 days"],
+    ),
+    "What is the smallest prime": (
+        ["The smallest prime greater than 89 is 97.", "Answer: 97"],
+        ["It is 91.", "91 or 97"],
+    ),
+    "Is 221 a prime": (
+        ["No, 221 is not prime: 221 = 13 x 17.", "221 is composite."],
+        ["Yes, 221 is a prime number."],
+    ),
+    "You are running a race": (
+        ["You are in second place.", "2nd"],
+        ["You are in first place."],
+    ),
+    "Which is heavier": (
+        ["They weigh the same: a kilogram each.", "Neither, both are one kilogram."],
+        ["The steel is heavier."],
+    ),
+    "How many words": (
+        ["The sentence has 9 words.", "There are nine words."],
+        ["The sentence has 8 words.", "8 or 9 words"],
+    ),
+}
+
+def main():
+    failures = []
+    for item in load_dataset(DATASET):
+        prefix = next((prefix for prefix in CASES if item["question"].startswith(prefix)), None)
+        if prefix is None:
+            failures.append(f"no cases for: {item['question']}")
+            continue
+        correct, wrong = CASES[prefix]
+        failures += [f"graded wrong: {answer!r} ({prefix})" for answer in correct if not grade(item, answer)]
+        failures += [f"graded correct: {answer!r} ({prefix})" for answer in wrong if grade(item, answer)]
+    for failure in failures:
+        print(failure)
+    print(f"{len(failures)} grading failures" if failures else "All grader checks passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import sys
+import asyncio
+
+from tools import TOOL_TIMEOUT, run_tool
+
+# Regression checks for the tool sandbox: a call cancelled while it waits for the sandbox must not keep
+# it locked. Run with python -m bench.check_tools after changing tools.py.
+SLOW_EXPRESSION = "factorial(1000)**999"
+
+async def cancelled_waiter():
+    # One slow call holds the sandbox while another waits for it and is cancelled, as when an early-stopped
+    # self-consistency vote or a deleted chain cancels its steps
+    slow = asyncio.create_task(run_tool("calculator", [SLOW_EXPRESSION]))
+    await asyncio.sleep(0.05)
+    waiter = asyncio.create_task(run_tool("calculator", ["2 + 2"]))
+    await asyncio.sleep(0.05)
+    waiter.cancel()
+    await asyncio.gather(slow, waiter, return_exceptions=True)
+    try:
+        call = await asyncio.wait_for(run_tool("calculator", ["4 * 4"]), TOOL_TIMEOUT * 5)
+    except asyncio.TimeoutError:
+        return "the next call hung after a waiter was cancelled"
+    if call.get("result") != "16":
+        return f"unexpected result after a cancelled waiter: {call}"
+    return None
+
+async def cancelled_call():
+    # The call that holds the sandbox is cancelled mid-expression
+    slow = asyncio.create_task(run_tool("calculator", [SLOW_EXPRESSION]))
+    await asyncio.sleep(0.05)
+    slow.cancel()
+    await asyncio.gather(slow, return_exceptions=True)
+    try:
+        call = await asyncio.wait_for(run_tool("calculator", ["4 * 4"]), TOOL_TIMEOUT * 5)
+    except asyncio.TimeoutError:
+        return "the next call hung after a running call was cancelled"
+    if call.get("result") != "16":
+        return f"unexpected result after a cancelled call: {call}"
+    return None
+
+def main():
+    failures = [failure for check in (cancelled_waiter, cancelled_call) if (failure := asyncio.run(check()))]
+    for failure in failures:
+        print(failure)
+    print(f"{len(failures)} tool check failures" if failures else "All tool checks passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import functools
+import importlib
+import threading
+import contextlib
+from types import SimpleNamespace
+from datetime import datetime, timezone
+
+from mock_ollama import MockConfig, start_server
+from bench.runner import percentile, run_chain
+from bench.workloads import BACKENDS, QUERIES, mock_environment
+from reasoning_client import stream_chain
+
+DEFAULT_PROFILE = {
+    "think_time": {"distribution": "exponential", "mean": 5},
+    "queries": [{"query": query, "weight": 1} for query in QUERIES],
+}
+
+def load_profile(path):
+    if not path:
+        return DEFAULT_PROFILE
+    with open(path) as f:
+        profile = json.load(f)
+    return {**DEFAULT_PROFILE, **profile}
+
+def think_time(spec, rng):
+    distribution = spec.get("distribution", "constant")
+    if distribution == "exponential":
+        return rng.expovariate(1 / spec["mean"]) if spec["mean"] else 0.0
+    if distribution == "uniform":
+        return rng.uniform(spec["min"], spec["max"])
+    return spec.get("value", 0.0)
+
+class LoadTest:
+    # Virtual users run chain, think, repeat. Users are added at the start of each ramp stage and keep
+    # running; results are attributed to the stage in which the chain finished, and chains still running
+    # at the end of a stage count in its latency with their age so far.
+
+    def __init__(self, run, profile, stages, stage_duration, seed=None):
+        self.run = run
+        self.profile = profile
+        self.stages = stages
+        self.stage_duration = stage_duration
+        self.seed = seed
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.results = []
+        # User number -> start of the chain it is running
+        self.running = {}
+
+    def user(self, number):
+        rng = random.Random(None if self.seed is None else self.seed + number)
+        queries = self.profile["queries"]
+        weights = [query.get("weight", 1) for query in queries]
+        while not self.stop.is_set():
+            query = rng.choices(queries, weights)[0]["query"]
+            started = time.perf_counter()
+            with self.lock:
+                self.running[number] = started
+            try:
+                record, error = self.run(query), None
+            except Exception as e:
+                record, error = None, str(e)
+            finished = time.perf_counter()
+            with self.lock:
+                del self.running[number]
+                self.results.append({"user": number, "started": started, "finished": finished, "record": record, "error": error})
+            self.stop.wait(think_time(self.profile["think_time"], rng))
+
+    def start_users(self, count, first):
+        for number in range(first, first + count):
+            threading.Thread(target=self.user, args=(number,), name=f"vu-{number}", daemon=True).start()
+
+    def execute(self, on_stage=None):
+        origin = time.perf_counter()
+        windows = []
+        users = 0
+        for index, target in enumerate(self.stages):
+            stage_start = time.perf_counter()
+            if target > users:
+                self.start_users(target - users, users)
+                users = target
+            self.stop.wait(self.stage_duration)
+            with self.lock:
+                windows.append((stage_start, time.perf_counter(), users, list(self.running.values())))
+            if on_stage:
+                on_stage(self.summarise_stage(index, *windows[-1], origin))
+        # In-flight chains are abandoned; the users are daemon threads
+        self.stop.set()
+        return [self.summarise_stage(index, *window, origin) for index, window in enumerate(windows)]
+
+    def summarise_stage(self, index, start, end, users, running, origin):
+        # running: start times of the chains still running at the end of the stage
+        with self.lock:
+            finished = [result for result in self.results if start <= result["finished"] < end]
+        records = [result["record"] for result in finished if result["record"]]
+        failed = [result for result in finished if result["error"] or result["record"]["api_failures"]]
+        queue_waits = [value for record in records for value in record["queue_wait"]]
+        # A chain that hasn't finished has taken at least its age, so a stalled stage shows in its latency
+        latencies = [result["finished"] - result["started"] for result in finished] + [end - started for started in running]
+        duration = end - start
+        return {
+            "stage": index,
+            "users": users,
+            "start": start - origin,
+            "duration": duration,
+            "completed": len(finished),
+            "in_flight_at_end": len(running),
+            "chains_per_min": len(finished) / duration * 60 if duration else 0.0,
+            "chain_latency_p50": percentile(latencies, 50),
+            "chain_latency_p95": percentile(latencies, 95),
+            "queue_wait_p50": percentile(queue_waits, 50),
+            "queue_wait_p95": percentile(queue_waits, 95),
+            "error_rate": len(failed) / len(finished) if finished else None,
+            "errors": sorted({result["error"] for result in finished if result["error"]})[:5],
+        }
+
+def find_saturation(stages, min_gain, latency_factor, max_error_rate, min_completed):
+    # The first stage where more users stop buying throughput, latency blows up or errors climb. A stage
+    # with too few finished chains to judge is skipped, unless every user was still stuck in a chain at its
+    # end after earlier stages did finish chains: then the system has stalled, which is saturation. Before
+    # any chain finished, it only means the stages are shorter than a chain.
+    previous = None
+    baseline_latency = None
+    chains_finished = False
+    for index, stage in enumerate(stages):
+        reasons = []
+        if stage["completed"] < min_completed:
+            stalled = chains_finished and stage["in_flight_at_end"] >= stage["users"]
+            chains_finished = chains_finished or stage["completed"] > 0
+            if stalled:
+                reasons.append(f"stalled: {stage['completed']} chains finished, {stage['in_flight_at_end']} still running")
+            else:
+                continue
+        elif previous is not None:
+            if stage["users"] > previous["users"] and stage["chains_per_min"] < previous["chains_per_min"] * (1 + min_gain):
+                reasons.append(f"throughput grew less than {min_gain:.0%}")
+            if (baseline_latency is not None and stage["chain_latency_p95"] is not None
+                    and stage["chain_latency_p95"] > baseline_latency * latency_factor):
+                reasons.append(f"p95 chain latency above {latency_factor:g}x the first stage")
+        if stage["error_rate"] is not None and stage["error_rate"] > max_error_rate:
+            reasons.append(f"error rate above {max_error_rate:.0%}")
+        if reasons:
+            return {"stage": stage["stage"], "users": stage["users"], "sustainable_users": stages[index - 1]["users"] if index else 0, "reasons": reasons}
+        if previous is None:
+            baseline_latency = stage["chain_latency_p95"]
+        previous = stage
+        chains_finished = True
+    return None
+
+def format_value(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+def print_stage(stage, file=None):
+    error_rate = "-" if stage["error_rate"] is None else f"{stage['error_rate']:.0%}"
+    print(f"{stage['stage']:>5} {stage['users']:>5} {stage['completed']:>9} {stage['in_flight_at_end']:>9} {stage['chains_per_min']:>10.1f} "
+          f"{format_value(stage['chain_latency_p50']):>9} {format_value(stage['chain_latency_p95']):>9} "
+          f"{format_value(stage['queue_wait_p50'], 3):>9} {format_value(stage['queue_wait_p95'], 3):>9} {error_rate:>7}", file=file, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.loadgen", description="Ramp virtual users against the reasoning pipeline and find the saturation point")
+    parser.add_argument("--backend", default="ollama", choices=sorted(BACKENDS))
+    parser.add_argument("--api-url", help="drive a running api_server.py over HTTP instead of calling the engine in-process")
+    parser.add_argument("--profile", help="JSON with think_time {distribution: exponential|uniform|constant, ...} and weighted queries")
+    parser.add_argument("--stages", default="1,2,4,8,16,32", help="virtual users per ramp stage")
+    parser.add_argument("--stage-duration", type=float, default=60.0, help="seconds per stage; several chain lengths long")
+    parser.add_argument("--min-completed", type=int, default=5, help="finished chains a stage needs to be judged")
+    parser.add_argument("--min-gain", type=float, default=0.1, help="throughput gain below which a stage counts as saturated")
+    parser.add_argument("--latency-factor", type=float, default=2.0, help="p95 chain latency growth over the first stage that counts as saturated")
+    parser.add_argument("--max-error-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="loadgen-results.json")
+    parser.add_argument("--mock", action="store_true", help="run against the in-process mock server")
+    parser.add_argument("--mock-parallel", type=int, default=4, help="mock parallel slots, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="mock generation rate")
+    parser.add_argument("--ttft", type=float, default=0.2, help="mock time to first token")
+    parser.add_argument("--prompt-rate", type=float, default=2000.0, help="mock prompt evaluation tokens per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock injected error rate")
+    args = parser.parse_args()
+
+    stages = [int(users) for users in args.stages.split(",")]
+    profile = load_profile(args.profile)
+
+    if args.mock:
+        mock_config = MockConfig(tokens_per_second=args.tokens_per_second, ttft=args.ttft, prompt_rate=args.prompt_rate,
+                                 parallel=args.mock_parallel, max_queue=max(stages) * 2,
+                                 error_rate=args.error_rate, seed=args.seed)
+        _, url = start_server(config=mock_config)
+        os.environ.update(mock_environment(url))
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    if args.api_url:
+        # Same generate_response contract, served over HTTP/SSE
+        module = SimpleNamespace(generate_response=functools.partial(stream_chain, api_url=args.api_url))
+    else:
+        module = importlib.import_module(BACKENDS[args.backend])
+
+    test = LoadTest(lambda query: run_chain(module, query), profile, stages, args.stage_duration, args.seed)
+    print(f"{args.api_url or args.backend}: stages {stages}, {args.stage_duration:g}s each, think time {profile['think_time']}")
+    print(f"{'stage':>5} {'users':>5} {'completed':>9} {'in flight':>9} {'chains/min':>10} {'p50 s':>9} {'p95 s':>9} "
+          f"{'queue p50':>9} {'queue p95':>9} {'errors':>7}")
+    # Keep the apps' console output out of the report
+    console = sys.stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = test.execute(on_stage=lambda stage: print_stage(stage, console))
+
+    saturation = find_saturation(results, args.min_gain, args.latency_factor, args.max_error_rate, args.min_completed)
+    if saturation:
+        print(f"\nSaturated at {saturation['users']} users ({'; '.join(saturation['reasons'])}); "
+              f"sustainable: {saturation['sustainable_users']} users")
+    else:
+        print(f"\nNo saturation up to {stages[-1]} users")
+
+    with open(args.output, "w") as f:
+        json.dump({"created_at": datetime.now(timezone.utc).isoformat(), "backend": args.backend, "api_url": args.api_url, "mock": args.mock,
+                   "profile": profile, "stages": results, "saturation": saturation}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# Variants of reasoning.SYSTEM_PROMPT, to test whether the 5-step minimum earns its latency
+MIN_STEPS_LINE = "- Employ at least 5 distinct reasoning steps such as Edge Case Consideration, Precision Consideration, Alternative Hypothesis or Approach Evaluation and Elimination, etc.\n"
+METHODS_LINE = "- Utilize at least 4 diverse methods to derive or verify your answer.\n"
+
+def prompt_variants(system_prompt):
+    return {
+        "min5": system_prompt,
+        "min3": system_prompt.replace(MIN_STEPS_LINE, MIN_STEPS_LINE.replace("at least 5", "at least 3")),
+        "no-min": system_prompt.replace(MIN_STEPS_LINE, ""),
+        "concise": system_prompt.replace(MIN_STEPS_LINE, "- Use only as many reasoning steps as the problem needs and stop once the answer is verified.\n").replace(METHODS_LINE, ""),
+    }
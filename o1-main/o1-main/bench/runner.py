@@ -0,0 +1,122 @@
+import time
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import RETRIES
+from bench.workloads import QUERIES
+
+# Metric -> direction in which a change is a regression
+HIGHER_IS_WORSE = ("step_latency.p95", "chain_latency.p95", "ttft.p95")
+LOWER_IS_WORSE = ("chains_per_min", "tokens_per_second.p50")
+# Share of steps that failed to parse, and that gave up after the API call's retries
+FAILURE_RATES = ("parse_failure_rate", "api_failure_rate")
+# Absolute increase in a failure rate that counts as a regression
+FAILURE_RATE_SLACK = 0.02
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def distribution(values):
+    return {f"p{q}": percentile(values, q) for q in (50, 95, 99)} | {"n": len(values)}
+
+def run_chain(module, query):
+    started = time.perf_counter()
+    steps, total_time = [], None
+    for steps, total_time in module.generate_response(query):
+        pass
+    record = {"wall": time.perf_counter() - started, "chain": total_time, "steps": [], "ttft": [], "tokens_per_second": [], "queue_wait": [],
+              "parse_failures": 0, "api_failures": 0}
+    for step in steps:
+        record["steps"].append(step[2])
+        metrics = step[4]
+        # A reply that was not a parseable step, and a call that gave up after its retries
+        if metrics.get("parse_error"):
+            record["parse_failures"] += 1
+        if metrics.get("failed"):
+            record["api_failures"] += 1
+        if metrics.get("ttft") is not None:
+            record["ttft"].append(metrics["ttft"])
+        if metrics.get("tokens_per_second"):
+            record["tokens_per_second"].append(metrics["tokens_per_second"])
+        if metrics.get("queue_wait") is not None:
+            record["queue_wait"].append(metrics["queue_wait"])
+    return record
+
+def run_level(backend, module, concurrency, chains_per_session):
+    # concurrency sessions, each running chains_per_session chains back to back
+    queries = itertools.cycle(QUERIES)
+    lock = threading.Lock()
+
+    def next_query():
+        with lock:
+            return next(queries)
+
+    def session(_):
+        return [run_chain(module, next_query()) for _ in range(chains_per_session)]
+
+    retries_before = RETRIES.total(backend=backend)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"bench-{backend}") as executor:
+        records = [record for records in executor.map(session, range(concurrency)) for record in records]
+    wall = time.perf_counter() - started
+    retries = RETRIES.total(backend=backend) - retries_before
+    return summarise(backend, concurrency, records, wall, retries)
+
+def summarise(backend, concurrency, records, wall, retries):
+    steps = [latency for record in records for latency in record["steps"]]
+    parse_failures = sum(record["parse_failures"] for record in records)
+    api_failures = sum(record["api_failures"] for record in records)
+    return {
+        "backend": backend,
+        "concurrency": concurrency,
+        "chains": len(records),
+        "wall_time": wall,
+        "chains_per_min": len(records) / wall * 60 if wall else None,
+        "step_latency": distribution(steps),
+        "chain_latency": distribution([record["wall"] for record in records]),
+        "ttft": distribution([value for record in records for value in record["ttft"]]),
+        "tokens_per_second": distribution([value for record in records for value in record["tokens_per_second"]]),
+        "steps_per_chain": len(steps) / len(records) if records else None,
+        "parse_failure_rate": parse_failures / len(steps) if steps else None,
+        "api_failure_rate": api_failures / len(steps) if steps else None,
+        "retry_rate": retries / len(steps) if steps else None,
+    }
+
+def lookup(result, path):
+    value = result
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+def compare(results, baseline, tolerance):
+    # Returns (rows for the report, regressions) matching results to the baseline by backend and concurrency
+    previous = {(r["backend"], r["concurrency"]): r for r in baseline.get("results", [])}
+    rows, regressions = [], []
+    for result in results:
+        before = previous.get((result["backend"], result["concurrency"]))
+        if before is None:
+            continue
+        for path in HIGHER_IS_WORSE + LOWER_IS_WORSE + FAILURE_RATES:
+            old, new = lookup(before, path), lookup(result, path)
+            if old is None or new is None:
+                continue
+            if path in FAILURE_RATES:
+                regressed = new > old + FAILURE_RATE_SLACK
+            elif path in HIGHER_IS_WORSE:
+                regressed = new > old * (1 + tolerance)
+            else:
+                regressed = new < old * (1 - tolerance)
+            change = (new - old) / old if old else None
+            row = (result["backend"], result["concurrency"], path, old, new, change, regressed)
+            rows.append(row)
+            if regressed:
+                regressions.append(row)
+    return rows, regressions
@@ -0,0 +1,31 @@
+# Fixed queries, so runs are comparable with each other and with a saved baseline
+QUERIES = [
+    "How many 'R's are in the word strawberry?",
+    "Which is larger, 9.11 or 9.9?",
+    "A bat and a ball cost $1.10 in total. The bat costs $1.00 more than the ball. How much does the ball cost?",
+    "If it takes 5 machines 5 minutes to make 5 widgets, how long would it take 100 machines to make 100 widgets?",
+    "How many days are there in a leap year that starts on a Monday, and which weekday does it end on?",
+    "Is 221 a prime number?",
+]
+
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+
+# Backend name -> app module; each exposes generate_response(prompt) yielding (steps, total_time)
+BACKENDS = {
+    "ollama": "app_ollama",
+    "groq": "app_groq",
+    "openai": "app_openai",
+    "perplexity": "app_perplexity",
+}
+
+def mock_environment(url):
+    # Points every backend's client at the mock server; set before the app modules are imported
+    return {
+        "OLLAMA_URL": url,
+        "GROQ_BASE_URL": url,
+        "GROQ_API_KEY": "mock",
+        "OPENAI_BASE_URL": f"{url}/v1",
+        "OPENAI_API_KEY": "mock",
+        "PERPLEXITY_URL": f"{url}/v1",
+        "PERPLEXITY_API_KEY": "mock",
+    }
@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# record: save every backend request (chat, stream and embed) with its reply; replay: serve them from disk
+# instead of calling the backend
+CASSETTE_MODE = os.getenv('CASSETTE_MODE', '').lower()
+CASSETTE_DIR = os.getenv('CASSETTE_DIR', 'cassettes')
+# Replay timing: 1 keeps the recorded timing, 10 replays ten times faster, 0 without any delay
+CASSETTE_SPEED = float(os.getenv('CASSETTE_SPEED', '1'))
+
+_lock = threading.Lock()
+_replay_counts = {}
+_replay_takes = {}
+
+class CassetteMiss(Exception):
+    pass
+
+def request_key(payload):
+    # The URL and API key are left out, so traffic recorded against one server replays against any
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def cassette_path(key, directory=CASSETTE_DIR):
+    return os.path.join(directory, f"{key}.jsonl")
+
+def save_take(payload, take, directory=CASSETTE_DIR):
+    # One JSON line per take after a first line with the request, so recording appends rather than rewrites
+    # the file; identical requests are kept as successive takes and replayed in the same order.
+    # Blocking: call it from a thread (asave_take) when on an event loop.
+    path = cassette_path(request_key(payload), directory)
+    with _lock:
+        os.makedirs(directory, exist_ok=True)
+        new = not os.path.exists(path)
+        with open(path, "a") as f:
+            f.write((json.dumps({"request": payload}) + "\n" if new else "") + json.dumps(take) + "\n")
+
+async def asave_take(payload, take, directory=CASSETTE_DIR):
+    await asyncio.to_thread(save_take, payload, take, directory)
+
+def new_take(status, start):
+    return {
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "status": status,
+        "headers_after": time.perf_counter() - start,
+        "chunks": [],
+    }
+
+def add_line(take, line, start):
+    text = line.decode() if isinstance(line, bytes) else line
+    take["chunks"].append([time.perf_counter() - start, text])
+
+def next_take(payload, directory=CASSETTE_DIR):
+    key = request_key(payload)
+    path = cassette_path(key, directory)
+    with _lock:
+        # Read once per request, not on every replay of it
+        takes = _replay_takes.get(path)
+        if takes is None:
+            if not os.path.exists(path):
+                raise CassetteMiss(f"No recording for this request in {directory} ({key[:12]})")
+            with open(path) as f:
+                takes = _replay_takes[path] = [json.loads(line) for line in f if line.strip()][1:]
+        index = _replay_counts.get(key, 0)
+        _replay_counts[key] = index + 1
+    # Cycle through the takes, so a request repeated more often than it was recorded still replays
+    return takes[index % len(takes)]
+
+def replay_delay(offset, started, speed=CASSETTE_SPEED):
+    # Seconds to wait so that a recorded offset is reached at the replay speed
+    if not speed:
+        return 0.0
+    return max(0.0, offset / speed - (time.perf_counter() - started))
+
+async def areplay_lines(take, started, speed=CASSETTE_SPEED):
+    for offset, line in take["chunks"]:
+        await asyncio.sleep(replay_delay(offset, started, speed))
+        yield line.encode()
+    if take.get("error"):
+        raise ConnectionResetError(f"{take['error']} (replayed)")
@@ -0,0 +1,136 @@
+import os
+import re
+import math
+import time
+import random
+import asyncio
+from collections import defaultdict
+from dotenv import load_dotenv
+from backends import get_backend
+from answers import final_number
+from reasoning import PERSIST_CHAINS, agenerate_response, is_failed, iterate, persist_chain, prepare_chain
+from tracing import current_span, trace_generator
+from metrics import AGREEMENT_RATIO, SAMPLED_CHAINS
+
+# Self-consistency: sample several chains of one query at once and take the majority answer
+
+# Load environment variables
+load_dotenv()
+
+# Chains per query; they run concurrently, so give Ollama as many parallel slots (OLLAMA_NUM_PARALLEL)
+CONSISTENCY_SAMPLES = int(os.getenv('CONSISTENCY_SAMPLES', '5'))
+# Stop as soon as more than this share of the samples agree; the rest are cancelled
+CONSISTENCY_AGREEMENT = float(os.getenv('CONSISTENCY_AGREEMENT', '0.5'))
+# Sample temperatures are spread evenly over this range, so the chains explore different paths
+CONSISTENCY_MIN_TEMPERATURE = float(os.getenv('CONSISTENCY_MIN_TEMPERATURE', '0.4'))
+CONSISTENCY_MAX_TEMPERATURE = float(os.getenv('CONSISTENCY_MAX_TEMPERATURE', '1.0'))
+
+ANSWER_LEAD = re.compile(r"^(?:final answer|the answer is|answer|so|therefore|thus)\W+")
+ARTICLES = re.compile(r"\b(?:a|an|the)\b")
+
+def answer_key(answer):
+    # What two final answers must share to count as the same answer: a leading yes or no, else the number
+    # they commit to (answers.final_number, as the accuracy harness grades it), else their normalized first
+    # sentence; a hedged answer has no number, so it only agrees with answers worded the same way
+    text = str(answer).lower().strip()
+    match = re.match(r"\W*(yes|no)\b", text)
+    if match:
+        return match.group(1)
+    value = final_number(text)
+    if value is not None:
+        return f"{value:g}"
+    sentence = ANSWER_LEAD.sub("", re.split(r"(?<=[.!?])\s", text)[0])
+    return " ".join(ARTICLES.sub(" ", re.sub(r"[^\w\s]", " ", sentence)).split())
+
+def sample_temperatures(samples, low=CONSISTENCY_MIN_TEMPERATURE, high=CONSISTENCY_MAX_TEMPERATURE):
+    if samples == 1:
+        return [low]
+    return [low + (high - low) * index / (samples - 1) for index in range(samples)]
+
+@trace_generator("consistency")
+async def agenerate_consistent(prompt, samples=CONSISTENCY_SAMPLES, agreement=CONSISTENCY_AGREEMENT, session=None, persist=PERSIST_CHAINS, seed=None, **options):
+    # Same contract as reasoning.agenerate_response, but yields once: the steps of a chain that gave the
+    # consensus answer, with the vote in the final step's metrics["consistency"]. options go to every chain.
+    needed = min(samples, math.floor(agreement * samples) + 1)
+    seed = random.randrange(2 ** 31) if seed is None else seed
+    current_span().set(samples=samples, needed=needed, seed=seed)
+    start_time = time.perf_counter()
+    # One depth decision and one worked example for all samples, rather than a classifier call and a
+    # retrieval per sample of the same prompt
+    prepared = await prepare_chain(prompt, session=session, **{name: options[name] for name in ("model", "backend", "route", "depth", "retrieval") if name in options})
+
+    async def sample(temperature, seed):
+        result = None
+        async for result in agenerate_response(prompt, session=session, persist=False, checkpoint=False, temperature=temperature, seed=seed,
+                                               prepared=prepared, **options):
+            pass
+        return result
+
+    runs = [{"temperature": temperature, "seed": seed + index, "status": "running"} for index, temperature in enumerate(sample_temperatures(samples))]
+    tasks = {asyncio.create_task(sample(run["temperature"], run["seed"])): index for index, run in enumerate(runs)}
+    results = {}
+    # Answer key -> indices of the chains that gave it, in the order they finished
+    votes = defaultdict(list)
+    winner = None
+    pending = set(tasks)
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, run = tasks[task], runs[tasks[task]]
+                if task.exception() is not None:
+                    run.update(status="error", error=str(task.exception()) or type(task.exception()).__name__)
+                    continue
+                steps, total_time = results[index] = task.result()
+                run.update(total_time=total_time, steps=len(steps) - 1)
+                if any(is_failed(step) for step in steps):
+                    run["status"] = "failed"
+                    continue
+                key = answer_key(steps[-1][1])
+                run.update(status="done", answer=steps[-1][1], key=key)
+                votes[key].append(index)
+                if winner is None and len(votes[key]) >= needed:
+                    winner = key
+    finally:
+        # Also reached when the caller stops listening, e.g. a cancelled API chain
+        for task in pending:
+            task.cancel()
+            runs[tasks[task]]["status"] = "cancelled"
+        await asyncio.gather(*pending, return_exceptions=True)
+    for run in runs:
+        SAMPLED_CHAINS.inc(status=run["status"])
+
+    if not results:
+        raise RuntimeError(f"All {samples} sampled chains raised: {runs[0].get('error')}")
+    if winner is None and votes:
+        # No early majority: the most common answer, ties going to the one reached first
+        winner = max(votes, key=lambda key: (len(votes[key]), -votes[key][0]))
+    answered = sum(len(indices) for indices in votes.values())
+    # Without any answer the vote is empty, and the steps show why the first chain failed
+    steps, _ = results[votes[winner][0]] if winner is not None else next(iter(results.values()))
+    model = options.get("route") or options.get("model") or get_backend(options.get("backend", "ollama")).default_model
+    summary = {
+        "answer": steps[-1][1] if winner is not None else None,
+        "key": winner,
+        "agreement": len(votes[winner]) / answered if winner is not None else 0.0,
+        # A list, since answer keys such as "0.05" can't be field names
+        "votes": [{"key": key, "count": len(indices)} for key, indices in votes.items()],
+        "answered": answered,
+        "samples": samples,
+        "needed": needed,
+        "early_stop": any(run["status"] == "cancelled" for run in runs),
+        "chains": runs,
+    }
+    AGREEMENT_RATIO.observe(summary["agreement"], model=model)
+    current_span().set(agreement=summary["agreement"], answered=answered)
+    steps[-1][4]["consistency"] = summary
+
+    if persist:
+        await persist_chain(prompt, model, steps, consistency=summary)
+
+    # Wall-clock of the whole vote, since the chains overlap
+    yield steps, time.perf_counter() - start_time
+
+def generate_consistent(prompt, **options):
+    # Sync wrapper, like reasoning.generate_response
+    return iterate(agenerate_consistent(prompt, **options))
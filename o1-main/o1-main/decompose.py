@@ -0,0 +1,241 @@
+import os
+import time
+import asyncio
+from dotenv import load_dotenv
+from backends import get_backend
+from reasoning import PERSIST_CHAINS, agenerate_response, get_session, is_failed, iterate, make_api_call, persist_chain
+from routing import ROUTE, Router
+from tools import TOOLS_ENABLED
+from tracing import current_span, span, trace_generator
+from metrics import CHAIN_LATENCY, DECOMPOSE_SPEEDUP, SUBQUESTIONS
+
+# Map-reduce decomposition: one call splits the query into sub-questions, each is solved by its own short
+# chain as soon as the sub-questions it depends on are answered, and one call merges the answers
+
+# Load environment variables
+load_dotenv()
+
+# More sub-questions than this are cut
+DECOMPOSE_MAX_SUBQUESTIONS = int(os.getenv('DECOMPOSE_MAX_SUBQUESTIONS', '6'))
+# Depth of the sub-question chains (depth.py); short keeps each branch to a few steps
+DECOMPOSE_DEPTH = os.getenv('DECOMPOSE_DEPTH', 'short').lower()
+
+# Options of agenerate_decomposed, for callers that pass options through
+DECOMPOSE_OPTIONS = ("model", "max_steps", "backend", "route", "depth", "tools")
+
+def parse_sub_questions(step_data, limit=DECOMPOSE_MAX_SUBQUESTIONS):
+    # Returns (sub_questions, dropped). sub_questions is [{"id", "question", "depends_on"}] ordered so that
+    # every sub-question comes after the ones it depends on, in the model's order where that allows. A
+    # sub-question is dropped, with a reason, rather than run without an input: when it depends on an id
+    # that is no sub-question, is part of a dependency cycle, needs a dropped sub-question or is past the limit.
+    parsed, dropped = [], []
+    for item in step_data.get("sub_questions") or []:
+        if not isinstance(item, dict) or not str(item.get("question", "")).strip():
+            continue
+        question_id = str(item.get("id") or f"q{len(parsed) + 1}")
+        question = str(item["question"]).strip()
+        if any(sub_question["id"] == question_id for sub_question in parsed):
+            dropped.append({"id": question_id, "question": question, "reason": "duplicate id"})
+            continue
+        depends_on = item.get("depends_on") or []
+        if not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        parsed.append({"id": question_id, "question": question, "depends_on": list(dict.fromkeys(str(dependency) for dependency in depends_on))})
+
+    known = {sub_question["id"] for sub_question in parsed}
+    pending, ordered, placed, failed = [], [], set(), {}
+    for sub_question in parsed:
+        unknown = [dependency for dependency in sub_question["depends_on"] if dependency not in known]
+        if unknown:
+            failed[sub_question["id"]] = f"depends on unknown {', '.join(unknown)}"
+        else:
+            pending.append(sub_question)
+    # Take the first pending sub-question whose dependencies are all placed, or that needs a dropped one
+    while pending:
+        for sub_question in pending:
+            missing = next((dependency for dependency in sub_question["depends_on"] if dependency in failed), None)
+            if missing is not None:
+                failed[sub_question["id"]] = f"needs dropped {missing}"
+                break
+            if all(dependency in placed for dependency in sub_question["depends_on"]):
+                ordered.append(sub_question)
+                placed.add(sub_question["id"])
+                break
+        else:
+            # Everything left waits on a cycle; drop the sub-questions on one, the rest then need a dropped one
+            cycle = [sub_question for sub_question in pending if on_cycle(sub_question["id"], pending)]
+            for sub_question in cycle:
+                failed[sub_question["id"]] = "dependency cycle"
+            pending = [sub_question for sub_question in pending if sub_question not in cycle]
+            continue
+        pending.remove(sub_question)
+
+    # Dependencies come first in the order, so cutting its tail leaves no kept sub-question without an input
+    for sub_question in ordered[limit:]:
+        failed[sub_question["id"]] = f"more than {limit} sub-questions"
+    dropped += [{"id": sub_question["id"], "question": sub_question["question"], "reason": failed[sub_question["id"]]}
+                for sub_question in parsed if sub_question["id"] in failed]
+    return ordered[:limit], dropped
+
+def on_cycle(question_id, sub_questions):
+    # Whether question_id can reach itself through the depends_on lists of sub_questions
+    depends_on = {sub_question["id"]: sub_question["depends_on"] for sub_question in sub_questions}
+    seen, stack = set(), list(depends_on[question_id])
+    while stack:
+        dependency = stack.pop()
+        if dependency == question_id:
+            return True
+        if dependency not in seen:
+            seen.add(dependency)
+            stack += depends_on.get(dependency, [])
+    return False
+
+def critical_path(sub_questions):
+    # Sub-questions on the longest dependency chain, i.e. how many rounds the map phase needs at least
+    length = {}
+    for sub_question in sub_questions:
+        length[sub_question["id"]] = 1 + max((length[dependency] for dependency in sub_question["depends_on"]), default=0)
+    return max(length.values(), default=0)
+
+def sub_question_prompt(prompt, sub_question, answers):
+    inputs = "".join(f"- {answers[dependency]['question']} {answers[dependency]['answer']}\n" for dependency in sub_question["depends_on"])
+    return (f"This sub-question is part of a larger problem: {prompt}\n\n"
+            + (f"Results already established:\n{inputs}\n" if inputs else "")
+            + f"Answer only this sub-question: {sub_question['question']}")
+
+def reduce_messages(prompt, sub_questions, answers, dropped=()):
+    results = "\n".join(f"{sub_question['id']}. {sub_question['question']}\n   Answer: {answers[sub_question['id']]['answer']}"
+                        for sub_question in sub_questions)
+    # Dropped sub-questions are listed too, so the merge knows which parts of the plan were never answered
+    results += "".join(f"\n{sub_question['id']}. {sub_question['question']}\n   Not answered: {sub_question['reason']}" for sub_question in dropped)
+    return [
+        {"role": "system", "content": ""},
+        {"role": "user", "content": REDUCE_PROMPT + f"Query: {prompt}\n\nSub-questions and their answers:\n{results}\n\n"
+                                    "Please provide the final answer to the query based on these results. Remember to respond with a single, well-formatted JSON object."}
+    ]
+
+@trace_generator("decompose")
+async def agenerate_decomposed(prompt, model=None, max_steps=None, session=None, persist=PERSIST_CHAINS, backend="ollama", route=ROUTE, depth=DECOMPOSE_DEPTH,
+                               tools=TOOLS_ENABLED):
+    # Same contract as reasoning.agenerate_response. Yields the decomposition, then one step per sub-question
+    # in the order they are answered, then the merged final answer. model, max_steps, route, depth and tools
+    # apply to every sub-question chain; the decomposition and the reduce call use the large model of a route.
+    router = Router.parse(route) if route else None
+    call_model = router.large if router else model or get_backend(backend).default_model
+    session = session or get_session()
+    current_span().set(backend=backend, model=call_model)
+    start_time = time.time()
+
+    with span("step", step="decompose") as step_span:
+        step_data, raw_content, metrics = await make_api_call([
+            {"role": "system", "content": ""},
+            {"role": "user", "content": DECOMPOSE_PROMPT + "Here is the query: " + prompt}
+        ], 600, model=call_model, session=session, backend=backend)
+        sub_questions, dropped = parse_sub_questions(step_data) if not metrics.get("failed") else ([], [])
+        step_span.set(sub_questions=len(sub_questions), dropped=len(dropped))
+
+    if len(sub_questions) < 2:
+        # Nothing to run in parallel: an ordinary chain does the whole query
+        current_span().set(fallback=True)
+        async for item in agenerate_response(prompt, model=model, max_steps=max_steps, session=session, persist=persist, backend=backend, route=route, tools=tools):
+            yield item
+        return
+
+    listing = "\n".join(f"{sub_question['id']}. {sub_question['question']}"
+                        + (f" (needs {', '.join(sub_question['depends_on'])})" if sub_question["depends_on"] else "")
+                        for sub_question in sub_questions)
+    listing += "".join(f"\n{sub_question['id']}. {sub_question['question']} (dropped: {sub_question['reason']})" for sub_question in dropped)
+    metrics["decomposition"] = {"sub_questions": sub_questions, "critical_path": critical_path(sub_questions), "dropped": dropped}
+    steps = [("Step 1: Problem Decomposition", f"{step_data.get('content', '')}\n\n{listing}", time.time() - start_time, raw_content, metrics)]
+    yield steps, None
+
+    map_start = time.time()
+    answers = {}
+    finished = asyncio.Queue()
+
+    async def solve(sub_question, dependencies):
+        # Waits for the answers it builds on, then runs its own chain; every branch is started at once
+        await asyncio.gather(*dependencies, return_exceptions=True)
+        started = time.time()
+        branch_steps, error = [], None
+        try:
+            with span("decompose.branch", sub_question=sub_question["id"]):
+                async for branch_steps, _ in agenerate_response(sub_question_prompt(prompt, sub_question, answers), model=model, max_steps=max_steps,
+                                                                session=session, persist=False, checkpoint=False, backend=backend, route=route, depth=depth,
+                                                                tools=tools):
+                    pass
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        failed = error is not None or not branch_steps or any(is_failed(step) for step in branch_steps)
+        answers[sub_question["id"]] = {"question": sub_question["question"], "answer": "(no answer)" if failed else branch_steps[-1][1]}
+        SUBQUESTIONS.inc(outcome="failed" if failed else "done")
+        # The branch's own steps stay with it, so the step list shows one entry per sub-question
+        metrics = dict(branch_steps[-1][4] if branch_steps else {}, branch={
+            "id": sub_question["id"], "depends_on": sub_question["depends_on"], "waited": started - map_start, "ran": time.time() - started,
+            "steps": max(0, len(branch_steps) - 1), "failed": failed, "error": error})
+        metrics["branch_steps"] = [{"title": title, "content": content} for title, content, *_ in branch_steps]
+        await finished.put((sub_question, branch_steps[-1][3] if branch_steps else error, metrics))
+
+    tasks = {}
+    for sub_question in sub_questions:
+        tasks[sub_question["id"]] = asyncio.create_task(solve(sub_question, [tasks[dependency] for dependency in sub_question["depends_on"]]))
+    try:
+        for _ in sub_questions:
+            sub_question, raw_content, metrics = await finished.get()
+            steps.append((f"Step {len(steps) + 1}: {sub_question['id']}. {sub_question['question']}", answers[sub_question["id"]]["answer"],
+                          metrics["branch"]["ran"], raw_content, metrics))
+            yield steps, None
+    finally:
+        # Also reached when the caller stops listening, e.g. a cancelled API chain
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+    map_time = time.time() - map_start
+
+    final_start = time.time()
+    with span("step", step="final") as step_span:
+        final_data, raw_content, metrics = await make_api_call(reduce_messages(prompt, sub_questions, answers, dropped), 300, is_final_answer=True,
+                                                               model=call_model, session=session, backend=backend)
+        step_span.set(title=final_data['title'], tokens=metrics.get("eval_count"))
+    total_time = time.time() - start_time
+    CHAIN_LATENCY.observe(total_time, backend=backend, model=call_model)
+
+    # Summed branch time over the time the branches took together: the gain from running them concurrently
+    branch_time = sum(step[2] for step in steps[1:])
+    speedup = branch_time / map_time if map_time else 1.0
+    DECOMPOSE_SPEEDUP.observe(speedup, model=call_model)
+    metrics["decomposition"] = {"sub_questions": len(sub_questions), "critical_path": critical_path(sub_questions),
+                                "dropped": [sub_question["id"] for sub_question in dropped],
+                                "branch_time": branch_time, "map_time": map_time, "speedup": speedup}
+    steps.append(("Final Answer", final_data['content'], time.time() - final_start, raw_content, metrics))
+
+    if persist:
+        await persist_chain(prompt, str(router) if router else call_model, steps, decomposition=metrics["decomposition"])
+
+    yield steps, total_time
+
+def generate_decomposed(prompt, **options):
+    # Sync wrapper, like reasoning.generate_response
+    return iterate(agenerate_decomposed(prompt, **options))
+
+DECOMPOSE_PROMPT = """You are an expert AI assistant. Break the query into sub-questions that can each be answered on its own, so that they can be solved in parallel by separate experts.
+
+Key Instructions:
+- Make every sub-question self-contained: restate the numbers, names and conditions it needs from the query.
+- Use as few sub-questions as cover the query, at most """ + str(DECOMPOSE_MAX_SUBQUESTIONS) + """.
+- If a sub-question needs the answer of another, list that one's id in 'depends_on'; it can only depend on sub-questions listed before it.
+- If the query can't be split, return a single sub-question.
+
+Response Format:
+Respond STRICTLY with a single, well-formatted JSON object with keys 'title', 'content' (one sentence on how the parts fit together), 'sub_questions' (a list of objects with keys 'id', 'question' and 'depends_on') and 'next_action' (value: 'continue'). Do not include any text outside the JSON object.
+
+Example of a valid JSON response:
+{"title": "Problem Decomposition", "content": "The total follows from the two prices.", "sub_questions": [{"id": "q1", "question": "What does 3 kg of apples at $2 per kg cost?", "depends_on": []}, {"id": "q2", "question": "What do 2 kg of pears at $3 per kg cost?", "depends_on": []}, {"id": "q3", "question": "What is the sum of the cost of the apples and the cost of the pears?", "depends_on": ["q1", "q2"]}], "next_action": "continue"}
+
+"""
+
+REDUCE_PROMPT = """You are an expert AI assistant. A query was split into sub-questions, which were answered separately. Combine their answers into the answer to the query: check that they are consistent with each other and with the query, and resolve any conflict explicitly.
+
+Respond STRICTLY with a single, well-formatted JSON object with keys 'title', 'content' and 'next_action' (value: 'final_answer'). Do not include any text outside the JSON object.
+
+"""
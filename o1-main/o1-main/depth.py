@@ -0,0 +1,113 @@
+import os
+import re
+import time
+import asyncio
+import aiohttp
+from dotenv import load_dotenv
+from ollama_client import OllamaError
+from backends import BackendError, get_backend
+from metrics import DEPTH_DECISIONS
+from tracing import span
+
+# Load environment variables
+load_dotenv()
+
+# Reasoning depth per chain: auto picks single, short or full per query; any of those forces it
+DEPTH = os.getenv('DEPTH', 'auto').lower()
+# llm asks the chain's (small) model about queries the heuristics can't place; heuristic sends those to full
+DEPTH_CLASSIFIER = os.getenv('DEPTH_CLASSIFIER', 'llm').lower()
+
+# Step limits per mode. single answers in one call without steps; full keeps relying on its
+# prompt, which asks for at least 5 steps, exactly as before.
+DEPTH_MODES = {
+    "single": {"min_steps": 0, "max_steps": 0},
+    "short": {"min_steps": 2, "max_steps": 4},
+    "full": {"min_steps": None, "max_steps": None},
+}
+
+ANSWER_PREFIX = re.compile(r"^\s*(?:what\s+is|what's|calculate|compute|evaluate)\s+", re.IGNORECASE)
+ARITHMETIC = re.compile(r"^[\d\s.,+\-*/x×÷^()%=]*\d\s*[+\-*/x×÷^%]\s*[\d(][\d\s.,+\-*/x×÷^()%=]*$")
+GREETING = re.compile(r"^\s*(?:hi|hello|hey|thanks|thank you|good (?:morning|afternoon|evening))\b[\s!.,]*\w*[\s!.]*$", re.IGNORECASE)
+# Wording that marks puzzles, trick questions, proofs and analysis, where a quick answer is the usual failure
+REASONING_CUES = re.compile(r"\b(?:why|prove|proof|explain|compare|analy[sz]e|design|derive|how many|puzzle|riddle|trick|"
+                            r"strategy|optimi[sz]e|debug|trade-?offs?|pros and cons|step by step|"
+                            r"which is (?:larger|smaller|bigger|greater|heavier|lighter)|if\b.*\bthen)\b", re.IGNORECASE)
+
+def heuristic_depth(prompt):
+    # Mode for queries that are obviously trivial or obviously hard, None for the rest
+    text = prompt.strip()
+    words = len(text.split())
+    expression = ANSWER_PREFIX.sub("", text).rstrip("?. ")
+    if ARITHMETIC.match(expression) and len(re.findall(r"[+\-*/x×÷^%]", expression)) <= 3:
+        return "single"
+    if GREETING.match(text):
+        return "single"
+    if REASONING_CUES.search(text) or "```" in text or words > 40 or text.count("?") > 1:
+        return "full"
+    # Word problems: a few sentences around some numbers
+    if re.search(r"\d", text) and words > 12:
+        return "full"
+    return None
+
+CLASSIFIER_PROMPT = """Classify how much reasoning the query below needs. Reply with exactly one word:
+single - a fact, definition, greeting, conversion or one-step calculation that can be answered directly
+short - needs a few steps of reasoning
+full - a multi-step problem, puzzle, trick question, proof or analysis, or anything where a quick answer is likely to be wrong
+
+Query: """
+
+async def classify_depth(prompt, model=None, session=None, backend="ollama"):
+    # Returns (mode, details); details are kept with the chain so the decision can be audited
+    start_time = time.perf_counter()
+    mode = heuristic_depth(prompt)
+    if mode or DEPTH_CLASSIFIER != "llm":
+        details = {"mode": mode or "full", "source": "heuristic"}
+    else:
+        backend = get_backend(backend)
+        details = {"source": "llm"}
+        try:
+            with span("depth.classify", model=model or backend.default_model):
+                content, metrics = await backend.chat([{"role": "user", "content": CLASSIFIER_PROMPT + prompt}],
+                                                      model, max_tokens=5, temperature=0, session=session)
+            details["eval_count"] = metrics.get("eval_count")
+            details["prompt_eval_count"] = metrics.get("prompt_eval_count")
+            words = re.findall(r"[a-z]+", content.lower())
+            mode = next((word for word in words if word in DEPTH_MODES), None)
+            if mode is None:
+                details["error"] = f"Unexpected reply: {content[:80]}"
+        except (aiohttp.ClientError, asyncio.TimeoutError, OllamaError, BackendError) as e:
+            details["error"] = str(e) or type(e).__name__
+        # When in doubt, reason in full
+        details["mode"] = mode or "full"
+    details["latency"] = time.perf_counter() - start_time
+    DEPTH_DECISIONS.inc(mode=details["mode"], source=details["source"])
+    return details["mode"], details
+
+def check_depth(depth):
+    if depth != "auto" and depth not in DEPTH_MODES:
+        raise ValueError(f"Depth {depth!r} is not one of auto, {', '.join(DEPTH_MODES)}")
+    return depth
+
+SHORT_CHAIN_PROMPT = """You are an expert AI assistant with strong reasoning capabilities. Explain your thought process step by step, briefly. For each step:
+
+1. Provide a clear, concise title describing the current reasoning phase.
+2. Elaborate on your thought process in the content section.
+3. Decide whether to continue reasoning or provide a final answer.
+
+Response Format:
+Use JSON with keys: 'title', 'content', 'next_action' (values: 'continue' or 'final_answer')
+
+Key Instructions:
+- Use 2 to 3 reasoning steps: work out the answer, then verify it with a different method.
+- Quantify your certainty in the final step.
+
+"""
+
+SINGLE_SHOT_PROMPT = """You are an expert AI assistant. The query below is simple, so give the final answer directly, without intermediate steps.
+
+Respond STRICTLY with a single, well-formatted JSON object with keys 'title', 'content' and 'next_action' (value: 'final_answer'). Do not include any text outside the JSON object.
+
+Example of a valid JSON response:
+{"title": "Final Answer", "content": "2 + 2 = 4.", "next_action": "final_answer"}
+
+"""
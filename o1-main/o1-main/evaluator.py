@@ -0,0 +1,79 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+from swarm import Swarm, Agent
+from metrics import QUEUE_DEPTH
+from tracing import bind, span
+
+# Load environment variables
+load_dotenv()
+
+# Evaluation queue configuration
+EVAL_BATCH_SIZE = int(os.getenv('EVAL_BATCH_SIZE', '4'))
+EVAL_BATCH_WAIT = float(os.getenv('EVAL_BATCH_WAIT', '0.5'))
+EVAL_WORKERS = int(os.getenv('EVAL_WORKERS', '4'))
+
+EVALUATION_INSTRUCTIONS = "You are an expert evaluator. Your task is to evaluate the step-by-step reasoning response towards the questions and provide an evaluation rating system from 0 to 1."
+
+class EvaluationQueue:
+    # Runs the swarm evaluation agent off the response path. submit() returns a Future right away;
+    # a dispatcher thread groups jobs from every session into batches and sends each batch at once,
+    # so concurrent evaluations share the Ollama server's parallel slots.
+
+    def __init__(self, client, model, batch_size=EVAL_BATCH_SIZE, batch_wait=EVAL_BATCH_WAIT, workers=EVAL_WORKERS):
+        self.swarm = Swarm(client=client)
+        self.agent = Agent(
+            name="Evaluation Agent",
+            instructions=EVALUATION_INSTRUCTIONS,
+            model=model
+        )
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.jobs = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="evaluation")
+        self.dispatcher = threading.Thread(target=self._dispatch, name="evaluation-dispatcher", daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, messages):
+        future = Future()
+        # The job runs in the submitter's trace context, so it shows up under its chain
+        self.jobs.put((list(messages), future, bind(self._evaluate)))
+        QUEUE_DEPTH.set(self.jobs.qsize(), queue="evaluation")
+        return future
+
+    def depth(self):
+        return self.jobs.qsize()
+
+    def _next_batch(self):
+        batch = [self.jobs.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._next_batch()
+            QUEUE_DEPTH.set(self.jobs.qsize(), queue="evaluation")
+            running = [self.executor.submit(evaluate, messages, future) for messages, future, evaluate in batch]
+            # One batch in flight at a time keeps the evaluation load on Ollama bounded
+            wait(running)
+
+    def _evaluate(self, messages, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            with span("evaluation", agent=self.agent.name, model=self.agent.model):
+                response = self.swarm.run(agent=self.agent, messages=messages)
+            future.set_result(response.messages[-1]["content"])
+        except Exception as e:
+            future.set_exception(e)
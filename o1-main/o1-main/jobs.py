@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, AsyncMongoClient, ReturnDocument
+from rater import MONGO_URL, DB_NAME
+
+# Load environment variables
+load_dotenv()
+
+# Durable queue of reasoning chains, run by worker.py
+JOBS_COLLECTION_NAME = "jobs"
+# A running job whose lease is not renewed within this time is handed to another worker
+JOB_LEASE = float(os.getenv('JOB_LEASE', '60'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Delay before a failed job is retried, doubled on each attempt
+JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', '5'))
+
+# Options a job may pass through to reasoning.agenerate_response
+JOB_OPTIONS = ("system_prompt", "model", "max_steps", "backend", "route", "depth", "tools", "retrieval")
+
+def now():
+    return datetime.now(timezone.utc)
+
+def get_jobs_collection(client):
+    return client[DB_NAME][JOBS_COLLECTION_NAME]
+
+async def ensure_indexes(collection):
+    await collection.create_index([("status", ASCENDING), ("available_at", ASCENDING)])
+    await collection.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+    await collection.create_index("chain_id", unique=True)
+
+async def enqueue(collection, prompt, max_attempts=JOB_MAX_ATTEMPTS, **options):
+    # The chain id is fixed at submission, so every attempt of a job shares one trace id
+    created_at = now()
+    result = await collection.insert_one({
+        "status": "queued",
+        "prompt": prompt,
+        "options": {key: options[key] for key in JOB_OPTIONS if options.get(key) is not None},
+        "chain_id": uuid.uuid4().hex,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "errors": [],
+        "created_at": created_at,
+        "available_at": created_at,
+    })
+    return result.inserted_id
+
+async def claim(collection, worker_id, lease=JOB_LEASE):
+    # Atomic, so any number of workers can poll the same collection without running a job twice.
+    # A running job with an expired lease belongs to a worker that died and is claimed again.
+    claimed_at = now()
+    return await collection.find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued", "available_at": {"$lte": claimed_at}},
+                {"status": "running", "lease_expires_at": {"$lt": claimed_at}},
+            ],
+            "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+        },
+        {
+            "$set": {"status": "running", "worker": worker_id, "started_at": claimed_at,
+                     "lease_expires_at": claimed_at + timedelta(seconds=lease)},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("available_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def renew(collection, job_id, worker_id, lease=JOB_LEASE):
+    # False once the lease was lost, i.e. another worker may already run the job
+    result = await collection.update_one(
+        {"_id": job_id, "status": "running", "worker": worker_id},
+        {"$set": {"lease_expires_at": now() + timedelta(seconds=lease)}}
+    )
+    return result.modified_count == 1
+
+async def complete(collection, job_id, worker_id, result_id, total_time):
+    result = await collection.update_one(
+        {"_id": job_id, "status": "running", "worker": worker_id},
+        {"$set": {"status": "done", "result_id": result_id, "total_time": total_time, "finished_at": now()},
+         "$unset": {"lease_expires_at": ""}}
+    )
+    return result.modified_count == 1
+
+async def fail(collection, job, worker_id, error, retry_delay=JOB_RETRY_DELAY):
+    # Retried with exponential backoff until max_attempts, then failed for good
+    entry = {"attempt": job["attempts"], "worker": worker_id, "error": error, "at": now()}
+    if job["attempts"] < job["max_attempts"]:
+        update = {"status": "queued", "available_at": now() + timedelta(seconds=retry_delay * 2 ** (job["attempts"] - 1))}
+    else:
+        update = {"status": "failed", "finished_at": now()}
+    await collection.update_one(
+        {"_id": job["_id"], "status": "running", "worker": worker_id},
+        {"$set": update, "$unset": {"lease_expires_at": ""}, "$push": {"errors": entry}}
+    )
+
+async def release(collection, job, worker_id):
+    # A worker shutting down hands its job back without spending an attempt
+    await collection.update_one(
+        {"_id": job["_id"], "status": "running", "worker": worker_id},
+        {"$set": {"status": "queued", "available_at": now()}, "$unset": {"lease_expires_at": ""}, "$inc": {"attempts": -1}}
+    )
+
+async def fail_abandoned(collection):
+    # Jobs whose workers died on every attempt can't be claimed again
+    result = await collection.update_many(
+        {"status": "running", "lease_expires_at": {"$lt": now()}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+        {"$set": {"status": "failed", "finished_at": now()}, "$unset": {"lease_expires_at": ""},
+         "$push": {"errors": {"error": "lease expired on the last attempt", "at": now()}}}
+    )
+    return result.modified_count
+
+async def counts(collection):
+    cursor = await collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+    return {doc["_id"]: doc["count"] async for doc in cursor}
+
+async def main():
+    parser = argparse.ArgumentParser(prog="python jobs.py", description="Submit reasoning chains to the job queue and check on them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit = commands.add_parser("submit", help="queue prompts given as arguments, or one per line on stdin")
+    submit.add_argument("prompts", nargs="*")
+    submit.add_argument("--backend", help="ollama (default), groq, openai or perplexity")
+    submit.add_argument("--model")
+    submit.add_argument("--route", help="small>large[@min_certainty] model route instead of --model")
+    submit.add_argument("--depth", help="auto, single, short or full (default: DEPTH)")
+    submit.add_argument("--tools", action="store_true", default=None, help="let steps call local tools (default: TOOLS)")
+    submit.add_argument("--retrieval", action="store_true", default=None, help="show the model a similar stored chain as a worked example (default: RETRIEVAL)")
+    submit.add_argument("--max-steps", type=int)
+    submit.add_argument("--max-attempts", type=int, default=JOB_MAX_ATTEMPTS)
+    status = commands.add_parser("status", help="show one job, or the number of jobs per status")
+    status.add_argument("job_id", nargs="?")
+    args = parser.parse_args()
+
+    client = AsyncMongoClient(MONGO_URL)
+    collection = get_jobs_collection(client)
+    try:
+        if args.command == "submit":
+            await ensure_indexes(collection)
+            prompts = args.prompts or [line.strip() for line in sys.stdin if line.strip()]
+            for prompt in prompts:
+                print(await enqueue(collection, prompt, args.max_attempts, backend=args.backend, model=args.model, route=args.route, depth=args.depth, tools=args.tools,
+                                    retrieval=args.retrieval, max_steps=args.max_steps))
+        elif args.job_id:
+            job = await collection.find_one({"_id": ObjectId(args.job_id)})
+            print(json.dumps(job, indent=2, default=str) if job else f"No job {args.job_id}")
+        else:
+            print(json.dumps(await counts(collection), indent=2))
+    finally:
+        await client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
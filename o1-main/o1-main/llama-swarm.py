@@ -1,12 +1,15 @@
 # from dotenv import load_dotenv
 from openai import OpenAI
 from swarm import Swarm, Agent
-import json, sys
+import json, sys, os
+from tracing import span, trace_openai_client
 
-ollama_client = OpenAI(
-    base_url="http://localhost:11434/v1",
+OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+
+ollama_client = trace_openai_client(OpenAI(
+    base_url=f"{OLLAMA_URL}/v1",
     api_key='ollama'
-)
+))
 
 model = 'llama3.2'
 modelA = 'qwen2.5-coder:7b'
@@ -57,7 +60,28 @@ messages = [{"role":"user","content":"hello! Tell me your biggest 5 traits!"}]
 
 # print(response.messages[-1]["content"])
 
+# Handoffs whose first completion hasn't run yet
+pending_handoffs = []
+
+def trace_handoffs(client):
+    # The handoff span covers the first completion after an agent switch, since that completion pays any
+    # model swap; its completion span shows up inside it
+    completions = client.chat.completions
+    create = completions.create
+
+    def create_after_handoff(*args, **kwargs):
+        if not pending_handoffs:
+            return create(*args, **kwargs)
+        with span("handoff", **pending_handoffs.pop(0)):
+            return create(*args, **kwargs)
+
+    completions.create = create_after_handoff
+    return client
+
+trace_handoffs(ollama_client)
+
 def Next():
+    pending_handoffs.append({"agent": agentA.name, "to_agent": agentB.name, "model": agentB.model})
     return agentB
 
 agentA = Agent(
@@ -75,9 +99,11 @@ agentB = Agent(
     tool_choice="auto"
 )
 
-response = client.run(
-    agent = agentA,
-    messages = [{"role":"user","content":"Plan me a honeymoon trip"}]
-)
+with span("swarm.run", agent=agentA.name) as run_span:
+    response = client.run(
+        agent = agentA,
+        messages = [{"role":"user","content":"Plan me a honeymoon trip"}]
+    )
+    run_span.set(final_agent=response.agent.name if response.agent else None)
 
 print(response.messages[-1]["content"])
\ No newline at end of file
@@ -0,0 +1,215 @@
+import os
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Exporter configuration; both are off unless set
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_FILE_INTERVAL = float(os.getenv('METRICS_FILE_INTERVAL', '15'))
+
+# Seconds; covers sub-millisecond parses up to multi-minute chains
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self, **labels):
+        # Sum over every series matching the given labels
+        wanted = {self.labelnames.index(name): str(value) for name, value in labels.items()}
+        with self.lock:
+            return sum(value for key, value in self.values.items() if all(key[i] == v for i, v in wanted.items()))
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        return [f"{self.name}{format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Counter):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self.lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self.values.items()}
+        lines = []
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, cls, name, documentation, labelnames=(), **kwargs):
+        # Get-or-create, so modules re-executed by Streamlit reruns share one metric
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Metrics shared by the apps, labelled by backend and model
+CHAIN_LATENCY = REGISTRY.histogram("cot_chain_latency_seconds", "Wall-clock time of a whole reasoning chain.", ["backend", "model"])
+STEP_LATENCY = REGISTRY.histogram("cot_step_latency_seconds", "Wall-clock time of one reasoning step including retries.", ["backend", "model"])
+REQUEST_LATENCY = REGISTRY.histogram("cot_request_latency_seconds", "Time of one backend HTTP request.", ["backend", "model"])
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram("cot_time_to_first_token_seconds", "Client-side time to the first streamed token.", ["backend", "model"])
+RETRIES = REGISTRY.counter("cot_retries_total", "Backend calls that failed and were retried or given up.", ["backend", "model"])
+PARSE_FAILURES = REGISTRY.counter("cot_parse_failures_total", "Responses without a parseable JSON step.", ["backend", "model"])
+CACHE_HITS = REGISTRY.counter("cot_cache_hits_total", "Lookups served from a cache.", ["backend", "model", "cache"])
+TOKENS_GENERATED = REGISTRY.counter("cot_tokens_generated_total", "Tokens generated by the backend.", ["backend", "model"])
+QUEUE_DEPTH = REGISTRY.gauge("cot_queue_depth", "Jobs waiting in an in-process queue.", ["queue"])
+DB_WRITE_LATENCY = REGISTRY.histogram("cot_db_write_latency_seconds", "Time of one MongoDB write.", ["collection"])
+ROUTE_LATENCY = REGISTRY.histogram("cot_route_latency_seconds", "Time of one routed step, including an escalated re-run.", ["route", "model"])
+ESCALATIONS = REGISTRY.counter("cot_escalations_total", "Steps re-run on the large model of a route.", ["reason", "model"])
+DEPTH_DECISIONS = REGISTRY.counter("cot_depth_mode_total", "Chains per reasoning depth, and whether heuristics or the model picked it.", ["mode", "source"])
+AGREEMENT_RATIO = REGISTRY.histogram("cot_consistency_agreement_ratio", "Share of answered self-consistency chains that agree with the consensus.",
+                                     ["model"], buckets=(0.2, 0.4, 0.5, 0.6, 0.8, 1))
+SAMPLED_CHAINS = REGISTRY.counter("cot_consistency_chains_total", "Sampled self-consistency chains, by how they ended.", ["status"])
+TREE_CANDIDATES = REGISTRY.counter("cot_tree_candidates_total", "Candidate steps of tree search, by whether they were kept, pruned, finished or failed.", ["outcome"])
+SUBQUESTIONS = REGISTRY.counter("cot_subquestions_total", "Sub-questions of decomposed queries, by whether their chain answered them.", ["outcome"])
+DECOMPOSE_SPEEDUP = REGISTRY.histogram("cot_decompose_speedup_ratio", "Summed sub-question chain time over the wall-clock of solving them concurrently.",
+                                       ["model"], buckets=(1, 1.5, 2, 3, 4, 6, 8))
+TOOL_CALLS = REGISTRY.counter("cot_tool_calls_total", "Tool calls made by reasoning steps, by whether the tool returned a result.", ["tool", "outcome"])
+TOOL_LATENCY = REGISTRY.histogram("cot_tool_latency_seconds", "Time of one local tool call.", ["tool"],
+                                  buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1, 1))
+RETRIEVAL_LATENCY = REGISTRY.histogram("cot_retrieval_latency_seconds", "Time to find a worked example for a query, including its embedding.", ["model"],
+                                      buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+RETRIEVALS = REGISTRY.counter("cot_retrievals_total", "Worked-example lookups, by whether a similar chain was found.", ["outcome"])
+TOOL_TIME_SAVED = REGISTRY.counter("cot_tool_time_saved_seconds_total", "Estimated reasoning time saved by computing results with tools instead of steps.", ["model"])
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the app's console
+
+def start_http_server(port, host="0.0.0.0"):
+    server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+def write_file(path):
+    # Write then rename, so a node_exporter textfile collector never reads a partial file
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        f.write(REGISTRY.render())
+    os.replace(temporary, path)
+
+def start_file_exporter(path, interval=METRICS_FILE_INTERVAL):
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_file(path)
+            except OSError as e:
+                print(f"Failed to write metrics to {path}: {str(e)}")
+
+    threading.Thread(target=run, name="metrics-file", daemon=True).start()
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+def start_exporters():
+    # Safe to call on every Streamlit rerun; exporters start once per process
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    if METRICS_PORT:
+        try:
+            start_http_server(METRICS_PORT)
+        except OSError as e:
+            print(f"Metrics endpoint not started on port {METRICS_PORT}: {str(e)}")
+    if METRICS_FILE:
+        start_file_exporter(METRICS_FILE)
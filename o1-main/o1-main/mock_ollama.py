@@ -0,0 +1,437 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stand-in for Ollama (/api/chat, /api/embeddings) and OpenAI-compatible backends (/v1/chat/completions)
+# with scripted or generated step JSON, configurable timing, error injection and concurrency limits.
+
+WORDS = (
+    "consider the problem carefully each letter count verify approach alternative edge case "
+    "precision assumption evidence method result check again different perspective therefore "
+    "conclude certainty high moderate step reasoning analysis word total answer confirms"
+).split()
+
+STEP_TITLES = [
+    "Problem Decomposition", "Initial Analysis", "Edge Case Consideration", "Precision Consideration",
+    "Alternative Approach Evaluation", "Verification by Counting", "Cross-check with a Different Method",
+    "Certainty Assessment",
+]
+
+ERROR_KINDS = ("500", "429", "malformed", "truncate")
+
+class MockConfig:
+    def __init__(self, tokens_per_second=50.0, ttft=0.2, prompt_rate=500.0, load_time=0.0, steps=5,
+                 content_words=40, error_rate=0.0, error_kinds=ERROR_KINDS, parallel=4, max_queue=64,
+                 script=None, seed=None, embedding_dim=64):
+        self.tokens_per_second = tokens_per_second
+        self.ttft = ttft
+        self.prompt_rate = prompt_rate
+        self.load_time = load_time
+        self.steps = steps
+        self.content_words = content_words
+        self.error_rate = error_rate
+        self.error_kinds = tuple(error_kinds)
+        self.parallel = parallel
+        self.max_queue = max_queue
+        self.script = script or []
+        self.seed = seed
+        self.embedding_dim = embedding_dim
+
+def load_script(path):
+    # One response per line: a JSON object {"content": "..."} or a raw string
+    responses = []
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+                responses.append(item["content"] if isinstance(item, dict) else str(item))
+            except json.JSONDecodeError:
+                responses.append(line)
+    return responses
+
+def estimate_tokens(text):
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+def tokenize(text):
+    # Roughly one token per word or punctuation mark, keeping the whitespace
+    return re.findall(r"\s*\w+|\s*[^\w\s]|\s+", text)
+
+class Responder:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.script_index = 0
+
+    def words(self, count):
+        with self.lock:
+            return " ".join(self.random.choice(WORDS) for _ in range(count))
+
+    def rating(self):
+        with self.lock:
+            return f"{self.random.uniform(0.4, 0.95):.2f}"
+
+    def reply(self, messages):
+        if self.config.script:
+            with self.lock:
+                content = self.config.script[self.script_index % len(self.config.script)]
+                self.script_index += 1
+            return content
+
+        system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+        last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+
+        if "expert critic" in last_user or "expert critic" in system:
+            criteria = ["Logical", "Accuracy"] if "Step to rate" in last_user else [
+                "Logical", "Clarity", "Depth", "Relevance", "Coherence", "Accuracy", "Usefulness"]
+            lines = [json.dumps({"title": c, "comment": self.words(12), "rating": self.rating()}) for c in criteria]
+            return "\n".join(lines) + "\n\n**Recap**: " + self.words(20)
+        if "expert evaluator" in system:
+            return f"Evaluation: {self.words(30)}\n\nRating: {self.rating()}"
+
+        if "Break the query into sub-questions" in last_user:
+            # Two independent sub-questions and one that needs both
+            return json.dumps({"title": "Problem Decomposition", "content": self.words(12), "next_action": "continue", "sub_questions": [
+                {"id": "q1", "question": self.words(8) + "?", "depends_on": []},
+                {"id": "q2", "question": self.words(8) + "?", "depends_on": []},
+                {"id": "q3", "question": self.words(8) + "?", "depends_on": ["q1", "q2"]},
+            ]})
+        if "Classify how much reasoning" in last_user:
+            with self.lock:
+                return self.random.choice(["single", "short", "full"])
+        if "Please provide the final answer" in last_user or "give the final answer directly" in last_user:
+            return json.dumps({"title": "Final Answer", "content": self.words(self.config.content_words), "next_action": "final_answer"})
+
+        done_steps = 0
+        for message in messages:
+            if message.get("role") == "assistant" and '"next_action"' in (message.get("content") or ""):
+                done_steps += 1
+        next_action = "continue" if done_steps + 1 < self.config.steps else "final_answer"
+        step = {
+            "title": STEP_TITLES[done_steps % len(STEP_TITLES)],
+            "content": self.words(self.config.content_words),
+            "next_action": next_action
+        }
+        first_user = next((m.get("content") or "" for m in messages if m.get("role") == "user"), "")
+        if done_steps == 0 and "'tool_args'" in first_user:
+            # Chains offered tools count letters in their first step
+            step.update(tool="count", tool_args=["strawberry", "r"])
+        return json.dumps(step)
+
+    def pick_error(self):
+        with self.lock:
+            if self.config.error_rate and self.random.random() < self.config.error_rate:
+                return self.random.choice(self.config.error_kinds)
+        return None
+
+def malform(content):
+    # Drop the braces, the way a model "forgets" the JSON wrapper
+    return content.replace("{", "").replace("}", "")
+
+def embedding(text, dim):
+    # Deterministic unit vector from the text's hashed words, so similar texts are similar
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode()).digest()
+        vector[digest[0] % dim] += 1.0 if digest[1] % 2 else -1.0
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.responder = Responder(config)
+        self.slots = threading.BoundedSemaphore(config.parallel)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.loaded_models = set()
+        self.stats = {"requests": 0, "errors": 0, "rejected": 0}
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/":
+            data = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif self.path == "/api/tags":
+            models = sorted(self.server.loaded_models) or ["mock"]
+            self.send_json(200, {"models": [{"name": name, "model": name} for name in models]})
+        elif self.path == "/stats":
+            self.send_json(200, self.server.stats)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": "invalid JSON body"})
+            return
+
+        path = self.path.split("?")[0]
+        if path in ("/api/embeddings", "/api/embed"):
+            self.handle_embeddings(path, request)
+            return
+        if path == "/api/chat":
+            handler = self.handle_ollama_chat
+        elif path.endswith("/chat/completions"):
+            # /v1 (OpenAI, Perplexity) and /openai/v1 (Groq SDK)
+            handler = self.handle_openai_chat
+        else:
+            self.send_json(404, {"error": f"unknown endpoint {path}"})
+            return
+
+        server = self.server
+        with server.lock:
+            server.stats["requests"] += 1
+            if server.waiting >= server.config.max_queue:
+                server.stats["rejected"] += 1
+                rejected = True
+            else:
+                server.waiting += 1
+                rejected = False
+        if rejected:
+            # What Ollama answers when OLLAMA_MAX_QUEUE is exceeded
+            self.send_json(503, {"error": "server busy, please try again.  maximum pending requests exceeded"})
+            return
+
+        # Like OLLAMA_NUM_PARALLEL: requests beyond the slots wait here, which is real queueing delay
+        server.slots.acquire()
+        with server.lock:
+            server.waiting -= 1
+        try:
+            handler(request)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            server.slots.release()
+
+    def handle_embeddings(self, path, request):
+        dim = self.server.config.embedding_dim
+        if path == "/api/embed":
+            inputs = request.get("input") or ""
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.send_json(200, {"model": request.get("model"), "embeddings": [embedding(text, dim) for text in inputs]})
+        else:
+            self.send_json(200, {"embedding": embedding(request.get("prompt") or "", dim)})
+
+    def prepare(self, request, max_tokens):
+        # Returns (tokens, error kind, prompt tokens, load seconds, prompt seconds) for one completion
+        server = self.server
+        config = server.config
+        messages = request.get("messages") or []
+        error = server.responder.pick_error()
+        if error:
+            with server.lock:
+                server.stats["errors"] += 1
+
+        content = server.responder.reply(messages)
+        if error == "malformed":
+            content = malform(content)
+        tokens = tokenize(content)
+        if max_tokens:
+            tokens = tokens[:max_tokens]
+
+        prompt_tokens = estimate_tokens(" ".join(m.get("content") or "" for m in messages))
+        model = request.get("model") or "mock"
+        with server.lock:
+            load_time = 0.0 if model in server.loaded_models else config.load_time
+            server.loaded_models.add(model)
+        prompt_time = prompt_tokens / config.prompt_rate if config.prompt_rate else 0.0
+        return tokens, error, prompt_tokens, load_time, prompt_time
+
+    def token_delay(self):
+        rate = self.server.config.tokens_per_second
+        return 1.0 / rate if rate else 0.0
+
+    def handle_ollama_chat(self, request):
+        options = request.get("options") or {}
+        tokens, error, prompt_tokens, load_time, prompt_time = self.prepare(request, options.get("num_predict"))
+        if error in ("500", "429"):
+            self.send_json(int(error), {"error": f"injected {error} error"})
+            return
+
+        model = request.get("model") or "mock"
+        started = time.perf_counter()
+        # Time to first token is at least the configured TTFT, and at least load + prompt evaluation
+        time.sleep(max(self.server.config.ttft, load_time + prompt_time))
+        first_token = time.perf_counter()
+
+        def final_fields(done_reason):
+            now = time.perf_counter()
+            return {
+                "done": True,
+                "done_reason": done_reason,
+                "total_duration": int((now - started) * 1e9),
+                "load_duration": int(load_time * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_time * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int((now - first_token) * 1e9),
+            }
+
+        done_reason = "length" if options.get("num_predict") and len(tokens) >= options["num_predict"] else "stop"
+        created_at = datetime.now(timezone.utc).isoformat()
+        if request.get("stream", True):
+            self.start_chunked("application/x-ndjson")
+            cut = len(tokens) // 2 if error == "truncate" else None
+            for index, token in enumerate(tokens):
+                if index == cut:
+                    # Drop the connection mid-stream without the terminating chunk
+                    self.close_connection = True
+                    return
+                chunk = {"model": model, "created_at": created_at, "message": {"role": "assistant", "content": token}, "done": False}
+                self.write_chunk((json.dumps(chunk) + "\n").encode())
+                time.sleep(self.token_delay())
+            final = {"model": model, "created_at": created_at, "message": {"role": "assistant", "content": ""}, **final_fields(done_reason)}
+            self.write_chunk((json.dumps(final) + "\n").encode())
+            self.end_chunked()
+        else:
+            time.sleep(self.token_delay() * len(tokens))
+            body = {"model": model, "created_at": created_at, "message": {"role": "assistant", "content": "".join(tokens)}, **final_fields(done_reason)}
+            data = json.dumps(body).encode()
+            if error == "truncate":
+                data = data[:len(data) // 2]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    def handle_openai_chat(self, request):
+        tokens, error, prompt_tokens, load_time, prompt_time = self.prepare(request, request.get("max_tokens"))
+        if error in ("500", "429"):
+            self.send_json(int(error), {"error": {"message": f"injected {error} error", "type": "server_error", "code": error}})
+            return
+
+        model = request.get("model") or "mock"
+        completion_id = f"chatcmpl-{random.getrandbits(48):x}"
+        created = int(time.time())
+        finish_reason = "length" if request.get("max_tokens") and len(tokens) >= request["max_tokens"] else "stop"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+        time.sleep(max(self.server.config.ttft, load_time + prompt_time))
+
+        if request.get("stream"):
+            self.start_chunked("text/event-stream")
+            cut = len(tokens) // 2 if error == "truncate" else None
+            for index, token in enumerate(tokens):
+                if index == cut:
+                    self.close_connection = True
+                    return
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                time.sleep(self.token_delay())
+            last = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}], "usage": usage}
+            self.write_chunk(f"data: {json.dumps(last)}\n\n".encode())
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.end_chunked()
+        else:
+            time.sleep(self.token_delay() * len(tokens))
+            body = {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+            data = json.dumps(body).encode()
+            if error == "truncate":
+                data = data[:len(data) // 2]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+def start_server(host="127.0.0.1", port=0, config=None):
+    # In-process server on a background thread, e.g. for benchmarks; returns (server, base url)
+    server = MockServer((host, port), config or MockConfig())
+    threading.Thread(target=server.serve_forever, name="mock-ollama", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama / OpenAI-compatible server for deterministic performance tests")
+    parser.add_argument("--host", default=os.getenv("MOCK_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_PORT", "11435")))
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="generation rate (0 = instant)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="minimum time to first token in seconds")
+    parser.add_argument("--prompt-rate", type=float, default=500.0, help="prompt evaluation tokens per second")
+    parser.add_argument("--load-time", type=float, default=0.0, help="extra delay on the first request per model")
+    parser.add_argument("--steps", type=int, default=5, help="reasoning steps before next_action is final_answer")
+    parser.add_argument("--content-words", type=int, default=40, help="words per generated step")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of completions that fail")
+    parser.add_argument("--error-kinds", default=",".join(ERROR_KINDS), help="comma separated subset of " + ",".join(ERROR_KINDS))
+    parser.add_argument("--parallel", type=int, default=4, help="concurrent completions, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--max-queue", type=int, default=64, help="waiting requests before answering 503, like OLLAMA_MAX_QUEUE")
+    parser.add_argument("--script", help="JSONL file of responses to replay in order instead of generated steps")
+    parser.add_argument("--seed", type=int, help="random seed for reproducible content and errors")
+    parser.add_argument("--embedding-dim", type=int, default=64)
+    args = parser.parse_args()
+
+    error_kinds = [kind.strip() for kind in args.error_kinds.split(",") if kind.strip()]
+    unknown = set(error_kinds) - set(ERROR_KINDS)
+    if unknown:
+        parser.error(f"unknown error kinds: {', '.join(sorted(unknown))}")
+
+    config = MockConfig(
+        tokens_per_second=args.tokens_per_second, ttft=args.ttft, prompt_rate=args.prompt_rate,
+        load_time=args.load_time, steps=args.steps, content_words=args.content_words,
+        error_rate=args.error_rate, error_kinds=error_kinds, parallel=args.parallel,
+        max_queue=args.max_queue, script=load_script(args.script) if args.script else None,
+        seed=args.seed, embedding_dim=args.embedding_dim,
+    )
+    server = MockServer((args.host, args.port), config)
+    print(f"Mock Ollama listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
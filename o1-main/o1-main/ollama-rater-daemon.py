@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import requests
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+from metrics import QUEUE_DEPTH, DB_WRITE_LATENCY, start_exporters
+
+from rater import (
+    DB_NAME,
+    COLLECTION_NAME,
+    OllamaSaturated,
+    get_mongo_client,
+    get_database,
+    rate_steps,
+    store_feedback,
+)
+
+# Daemon configuration
+RATER_CONCURRENCY = int(os.getenv('RATER_CONCURRENCY', '2'))
+RATER_POLL_INTERVAL = float(os.getenv('RATER_POLL_INTERVAL', '2'))
+RATER_MAX_BACKOFF = float(os.getenv('RATER_MAX_BACKOFF', '60'))
+# Claims older than this are assumed to belong to a daemon that died mid-rating
+RATER_STALE_AFTER = float(os.getenv('RATER_STALE_AFTER', '900'))
+
+# Error code a standalone mongod returns for $changeStream
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+class Backpressure:
+    # Bounds the number of in-flight ratings and pauses every worker while Ollama is saturated.
+    # The intake loop blocks on acquire(), so new inserts wait in Mongo instead of piling up here.
+
+    def __init__(self, max_in_flight, max_backoff):
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.delay = 0
+        self.resume_at = 0
+
+    def acquire(self):
+        self.slots.acquire()
+        self.wait()
+
+    def release(self):
+        self.slots.release()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                remaining = self.resume_at - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def saturated(self):
+        with self.lock:
+            self.delay = min(self.max_backoff, self.delay * 2 if self.delay else 1)
+            self.resume_at = time.monotonic() + self.delay
+            return self.delay
+
+    def recovered(self):
+        with self.lock:
+            self.delay = 0
+
+def pending_ids(collection):
+    cursor = collection.find({"rating_status": {"$exists": False}}, {"_id": 1}).sort('_id', 1)
+    return [doc["_id"] for doc in cursor]
+
+def release_stale_claims(collection):
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=RATER_STALE_AFTER)
+    result = collection.update_many(
+        {"rating_status": "rating", "rating_started_at": {"$lt": cutoff}},
+        {"$unset": {"rating_status": "", "rating_started_at": ""}}
+    )
+    if result.modified_count:
+        print(f"Released {result.modified_count} stale rating claims.")
+
+def claim(collection, doc_id):
+    # Atomic, so several daemons can tail the same collection without rating a chain twice
+    return collection.find_one_and_update(
+        {"_id": doc_id, "rating_status": {"$exists": False}},
+        {"$set": {"rating_status": "rating", "rating_started_at": datetime.now(timezone.utc)}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def rate_document(db, session, backpressure, steps_data):
+    collection = db[COLLECTION_NAME]
+    try:
+        while True:
+            backpressure.wait()
+            try:
+                start_time = time.time()
+                feedback, usage = rate_steps(steps_data, session)
+                break
+            except (OllamaSaturated, requests.exceptions.Timeout) as e:
+                delay = backpressure.saturated()
+                print(f"Ollama saturated ({e}), backing off {delay:.0f}s")
+        backpressure.recovered()
+
+        persist_start = time.perf_counter()
+        result = store_feedback(db, steps_data, feedback, usage)
+        DB_WRITE_LATENCY.observe(time.perf_counter() - persist_start, collection="feedback")
+        collection.update_one(
+            {"_id": steps_data["_id"]},
+            {"$set": {"rating_status": "done", "feedback_id": result.inserted_id}}
+        )
+        print(f"Rated {steps_data['_id']} in {time.time() - start_time:.2f} seconds "
+              f"(transcript tokens {usage['tokens_before']} -> {usage['tokens_after']})")
+    except Exception as e:
+        collection.update_one(
+            {"_id": steps_data["_id"]},
+            {"$set": {"rating_status": "failed", "rating_error": str(e)}}
+        )
+        print(f"Failed to rate {steps_data['_id']}: {str(e)}")
+        traceback.print_exc()
+
+def make_handler(db, session, executor, backpressure):
+    collection = db[COLLECTION_NAME]
+
+    def handle(doc_id):
+        backpressure.acquire()
+        steps_data = claim(collection, doc_id)
+        if steps_data is None:
+            # Already rated, or claimed by another daemon
+            backpressure.release()
+            return
+        QUEUE_DEPTH.inc(queue="rating")
+        future = executor.submit(rate_document, db, session, backpressure, steps_data)
+        future.add_done_callback(lambda f: done())
+
+    def done():
+        QUEUE_DEPTH.dec(queue="rating")
+        backpressure.release()
+
+    return handle
+
+def watch_inserts(collection, handle):
+    pipeline = [{"$match": {"operationType": "insert"}}]
+    with collection.watch(pipeline) as stream:
+        # Open the stream first, then catch up, so nothing inserted in between is missed
+        for doc_id in pending_ids(collection):
+            handle(doc_id)
+        print("Watching for new steps (change stream).")
+        for change in stream:
+            handle(change["documentKey"]["_id"])
+
+def poll_inserts(collection, handle):
+    print(f"Polling for new steps every {RATER_POLL_INTERVAL}s.")
+    while True:
+        for doc_id in pending_ids(collection):
+            handle(doc_id)
+        time.sleep(RATER_POLL_INTERVAL)
+
+def main():
+    start_exporters()
+    client = get_mongo_client()
+    db = get_database(client, DB_NAME)
+    collection = db[COLLECTION_NAME]
+    release_stale_claims(collection)
+
+    # One keep-alive HTTP session shared by all workers
+    session = requests.Session()
+    backpressure = Backpressure(RATER_CONCURRENCY, RATER_MAX_BACKOFF)
+    executor = ThreadPoolExecutor(max_workers=RATER_CONCURRENCY)
+    handle = make_handler(db, session, executor, backpressure)
+
+    try:
+        try:
+            watch_inserts(collection, handle)
+        except OperationFailure as e:
+            if e.code != CHANGE_STREAM_UNSUPPORTED:
+                raise
+            # Change streams need a replica set; fall back for a standalone mongod
+            poll_inserts(collection, handle)
+    except KeyboardInterrupt:
+        print("Stopping, waiting for in-flight ratings...")
+    finally:
+        executor.shutdown(wait=True)
+        client.close()
+
+if __name__ == "__main__":
+    main()
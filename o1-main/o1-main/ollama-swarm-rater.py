@@ -1,15 +1,19 @@
 import streamlit as st
 import json
 import time
-import requests
 from dotenv import load_dotenv
 import os
-import re
-import traceback
+from datetime import datetime, timezone
 import subprocess
 from pymongo import MongoClient
-from swarm import Swarm, Agent
 from openai import OpenAI
+from evaluator import EvaluationQueue
+from transcript import compact_messages
+import reasoning
+from reasoning import parse_json
+from ollama_client import describe_metrics
+from tracing import current_trace_id, span, trace_generator, trace_openai_client
+from metrics import CHAIN_LATENCY, STEP_LATENCY, DB_WRITE_LATENCY, start_exporters
 
 # Load environment variables
 load_dotenv()
@@ -19,10 +23,18 @@ OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2')
 AGENT_A_MODEL = os.getenv('LLM_MODEL', 'qwen2.5:coder-7b')
 
-ollama_client = OpenAI(
-    base_url='http://localhost:11434/v1',
+# Prometheus endpoint / textfile export (METRICS_PORT, METRICS_FILE)
+start_exporters()
+
+ollama_client = trace_openai_client(OpenAI(
+    base_url=f'{OLLAMA_URL}/v1',
     api_key='ollama'
-)
+))
+
+@st.cache_resource
+def get_evaluation_queue():
+    # Shared by every session of this Streamlit process, so evaluations batch across users
+    return EvaluationQueue(ollama_client, AGENT_A_MODEL)
 
 def get_mongo_client():
     client = MongoClient("mongodb://localhost:27017/")  # Replace with your MongoDB connection string
@@ -38,72 +50,20 @@ def check_for_follow_up(raw_content, step_data):
         return 'continue' + important_message
     return None
 
-def extract_json_objects(text):
-    # This regex pattern matches JSON-like structures without using recursive patterns
-    json_pattern = re.compile(r'\{(?:[^{}]|\{[^{}]*\})*\}')
-    return json_pattern.findall(text)
-
-def clean_json_string(json_string):
-    # Remove any text before the first '{'
-    json_string = re.sub(r'^[^{]*', '', json_string)
-
-    # Remove any text after the last '}'
-    json_string = re.sub(r'[^}]*$', '', json_string)
-    # Remove any trailing commas before closing braces or brackets
-    json_string = re.sub(r',\s*([\]}])', r'\1', json_string)
-    return json_string
-
-def parse_json_safely(json_string):
-    cleaned_json = clean_json_string(json_string)
-    json_objects = extract_json_objects(cleaned_json)
-    
-    if json_objects:
-        try:
-            # Try to parse the last JSON object found
-            return json.loads(json_objects[-1])
-        except json.JSONDecodeError as e:
-            st.error(f"Failed to parse JSON: {str(e)}")
-    
-    st.error("No valid JSON object found in the response")
-    # return None  # hide if cannot find
-    st.text("Raw response:")
-    st.code(json_string)
-    return {"title": "Error", "content": "Failed to parse response", "next_action": "final_answer"}
+def show_errors(metrics):
+    # Failed attempts behind a step: API errors, retries and unparseable responses
+    for error in metrics.get("errors", []):
+        st.error(error["message"])
+        st.code(error["detail"])
 
 def make_api_call(messages, max_tokens, is_final_answer=False):
-    for attempt in range(3):
-        try:
-            response = requests.post(
-                f"{OLLAMA_URL}/api/chat",
-                json={
-                    "model": OLLAMA_MODEL,
-                    "messages": messages,
-                    "stream": False,
-                    "options": {
-                        "num_predict": max_tokens,
-                        "temperature": 0.2
-                    }
-                }
-            )
-            response.raise_for_status()
-            raw_content = response.json()["message"]["content"]
-            parsed_data = parse_json_safely(raw_content)
-            return parsed_data, raw_content
-        except requests.exceptions.RequestException as e:
-            st.error(f"API call failed: {str(e)}")
-            st.text("Response content:")
-            st.code(response.text if hasattr(response, 'text') else "No response text available")
-        except Exception as e:
-            st.error(f"An error occurred: {str(e)}")
-            st.text("Traceback:")
-            st.code(traceback.format_exc())
-        
-        if attempt == 2:
-            error_message = f"Failed to generate {'final answer' if is_final_answer else 'step'} after 3 attempts."
-            return {"title": "Error", "content": error_message, "next_action": "final_answer"}
-        time.sleep(1)  # Wait for 1 second before retrying
-
-def generate_response(prompt):
+    # Retries, parsing and the HTTP client are shared with the other apps (reasoning.make_api_call)
+    step_data, raw_content, metrics = reasoning.call(messages, max_tokens, is_final_answer, model=OLLAMA_MODEL)
+    show_errors(metrics)
+    return step_data, raw_content, metrics
+
+@trace_generator("chain", backend="ollama", model=OLLAMA_MODEL)
+def generate_response(prompt, evaluation_queue):
     client = get_mongo_client()
     db = get_database(client, "COTlike-llama")
     collection = db["steps"]
@@ -122,12 +82,15 @@ def generate_response(prompt):
 
     while True:
         start_time = time.time()
-        step_data, raw_content = make_api_call(messages, 500)
+        with span("step", step=step_count) as step_span:
+            step_data, raw_content, metrics = make_api_call(messages, 500)
+            step_span.set(title=step_data['title'], tokens=metrics.get("eval_count"))
         end_time = time.time()
         thinking_time = end_time - start_time
         total_thinking_time += thinking_time
+        STEP_LATENCY.observe(thinking_time, backend="ollama", model=OLLAMA_MODEL)
 
-        steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time, raw_content))
+        steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time, raw_content, metrics))
 
         messages.append({"role": "assistant", "content": json.dumps(step_data)})
 
@@ -150,39 +113,55 @@ def generate_response(prompt):
         step_count += 1
 
         # Yield after each step for Streamlit to update
-        yield steps, None  # We're not yielding the total time until the end
+        yield steps, None, None  # We're not yielding the total time until the end
 
     # Generate final answer
     messages.append({"role": "user", "content": "Please provide the final answer based on your reasoning above. Remember to respond with a single, well-formatted JSON object."})
 
     start_time = time.time()
-    final_data, raw_content = make_api_call(messages, 300, is_final_answer=True)
+    with span("step", step="final") as step_span:
+        final_data, raw_content, metrics = make_api_call(messages, 300, is_final_answer=True)
+        step_span.set(title=final_data['title'], tokens=metrics.get("eval_count"))
     end_time = time.time()
     thinking_time = end_time - start_time
     total_thinking_time += thinking_time
+    STEP_LATENCY.observe(thinking_time, backend="ollama", model=OLLAMA_MODEL)
+    CHAIN_LATENCY.observe(total_thinking_time, backend="ollama", model=OLLAMA_MODEL)
 
-    steps.append(("Final Answer", final_data['content'], thinking_time, raw_content))
+    steps.append(("Final Answer", final_data['content'], thinking_time, raw_content, metrics))
 
     # Store the final answer in MongoDB
     # collection.insert_one(final_data)
-    collection.insert_one({"steps": steps})
+    persist_start = time.perf_counter()
+    with span("db.insert", collection="steps"):
+        result = collection.insert_one({
+            "chain_id": current_trace_id(),
+            "steps": steps,
+            "prompt": prompt,
+            "model": OLLAMA_MODEL,
+            "created_at": datetime.now(timezone.utc)
+        })
+    persist_time = time.perf_counter() - persist_start
+    DB_WRITE_LATENCY.observe(persist_time, collection="steps")
+    collection.update_one({"_id": result.inserted_id}, {"$set": {"persist_time": persist_time}})
+
+    evaluation = None
+    if final_answer_detected:
+        # Transfer conversation to agentA in the background; the answer is shown without waiting for it
+        # The agent gets a compact numbered transcript without the repeated instruction blocks
+        evaluation_messages, usage = compact_messages(messages)
+        evaluation = evaluation_queue.submit(evaluation_messages)
 
-    yield steps, total_thinking_time
+        def store_evaluation(future):
+            if future.exception() is None:
+                collection.update_one(
+                    {"_id": result.inserted_id},
+                    {"$set": {"evaluation": future.result(), "evaluation_tokens": usage}}
+                )
 
-    if final_answer_detected:
-        # Transfer conversation to agentA
-        agentA = Agent(
-            name="Evaluation Agent",
-            instructions="You are an expert evaluator. Your task is to evaluate the step-by-step reasoning response towards the questions and provide an evaluation rating system from 0 to 1.",
-            model=AGENT_A_MODEL
-        )
-        Oclient = Swarm(client=ollama_client)
-        response = Oclient.run(
-            agent=agentA,
-            messages=messages
-        )
-        steps.append(("Evaluation Response", response.messages[-1]["content"], 0, response.messages[-1]["content"]))
-        yield steps, total_thinking_time
+        evaluation.add_done_callback(store_evaluation)
+
+    yield steps, total_thinking_time, evaluation
 
 def main():
     st.set_page_config(page_title="COTlike-ollama-swarm", page_icon="🧠", layout="wide")
@@ -216,12 +195,13 @@ def main():
         # Create empty elements to hold the generated text and total time
         response_container = st.empty()
         time_container = st.empty()
+        evaluation_container = st.empty()
 
         # Generate and display the response
-        for steps, total_thinking_time in generate_response(user_query):
+        for steps, total_thinking_time, evaluation in generate_response(user_query, get_evaluation_queue()):
             with response_container.container():
-                for i, (title, content, thinking_time, raw_content) in enumerate(steps):
-                    if title.startswith("Final Answer") or title.startswith("Evaluation Response"):
+                for i, (title, content, thinking_time, raw_content, metrics) in enumerate(steps):
+                    if title.startswith("Final Answer"):
                         st.markdown(f"### {title}")
                         st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
                     else:
@@ -232,7 +212,7 @@ def main():
 
                             # Check if a follow-up was sent
                             # follow_up = check_for_follow_up(raw_content, json.loads(raw_content))
-                            parsed_data = parse_json_safely(raw_content)
+                            parsed_data, _ = parse_json(raw_content)
                             follow_up = check_for_follow_up(raw_content, parsed_data)
                             if follow_up:
                                 if follow_up.startswith("continue"):
@@ -240,12 +220,26 @@ def main():
                                 else:
                                     st.markdown(f"*Follow-up prompt sent: '{follow_up}'*")
 
-                    st.markdown(f"*Thinking time: {thinking_time:.2f} seconds*")
+                    summary = describe_metrics(metrics)
+                    st.markdown(f"*Thinking time: {thinking_time:.2f} seconds*" + (f" · *{summary}*" if summary else ""))
 
             # Only show total time when it's available at the end
             if total_thinking_time is not None:
                 time_container.markdown(f"**Total thinking time: {total_thinking_time:.2f} seconds**")
 
+        # Fill in the evaluation once the background job finishes
+        if evaluation is not None:
+            with evaluation_container.container():
+                st.markdown("### Evaluation Response")
+                with st.spinner("Evaluating..."):
+                    try:
+                        content = evaluation.result()
+                    except Exception as e:
+                        content = None
+                        st.error(f"Evaluation failed: {str(e)}")
+                if content is not None:
+                    st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+
 SYSTEM_PROMPT = """You are an expert AI assistant with advanced reasoning capabilities. Your task is to provide detailed, step-by-step explanations of your thought process. For each step:
 
 1. Provide a clear, concise title describing the current reasoning phase.
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+from dotenv import load_dotenv
+from metrics import REQUEST_LATENCY, TIME_TO_FIRST_TOKEN, TOKENS_GENERATED
+
+# Load environment variables
+load_dotenv()
+
+OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+
+# Ollama reports durations in nanoseconds
+NANOSECONDS = 1e9
+
+class OllamaError(Exception):
+    pass
+
+def server_metrics(body):
+    # Timing fields from the final (done) message of /api/chat
+    metrics = {
+        "eval_count": body.get("eval_count"),
+        "prompt_eval_count": body.get("prompt_eval_count"),
+    }
+    for field in ("eval_duration", "prompt_eval_duration", "load_duration", "total_duration"):
+        value = body.get(field)
+        metrics[field] = value / NANOSECONDS if value is not None else None
+
+    if metrics["eval_count"] and metrics["eval_duration"]:
+        metrics["tokens_per_second"] = metrics["eval_count"] / metrics["eval_duration"]
+    if metrics["prompt_eval_count"] and metrics["prompt_eval_duration"]:
+        metrics["prompt_tokens_per_second"] = metrics["prompt_eval_count"] / metrics["prompt_eval_duration"]
+    return metrics
+
+class OllamaHTTPError(OllamaError):
+    def __init__(self, status, text):
+        super().__init__(f"{status} error from Ollama: {text}")
+        self.status = status
+        self.text = text
+
+def chat_payload(messages, model, max_tokens, temperature, seed=None):
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "options": {
+            "num_predict": max_tokens,
+            "temperature": temperature
+        }
+    }
+    # Only when set, so requests without one keep their cassette keys
+    if seed is not None:
+        payload["options"]["seed"] = seed
+    return payload
+
+def embed_payload(texts, model):
+    return {"model": model, "input": texts}
+
+class ChatStream:
+    # Collects the NDJSON lines of a streamed /api/chat reply and times them on the client
+
+    def __init__(self, on_token=None):
+        self.start = time.perf_counter()
+        self.chunks = []
+        self.first_token_at = None
+        self.final = {}
+        self.on_token = on_token
+
+    def feed(self, line):
+        # Returns True at the final (done) message
+        body = json.loads(line)
+        if "error" in body:
+            raise OllamaError(body["error"])
+        content = body.get("message", {}).get("content", "")
+        if content:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.chunks.append(content)
+            if self.on_token:
+                self.on_token(content)
+        if body.get("done"):
+            self.final = body
+            return True
+        return False
+
+    def result(self, model):
+        end = time.perf_counter()
+        if not self.final:
+            raise OllamaError("Stream ended before the final message")
+
+        metrics = server_metrics(self.final)
+        metrics["network"] = end - self.start
+        metrics["ttft"] = (self.first_token_at or end) - self.start
+        # Whatever the server did not spend loading or reading the prompt before the first token was
+        # spent waiting: in Ollama's request queue or on connection setup
+        busy = (metrics["load_duration"] or 0) + (metrics["prompt_eval_duration"] or 0)
+        metrics["queue_wait"] = max(0.0, metrics["ttft"] - busy)
+
+        REQUEST_LATENCY.observe(metrics["network"], backend="ollama", model=model)
+        TIME_TO_FIRST_TOKEN.observe(metrics["ttft"], backend="ollama", model=model)
+        TOKENS_GENERATED.inc(metrics["eval_count"] or 0, backend="ollama", model=model)
+        return "".join(self.chunks), metrics
+
+def record_http_span(http_span, metrics):
+    http_span.set(
+        eval_count=metrics["eval_count"],
+        prompt_eval_count=metrics["prompt_eval_count"],
+        ttft=metrics["ttft"],
+        load_duration=metrics["load_duration"]
+    )
+
+def describe_metrics(metrics):
+    # Short UI summary, e.g. "41.3 tokens/s · TTFT 0.42 s"
+    parts = []
+    if metrics.get("tokens_per_second"):
+        parts.append(f"{metrics['tokens_per_second']:.1f} tokens/s")
+    if metrics.get("ttft") is not None:
+        parts.append(f"TTFT {metrics['ttft']:.2f} s")
+    if metrics.get("attempts", 1) > 1:
+        parts.append(f"{metrics['attempts']} attempts")
+    if metrics.get("escalation"):
+        parts.append(f"escalated to {metrics['model']} ({metrics['escalation']['reason'].replace('_', ' ')})")
+    if metrics.get("tool"):
+        tool = metrics["tool"]
+        parts.append(f"{tool['name']} tool {'failed' if 'error' in tool else 'ran'} in {tool['elapsed'] * 1000:.2f} ms")
+    if metrics.get("tools"):
+        parts.append(f"{metrics['tools']['calls']} tool calls, ~{metrics['tools']['time_saved']:.1f} s saved")
+    if metrics.get("retrieval", {}).get("example_id"):
+        parts.append(f"worked example {metrics['retrieval']['similarity']:.2f} similar, found in {metrics['retrieval']['latency'] * 1000:.0f} ms")
+    if metrics.get("depth"):
+        parts.append(f"{metrics['depth']['mode']} chain ({metrics['depth']['source']})")
+    if metrics.get("consistency"):
+        vote = metrics["consistency"]
+        parts.append(f"majority of {vote['answered']} answers ({vote['agreement']:.0%} agree)")
+    if metrics.get("value") and metrics["value"].get("value") is not None:
+        parts.append(f"rated {metrics['value']['value']:.2f}")
+    if metrics.get("branch"):
+        branch = metrics["branch"]
+        if branch["depends_on"]:
+            parts.append(f"waited {branch['waited']:.2f} s for {', '.join(branch['depends_on'])}")
+        parts.append(f"branch ran {branch['ran']:.2f} s")
+    if metrics.get("decomposition", {}).get("speedup"):
+        parts.append(f"{metrics['decomposition']['sub_questions']} sub-questions, {metrics['decomposition']['speedup']:.1f}x faster than one after another")
+    if metrics.get("tree"):
+        search = metrics["tree"]
+        parts.append(f"best of {search['levels']} levels, score {search['score']:.2f}, {search['tokens']} tokens")
+    return " · ".join(parts)
@@ -0,0 +1,131 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from rater import (
+    DB_NAME,
+    COLLECTION_NAME,
+    FEEDBACK_COLLECTION_NAME,
+    CRITERIA,
+    get_mongo_client,
+    get_database,
+    parse_ratings,
+)
+
+PERCENTILES = [0.5, 0.9, 0.95, 0.99]
+HISTOGRAM_BINS = np.linspace(0, 1, 11)
+SCORE_COLUMNS = ["overall"] + CRITERIA
+
+def backfill_ratings(db):
+    # Parse feedback stored as a raw text blob before ratings were parsed at write time
+    feedback = db[FEEDBACK_COLLECTION_NAME]
+    steps = db[COLLECTION_NAME]
+    updated = 0
+    for doc in feedback.find({"ratings": {"$exists": False}, "feedback": {"$type": "string"}}):
+        update = parse_ratings(doc["feedback"])
+        if doc.get("steps_id") is not None:
+            steps_data = steps.find_one({"_id": doc["steps_id"]}, {"model": 1, "prompt": 1})
+            if steps_data:
+                update["model"] = steps_data.get("model")
+                update["prompt"] = steps_data.get("prompt")
+        feedback.update_one({"_id": doc["_id"]}, {"$set": update})
+        updated += 1
+    return updated
+
+def ratings_pipeline():
+    # Flatten to one row of numbers per rated chain; the server does the projection
+    return [
+        {"$match": {"ratings": {"$exists": True}}},
+        {"$project": {
+            "_id": 0,
+            "model": {"$ifNull": ["$model", "unknown"]},
+            "prompt": {"$ifNull": ["$prompt", "unknown"]},
+            "overall": 1,
+            **{criterion: f"$ratings.{criterion}" for criterion in CRITERIA},
+        }},
+    ]
+
+def summary_pipeline(group_by):
+    # Server-side alternative to load_ratings; $percentile needs MongoDB 7.0+
+    percentiles = {
+        "$percentile": {"input": "$overall", "p": PERCENTILES, "method": "approximate"}
+    }
+    return [
+        {"$match": {"overall": {"$type": "number"}}},
+        {"$group": {
+            "_id": {key: {"$ifNull": [f"${key}", "unknown"]} for key in group_by},
+            "count": {"$sum": 1},
+            "mean": {"$avg": "$overall"},
+            "std": {"$stdDevPop": "$overall"},
+            "min": {"$min": "$overall"},
+            "max": {"$max": "$overall"},
+            "percentiles": percentiles,
+            **{criterion: {"$avg": f"$ratings.{criterion}"} for criterion in CRITERIA},
+        }},
+        {"$sort": {"count": -1}},
+    ]
+
+def load_ratings(db):
+    rows = db[FEEDBACK_COLLECTION_NAME].aggregate(ratings_pipeline(), allowDiskUse=True)
+    frame = pd.DataFrame(list(rows), columns=["model", "prompt"] + SCORE_COLUMNS)
+    frame[SCORE_COLUMNS] = frame[SCORE_COLUMNS].apply(pd.to_numeric, errors="coerce")
+    return frame
+
+def percentile_table(frame, group_by):
+    grouped = frame.groupby(group_by)[SCORE_COLUMNS]
+    table = grouped.quantile(PERCENTILES).unstack()
+    table.columns = [f"{column} p{int(p * 100)}" for column, p in table.columns]
+    summary = grouped.agg(["count", "mean", "std"])
+    summary.columns = [f"{column} {stat}" for column, stat in summary.columns]
+    return summary.join(table)
+
+def distribution_table(frame, group_by):
+    # Histogram of overall scores in 0.1 buckets per group
+    rows = {}
+    for key, group in frame.groupby(group_by):
+        counts, _ = np.histogram(group["overall"].dropna().to_numpy(), bins=HISTOGRAM_BINS)
+        rows[key] = counts
+    labels = [f"{low:.1f}-{high:.1f}" for low, high in zip(HISTOGRAM_BINS[:-1], HISTOGRAM_BINS[1:])]
+    return pd.DataFrame.from_dict(rows, orient="index", columns=labels)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-model/per-prompt statistics of parsed rater output")
+    parser.add_argument("--by", action="append", choices=["model", "prompt"], help="group by (repeatable, default: model)")
+    parser.add_argument("--backfill", action="store_true", help="parse ratings of feedback stored as raw text")
+    parser.add_argument("--server", action="store_true", help="aggregate in MongoDB instead of pandas")
+    parser.add_argument("--csv", help="write the percentile table to this file")
+    args = parser.parse_args()
+    group_by = args.by or ["model"]
+
+    client = get_mongo_client()
+    db = get_database(client, DB_NAME)
+
+    if args.backfill:
+        print(f"Backfilled {backfill_ratings(db)} feedback documents.")
+
+    start_time = time.time()
+    if args.server:
+        for row in db[FEEDBACK_COLLECTION_NAME].aggregate(summary_pipeline(group_by), allowDiskUse=True):
+            print(row)
+        print(f"Aggregated in {time.time() - start_time:.2f} seconds")
+        return
+
+    frame = load_ratings(db)
+    if frame.empty:
+        print("No parsed ratings found. Run with --backfill to parse stored feedback.")
+        return
+
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_columns", None)
+    table = percentile_table(frame, group_by)
+    print(table.round(3))
+    print()
+    print(distribution_table(frame, group_by))
+    print(f"\n{len(frame)} rated chains aggregated in {time.time() - start_time:.2f} seconds")
+
+    if args.csv:
+        table.to_csv(args.csv)
+
+if __name__ == "__main__":
+    main()
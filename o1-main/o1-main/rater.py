@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import requests
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from transcript import build_transcript, token_report
+
+# Load environment variables
+load_dotenv()
+
+# MongoDB configuration
+MONGO_URL = os.getenv('MONGO_URL', 'mongodb://localhost:27017/')
+DB_NAME = "COTlike-llama"
+COLLECTION_NAME = "steps"
+FEEDBACK_COLLECTION_NAME = "feedback"
+
+# Ollama configuration
+OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.1')
+# How long Ollama keeps the rater model loaded between requests
+RATER_KEEP_ALIVE = os.getenv('RATER_KEEP_ALIVE', '30m')
+RATER_TIMEOUT = float(os.getenv('RATER_TIMEOUT', '300'))
+# Per-step ratings can run on a second Ollama box so they overlap with generation
+RATER_URL = os.getenv('RATER_URL', OLLAMA_URL)
+RATER_MODEL = os.getenv('RATER_MODEL', OLLAMA_MODEL)
+# Weight of the per-step mean when folded into the chain-level rating
+STEP_RATING_WEIGHT = float(os.getenv('STEP_RATING_WEIGHT', '0.5'))
+
+# Ollama answers 503 when its request queue is full (OLLAMA_MAX_QUEUE)
+SATURATED_STATUS_CODES = (429, 503)
+
+# Criteria requested by RATER_PROMPT, one JSON object each
+CRITERIA = ["Logical", "Clarity", "Depth", "Relevance", "Coherence", "Accuracy", "Usefulness"]
+CRITERIA_BY_NAME = {criterion.lower(): criterion for criterion in CRITERIA}
+# Criteria that can be judged on a single step
+STEP_CRITERIA = ["Logical", "Accuracy"]
+
+class OllamaSaturated(Exception):
+    pass
+
+def get_mongo_client():
+    client = MongoClient(MONGO_URL)
+    return client
+
+def get_database(client, db_name):
+    return client[db_name]
+
+def make_api_call(messages, session=None, url=OLLAMA_URL, model=OLLAMA_MODEL, max_tokens=500):
+    http = session or requests
+    response = http.post(
+        f"{url}/api/chat",
+        json={
+            "model": model,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": RATER_KEEP_ALIVE,
+            "options": {
+                "num_predict": max_tokens,
+                "temperature": 0.2
+            }
+        },
+        timeout=RATER_TIMEOUT
+    )
+    if response.status_code in SATURATED_STATUS_CODES:
+        raise OllamaSaturated(f"{response.status_code}: {response.text}")
+    response.raise_for_status()
+    return response.json()
+
+def build_rater_messages(steps_data):
+    # Prepare the prompt from a compact numbered transcript instead of the raw steps JSON
+    transcript = build_transcript(steps_data.get('prompt'), steps_data['steps'])
+    prompt = f"{RATER_PROMPT}\n\nSteps Data:\n{transcript}"
+    usage = token_report(json.dumps(steps_data['steps']), transcript)
+
+    messages = [
+        {"role": "system", "content": "You are an expert critic and response reflector."},
+        {"role": "user", "content": prompt}
+    ]
+    return messages, usage
+
+def rate_steps(steps_data, session=None):
+    messages, usage = build_rater_messages(steps_data)
+    response = make_api_call(messages, session)
+    usage["prompt_eval_count"] = response.get("prompt_eval_count")
+    return response["message"]["content"], usage
+
+def build_step_rater_messages(query, previous_titles, title, content):
+    context = "\n".join(previous_titles) or "(none)"
+    prompt = f"{STEP_RATER_PROMPT}\n\nQuery: {query}\n\nEarlier steps:\n{context}\n\nStep to rate: {title}\n{content}"
+    return [
+        {"role": "system", "content": "You are an expert critic and response reflector."},
+        {"role": "user", "content": prompt}
+    ]
+
+def rate_step(query, previous_titles, title, content, session=None):
+    messages = build_step_rater_messages(query, previous_titles, title, content)
+    response = make_api_call(messages, session, url=RATER_URL, model=RATER_MODEL, max_tokens=200)
+    return parse_ratings(response["message"]["content"], STEP_CRITERIA)
+
+def extract_json_objects(text):
+    # Same non-recursive pattern the apps use for step JSON
+    json_pattern = re.compile(r'\{(?:[^{}]|\{[^{}]*\})*\}')
+    return json_pattern.findall(text)
+
+def parse_rating_value(value):
+    # Ratings arrive as strings like "0.65"; anything outside 0..1 is rejected
+    rating = float(str(value).strip())
+    if not 0 <= rating <= 1:
+        raise ValueError(f"rating {rating} outside 0..1")
+    return round(rating, 2)
+
+def parse_ratings(feedback, criteria=CRITERIA):
+    ratings = {}
+    comments = {}
+    invalid = []
+
+    for json_text in extract_json_objects(feedback):
+        try:
+            item = json.loads(json_text)
+            criterion = CRITERIA_BY_NAME.get(str(item.get("title", "")).strip(" *").lower())
+            if criterion is None or criterion not in criteria:
+                raise ValueError(f"unknown criterion {item.get('title')!r}")
+            if criterion in ratings:
+                raise ValueError(f"duplicate criterion {criterion}")
+            ratings[criterion] = parse_rating_value(item.get("rating"))
+            comments[criterion] = str(item.get("comment", ""))
+        except (ValueError, TypeError, AttributeError) as e:
+            # json.JSONDecodeError is a ValueError
+            invalid.append(str(e))
+
+    overall = round(sum(ratings.values()) / len(ratings), 4) if ratings else None
+    return {
+        "ratings": ratings,
+        "comments": comments,
+        "overall": overall,
+        "missing": [criterion for criterion in criteria if criterion not in ratings],
+        "invalid": invalid,
+    }
+
+def fold_step_ratings(parsed, step_ratings, weight=STEP_RATING_WEIGHT):
+    # Blend the chain-level Logical/Accuracy ratings with the mean of the per-step ratings
+    ratings = dict(parsed["ratings"])
+    for criterion in STEP_CRITERIA:
+        values = [step["ratings"][criterion] for step in step_ratings if criterion in step.get("ratings", {})]
+        if not values:
+            continue
+        step_mean = sum(values) / len(values)
+        if criterion in ratings:
+            ratings[criterion] = round((1 - weight) * ratings[criterion] + weight * step_mean, 4)
+        else:
+            ratings[criterion] = round(step_mean, 4)
+
+    return {
+        **parsed,
+        "chain_ratings": parsed["ratings"],
+        "ratings": ratings,
+        "overall": round(sum(ratings.values()) / len(ratings), 4) if ratings else None,
+        "missing": [criterion for criterion in CRITERIA if criterion not in ratings],
+    }
+
+def store_feedback(db, steps_data, feedback, usage=None):
+    parsed = parse_ratings(feedback)
+    if steps_data.get("step_ratings"):
+        parsed = fold_step_ratings(parsed, steps_data["step_ratings"])
+
+    collection = db[FEEDBACK_COLLECTION_NAME]
+    return collection.insert_one({
+        "steps_id": steps_data["_id"],
+        "model": steps_data.get("model"),
+        "prompt": steps_data.get("prompt"),
+        "rater_model": OLLAMA_MODEL,
+        "created_at": datetime.now(timezone.utc),
+        "feedback": feedback,
+        "transcript_tokens": usage,
+        **parsed,
+    })
+
+# Rater prompt
+RATER_PROMPT = '''
+As an expert critic and LLM reflector, your task is to analyze the step-by-step response of an expert in specified domain towards a query, identifying specific areas where the response may lack clarity, depth, or relevance, and providing constructive feedback.
+
+Focus on providing detailed and constructive feedback, highlighting shortcomings and offering actionable suggestions for improvement. Maintain a supportive tone that encourages growth and development.
+
+# Assessment Criteria
+
+- **Logical**: Does the reasoning steps logical? Do the values or evidences used are in accurate and logical manner? Have it considered all of Edge Case Consideration, Precision Consideration, Alternative Hypothesis or Approach Evaluation and Elimination?
+- **Clarity**: Does the response clearly convey information and ideas? Are there any ambiguous or confusing sections?
+- **Depth**: To what extent does the response explore the topic? Are complex ideas and edge cases fully developed and well-considered?
+- **Relevance**: How directly does the response address the prompt or topic? Are there any areas where the response deviates without purpose?
+- **Coherence**: Are the ideas and arguments presented in a logically consistent manner? Does the flow of information make sense?
+- **Accuracy**: Are the facts and data presented correct and up-to-date? Are sources of information trustworthy? How many confidence level would you rate?
+- **Usefulness**: Does the response offer unique insights or express ideas in an useful way, is the solution offered feasible to address the issues?
+
+# Output Format
+
+Produce a well-formatted JSON for each assessment criterion listed, offering detailed feedback. Recap the key strengths and areas for improvement.
+Use JSON with keys: 'title' (values: Logical,Clarity,Depth,Relevance,Coherence,Accuracy,Usefulness), 'comment', 'rating' (values: ranges from 0 to 1 in 2 decimal place, e.g. 0.15, 0.25, 0.30, ...)
+
+# Examples
+
+- **Input**: "Query: 'What is the fox in this picture doing?' Expert response: 'The quick brown fox jumps over the lazy dog. It is known that foxes are part of the Canidae family.'"
+
+{"title": "Logical", "comment": "During Step 1 Problem Decomposition ought to consider more than 3 distinct cases, and the values used are questionable. Provided on 19XX, the values is actually XX...", "rating": "0.55"}
+{"title": "Clarity", "comment": "The initial sentence is simple and clear, though simplistic. The subsequent sentence introduces a fact but lacks context linking it to the previous statement.", "rating": "0.65"}
+{"title": "Depth", "comment": "The response provides minimal exploration of foxes or the significance of the phrase introduced.", "rating": "0.50"}
+{"title": "Relevance", "comment": "While factual, the information on the Canidae family seems tangential to the core topic presented by the phrase.", "rating": "0.65"}
+{"title": "Coherence", "comment": "The transition between sentences could be smoother with a connective rationale.", "rating": "0.75"}
+{"title": "Accuracy", "comment": "The statement about foxes is factually accurate.", "rating": "0.95"}
+{"title": "Usefulness", "comment": "The response lacks usefulness, largely restating known information without unique insight (out of the box) that could really solve the issues.", "rating": "0.45"}
+
+**Recap**: The response is clear and accurate but fails to provide engaging or deeply explored content. Consider expanding the context and integrating creative links between ideas.
+
+# Notes
+
+- Encourage improvements by suggesting specific changes, like adding examples or contextual explanations.
+- Maintain a positive and encouraging tone throughout the feedback.
+- Address both strengths and weaknesses equally to provide balanced feedback.
+
+'''
+
+# Step rater prompt
+STEP_RATER_PROMPT = '''
+As an expert critic, rate ONE intermediate step of an expert's step-by-step reasoning towards a query while the expert is still working.
+
+# Assessment Criteria
+
+- **Logical**: Does this step follow from the query and the earlier steps? Are the values or evidences used in an accurate and logical manner?
+- **Accuracy**: Are the facts, numbers and intermediate results in this step correct?
+
+# Output Format
+
+Produce one well-formatted JSON object per criterion and nothing else.
+Use JSON with keys: 'title' (values: Logical,Accuracy), 'comment' (one sentence naming the flaw, if any), 'rating' (values: ranges from 0 to 1 in 2 decimal place)
+
+{"title": "Logical", "comment": "The step counts letters but skips the second 'r' in 'berry'.", "rating": "0.40"}
+{"title": "Accuracy", "comment": "The intermediate count of 2 is wrong.", "rating": "0.30"}
+'''
@@ -0,0 +1,504 @@
+import os
+import re
+import json
+import time
+import atexit
+import asyncio
+import weakref
+import threading
+import traceback
+import contextvars
+from datetime import datetime, timezone
+import aiohttp
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+from ollama_client import OllamaError, OllamaHTTPError
+from backends import BackendError, BackendHTTPError, get_backend
+from cassette import CassetteMiss
+from tracing import current_span, current_trace_id, span, trace_generator
+from metrics import CHAIN_LATENCY, STEP_LATENCY, RETRIES, PARSE_FAILURES, DB_WRITE_LATENCY, ROUTE_LATENCY, ESCALATIONS, TOOL_TIME_SAVED
+from routing import ROUTE, Router
+from depth import DEPTH, DEPTH_MODES, SHORT_CHAIN_PROMPT, SINGLE_SHOT_PROMPT, check_depth, classify_depth
+from tools import TOOLS_ENABLED, TOOLS_PROMPT, describe_call, run_tool
+from retrieval import EMBEDDINGS_COLLECTION_NAME, RETRIEVAL, retrieve_example
+from rater import MONGO_URL, DB_NAME, COLLECTION_NAME, FEEDBACK_COLLECTION_NAME
+
+# Headless reasoning engine: the step loop of app_ollama without any UI calls, shared by the
+# Streamlit app and the API service (api_server.py)
+
+# Load environment variables
+load_dotenv()
+
+# Get configuration from .env file
+OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2')
+
+# Connections to Ollama per event loop; chains beyond that wait for a free connection
+OLLAMA_CONNECTIONS = int(os.getenv('OLLAMA_CONNECTIONS', '100'))
+
+# Store finished chains in the steps collection, where ollama-rater-daemon.py rates them
+PERSIST_CHAINS = os.getenv('PERSIST_CHAINS', '').lower() in ('1', 'true', 'yes')
+# Save the message state after every step, keyed by chain id, so an interrupted chain can be resumed
+CHECKPOINT_CHAINS = os.getenv('CHECKPOINT_CHAINS', '').lower() in ('1', 'true', 'yes')
+CHECKPOINTS_COLLECTION_NAME = "checkpoints"
+
+MAX_ATTEMPTS = 3
+
+FINAL_ANSWER_REQUEST = {"role": "user", "content": "Please provide the final answer based on your reasoning above. Remember to respond with a single, well-formatted JSON object."}
+
+_engine_loop = None
+_engine_lock = threading.Lock()
+_sessions = weakref.WeakKeyDictionary()
+_mongo_clients = weakref.WeakKeyDictionary()
+
+def check_for_follow_up(raw_content, step_data):
+    if "Please let me know" in raw_content:
+        return "Continue, Consider ALL" + important_message
+    elif isinstance(step_data, dict) and step_data.get('next_action') == 'continue':
+        return 'continue' + important_message
+    return None
+
+def extract_json_objects(text):
+    # This regex pattern matches JSON-like structures without using recursive patterns
+    json_pattern = re.compile(r'\{(?:[^{}]|\{[^{}]*\})*\}')
+    return json_pattern.findall(text)
+
+def clean_json_string(json_string):
+    # Remove any text before the first '{'
+    json_string = re.sub(r'^[^{]*', '', json_string)
+    # Remove any text after the last '}'
+    json_string = re.sub(r'[^}]*$', '', json_string)
+    # Remove any trailing commas before closing braces or brackets
+    json_string = re.sub(r',\s*([\]}])', r'\1', json_string)
+    return json_string
+
+def parse_json(json_string):
+    # Returns (step data, error); on failure the step data is a placeholder that ends the chain
+    cleaned_json = clean_json_string(json_string)
+    json_objects = extract_json_objects(cleaned_json)
+
+    if json_objects:
+        try:
+            # Try to parse the last JSON object found
+            return json.loads(json_objects[-1]), None
+        except json.JSONDecodeError as e:
+            return {"title": "Error", "content": "Failed to parse response", "next_action": "final_answer"}, f"Failed to parse JSON: {str(e)}"
+
+    return {"title": "Error", "content": "Failed to parse response", "next_action": "final_answer"}, "No valid JSON object found in the response"
+
+def get_session():
+    # One aiohttp session per event loop, since a session can't be shared across loops
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=OLLAMA_CONNECTIONS))
+    return session
+
+def get_collection(name=COLLECTION_NAME):
+    # AsyncMongoClient is bound to the loop it was first used on, so keep one per loop as well
+    loop = asyncio.get_running_loop()
+    client = _mongo_clients.get(loop)
+    if client is None:
+        client = _mongo_clients[loop] = AsyncMongoClient(MONGO_URL)
+    return client[DB_NAME][name]
+
+async def close_connections():
+    # Call before the current loop stops; the shared engine loop does this at exit
+    loop = asyncio.get_running_loop()
+    session = _sessions.pop(loop, None)
+    if session is not None:
+        await session.close()
+    client = _mongo_clients.pop(loop, None)
+    if client is not None:
+        await client.close()
+
+async def persist_chain(prompt, model, steps, **fields):
+    # fields are stored alongside, e.g. the job_id of a queued chain
+    collection = get_collection()
+    persist_start = time.perf_counter()
+    with span("db.insert", collection=COLLECTION_NAME):
+        result = await collection.insert_one({
+            "chain_id": current_trace_id(),
+            "steps": steps,
+            "prompt": prompt,
+            "model": model,
+            "created_at": datetime.now(timezone.utc),
+            **fields
+        })
+    persist_time = time.perf_counter() - persist_start
+    DB_WRITE_LATENCY.observe(persist_time, collection=COLLECTION_NAME)
+    await collection.update_one({"_id": result.inserted_id}, {"$set": {"persist_time": persist_time}})
+    return result.inserted_id
+
+async def load_checkpoint(chain_id):
+    return await get_collection(CHECKPOINTS_COLLECTION_NAME).find_one({"_id": chain_id})
+
+async def save_checkpoint(chain_id, status, **state):
+    # One document per chain, overwritten after every completed step
+    with span("db.checkpoint", collection=CHECKPOINTS_COLLECTION_NAME):
+        await get_collection(CHECKPOINTS_COLLECTION_NAME).update_one(
+            {"_id": chain_id},
+            {"$set": {"status": status, "updated_at": datetime.now(timezone.utc), **state},
+             "$setOnInsert": {"created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+def chain_messages(prompt, system_prompt=None, depth="full", tools=False, example=None):
+    # Opening messages of a chain; system_prompt is the prompt of full chains, tools adds the tool descriptions
+    # and example is a worked example from retrieval.py
+    if depth == "single":
+        return [
+            {"role": "system", "content": ""},
+            {"role": "user", "content": SINGLE_SHOT_PROMPT + "Here is my query: " + prompt}
+        ]
+    system_prompt = SYSTEM_PROMPT if system_prompt is None else system_prompt
+    return [
+        # {"role": "system", "content": SYSTEM_PROMPT + important_message},
+        # {"role": "user", "content": "Here is my first query: " + prompt },
+        {"role": "system", "content": ""},
+        {"role": "user", "content": (SHORT_CHAIN_PROMPT if depth == "short" else system_prompt) + important_message + (TOOLS_PROMPT if tools else "") + (example or "") + "Here is my first query: " + prompt },
+        {"role": "assistant", "content": "Understood. I will now think step by step following the instructions, starting with decomposing the problem. I will provide my response in a single, well-formatted JSON object for each step."}
+    ]
+
+def is_failed(step):
+    # Steps whose API call gave up after MAX_ATTEMPTS
+    return step[4].get("failed", False)
+
+async def make_api_call(messages, max_tokens, is_final_answer=False, model=None, session=None, backend="ollama", temperature=0.2, seed=None):
+    # Failed attempts are kept in metrics["errors"] as {"message", "detail"} for the caller to show
+    backend = get_backend(backend)
+    model = model or backend.default_model
+    session = session or get_session()
+    errors = []
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            raw_content, metrics = await backend.chat(messages, model, max_tokens, temperature, json_mode=True, session=session, seed=seed, attempt=attempt + 1)
+            parse_start = time.perf_counter()
+            with span("parse"):
+                parsed_data, error = parse_json(raw_content)
+            if error:
+                PARSE_FAILURES.inc(backend=backend.name, model=model)
+                errors.append({"message": error, "detail": raw_content})
+            metrics["parse"] = time.perf_counter() - parse_start
+            metrics["parse_error"] = error
+            metrics["attempts"] = attempt + 1
+            metrics["errors"] = errors
+            return parsed_data, raw_content, metrics
+        except (OllamaHTTPError, BackendHTTPError) as e:
+            RETRIES.inc(backend=backend.name, model=model)
+            errors.append({"message": f"API call failed: {str(e.status)} from {backend.name}", "detail": e.text or "No response text available"})
+        except (aiohttp.ClientError, asyncio.TimeoutError, OllamaError, BackendError) as e:
+            RETRIES.inc(backend=backend.name, model=model)
+            errors.append({"message": f"API call failed: {str(e) or type(e).__name__}", "detail": "No response text available"})
+        except CassetteMiss:
+            # A request missing from the replayed cassettes would miss on every attempt
+            raise
+        except Exception as e:
+            RETRIES.inc(backend=backend.name, model=model)
+            errors.append({"message": f"An error occurred: {str(e)}", "detail": traceback.format_exc()})
+
+        if attempt == MAX_ATTEMPTS - 1:
+            error_message = f"Failed to generate {'final answer' if is_final_answer else 'step'} after {MAX_ATTEMPTS} attempts."
+            return {"title": "Error", "content": error_message, "next_action": "final_answer"}, error_message, {"attempts": MAX_ATTEMPTS, "errors": errors, "failed": True}
+        await asyncio.sleep(1)  # Wait for 1 second before retrying
+
+async def routed_call(messages, max_tokens, router, is_final_answer=False, model=None, session=None, backend="ollama", temperature=0.2, seed=None):
+    # Without a router every call goes to model. With one, steps go to the small model and are re-run
+    # on the large model when the router escalates them; the final answer always goes to the large model.
+    if router is None:
+        return await make_api_call(messages, max_tokens, is_final_answer, model, session, backend, temperature, seed)
+    start_time = time.perf_counter()
+    if is_final_answer:
+        route, model = "final", router.large
+        step_data, raw_content, metrics = await make_api_call(messages, max_tokens, True, model, session, backend, temperature, seed)
+    else:
+        route, model = "small", router.small
+        step_data, raw_content, metrics = await make_api_call(messages, max_tokens, False, model, session, backend, temperature, seed)
+        reason = router.escalation(step_data, metrics)
+        if reason:
+            ESCALATIONS.inc(reason=reason, model=router.large)
+            # The small model's attempt is kept for tuning the thresholds
+            escalation = {"reason": reason, "model": model, "latency": time.perf_counter() - start_time,
+                          "eval_count": metrics.get("eval_count"), "raw_content": raw_content}
+            route, model = "escalated", router.large
+            with span("escalation", reason=reason, model=model):
+                step_data, raw_content, metrics = await make_api_call(messages, max_tokens, False, model, session, backend, temperature, seed)
+            metrics["escalation"] = escalation
+    metrics["route"] = route
+    metrics["model"] = model
+    ROUTE_LATENCY.observe(time.perf_counter() - start_time, route=route, model=model)
+    return step_data, raw_content, metrics
+
+async def prepare_chain(prompt, model=None, session=None, backend="ollama", route=ROUTE, depth=DEPTH, retrieval=RETRIEVAL):
+    # What a new chain settles before its first step: (depth details, worked example or None, retrieval
+    # details or None). Callers that run several chains of one query (consistency.py) call it once and pass
+    # the result to every chain as prepared, rather than classify and retrieve for each.
+    router = Router.parse(route) if route else None
+    check_depth(depth)
+    if depth == "auto":
+        depth, depth_info = await classify_depth(prompt, router.small if router else model or get_backend(backend).default_model, session, backend)
+    else:
+        depth_info = {"mode": depth, "source": "caller"}
+    # A worked example only helps chains that reason in steps
+    example, retrieval_info = None, None
+    if retrieval and depth != "single":
+        example, retrieval_info = await retrieve_example(prompt, get_collection(), get_collection(EMBEDDINGS_COLLECTION_NAME),
+                                                         get_collection(FEEDBACK_COLLECTION_NAME), session or get_session())
+    return depth_info, example, retrieval_info
+
+@trace_generator("chain")
+async def agenerate_response(prompt, system_prompt=None, model=None, max_steps=None, session=None, persist=PERSIST_CHAINS, checkpoint=CHECKPOINT_CHAINS, backend="ollama", route=ROUTE, depth=DEPTH,
+                             temperature=0.2, seed=None, tools=TOOLS_ENABLED, retrieval=RETRIEVAL, prepared=None):
+    # system_prompt, model and max_steps let callers such as the evaluation harness compare variants;
+    # backend is one of backends.BACKEND_NAMES, model defaults to that backend's model.
+    # route ("small>large@min_certainty", see routing.py) replaces model with a small and a large one.
+    # depth (see depth.py) is auto, single, short or full; system_prompt is the prompt of full chains.
+    # temperature and seed are sent with every call, e.g. to sample independent chains (consistency.py).
+    # tools lets steps call the local tools of tools.py; their results are sent back before the next step.
+    # retrieval shows the model the most similar stored chain as a worked example (retrieval.py).
+    # prepared is the result of prepare_chain for this query; depth and retrieval are then not resolved again.
+    system_prompt = SYSTEM_PROMPT if system_prompt is None else system_prompt
+    router = Router.parse(route) if route else None
+    model = str(router) if router else model or get_backend(backend).default_model
+    check_depth(depth)
+
+    steps = []
+    step_count = 1
+    total_thinking_time = 0
+    # The checkpoint stops advancing at the first failed step, so a resume retries from there
+    failed = False
+    final = False
+
+    # Checkpoints are keyed by the trace id, which callers set to their chain id
+    chain_id = current_trace_id()
+    saved = await load_checkpoint(chain_id) if checkpoint else None
+    if saved is not None:
+        messages, step_count, total_thinking_time, final = saved["messages"], saved["step_count"], saved["total_thinking_time"], saved.get("final", False)
+        steps = [tuple(step) for step in saved["steps"]]
+        # Checkpoints from before adaptive depth are full chains
+        depth_info = saved.get("depth") or {"mode": "full", "source": "checkpoint"}
+        depth = depth_info["mode"]
+        # A resumed chain has its worked example in its messages already
+        example, retrieval_info = None, saved.get("retrieval")
+    else:
+        depth_info, example, retrieval_info = prepared or await prepare_chain(prompt, model, session, backend, route, depth, retrieval)
+        depth = depth_info["mode"]
+    current_span().set(backend=backend, model=model, depth=depth, depth_source=depth_info["source"])
+
+    # The caller's step budget applies on top of the mode's
+    limits = DEPTH_MODES[depth]
+    min_steps = limits["min_steps"]
+    if limits["max_steps"] is not None:
+        max_steps = min(max_steps, limits["max_steps"]) if max_steps else limits["max_steps"]
+
+    if saved is not None:
+        if saved["status"] == "done":
+            yield steps, total_thinking_time
+            return
+        if steps:
+            yield steps, None
+    else:
+        messages = chain_messages(prompt, system_prompt, depth, tools, example)
+        # A single-shot query goes straight to the final answer
+        final = depth == "single"
+        if checkpoint:
+            # The resolved depth is saved, so a resumed chain keeps its mode without classifying again
+            options = {"system_prompt": system_prompt, "model": model, "max_steps": max_steps, "backend": backend, "route": route, "depth": depth,
+                       "temperature": temperature, "seed": seed, "tools": tools, "retrieval": retrieval}
+            await save_checkpoint(chain_id, "running", prompt=prompt, options=options,
+                                  depth=depth_info, retrieval=retrieval_info, messages=messages, steps=steps, step_count=step_count, total_thinking_time=total_thinking_time, final=final)
+
+    while not final:
+        start_time = time.time()
+        with span("step", step=step_count) as step_span:
+            step_data, raw_content, metrics = await routed_call(messages, 300, router, model=model, session=session, backend=backend, temperature=temperature, seed=seed)
+            step_span.set(title=step_data['title'], tokens=metrics.get("eval_count"))
+        end_time = time.time()
+        thinking_time = end_time - start_time
+        total_thinking_time += thinking_time
+        STEP_LATENCY.observe(thinking_time, backend=backend, model=model)
+
+        content = step_data['content']
+        tool_call = None
+        if tools and step_data.get('tool') and not metrics.get("failed"):
+            # Computed locally instead of by the steps the model would spend counting or calculating
+            with span("tool", tool=str(step_data['tool'])) as tool_span:
+                tool_call = metrics["tool"] = await run_tool(step_data['tool'], step_data.get('tool_args'))
+                tool_span.set(error=tool_call.get("error"))
+            content = f"{content}\n\nTool: {describe_call(tool_call)}"
+        steps.append((f"Step {step_count}: {step_data['title']}", content, thinking_time, raw_content, metrics))
+
+        messages.append({"role": "assistant", "content": json.dumps(step_data)})
+        if tool_call:
+            messages.append({"role": "user", "content": f"Tool result: {describe_call(tool_call)}"})
+        failed = failed or is_failed(steps[-1])
+
+        # Step budget reached: go straight to the final answer
+        final = bool(max_steps) and len(steps) >= max_steps
+
+        # Check if a follow-up is needed
+        follow_up = None if final else check_for_follow_up(raw_content, step_data)
+        # A final answer before the mode's minimum is turned back into a step, unless the step itself went wrong
+        if (follow_up is None and not final and min_steps and len(steps) < min_steps and step_data.get('next_action') == 'final_answer'
+                and not failed and not metrics.get("parse_error")):
+            follow_up = f"continue, and take at least {min_steps} reasoning steps before the final answer" + important_message
+        # A step that called a tool gets to use the result, even if it was meant to be the last one
+        if follow_up is None and not final and tool_call:
+            follow_up = 'continue' + important_message
+        if follow_up:
+            messages.append({"role": "user", "content": follow_up})
+            if follow_up.startswith("continue"):
+                step_count += 1
+            if checkpoint and not failed:
+                await save_checkpoint(chain_id, "running", messages=messages, steps=steps, step_count=step_count, total_thinking_time=total_thinking_time)
+            # Yield after each step so UIs and API clients see it right away
+            yield steps, None
+            continue  # Skip to the next iteration without incrementing step_count
+
+        if step_data['next_action'] == 'final_answer':
+            final = True
+        else:
+            step_count += 1
+        if checkpoint and not failed:
+            await save_checkpoint(chain_id, "running", messages=messages, steps=steps, step_count=step_count, total_thinking_time=total_thinking_time, final=final)
+
+        if not final:
+            yield steps, None  # We're not yielding the total time until the end
+
+    # Generate final answer; a single-shot query already asks for it
+    if steps:
+        messages.append(FINAL_ANSWER_REQUEST)
+
+    start_time = time.time()
+    with span("step", step="final") as step_span:
+        final_data, raw_content, metrics = await routed_call(messages, 200, router, is_final_answer=True, model=model, session=session, backend=backend,
+                                                          temperature=temperature, seed=seed)
+        step_span.set(title=final_data['title'], tokens=metrics.get("eval_count"))
+    end_time = time.time()
+    thinking_time = end_time - start_time
+    total_thinking_time += thinking_time
+    STEP_LATENCY.observe(thinking_time, backend=backend, model=model)
+    CHAIN_LATENCY.observe(total_thinking_time, backend=backend, model=model)
+
+    metrics["depth"] = depth_info
+    if retrieval_info:
+        metrics["retrieval"] = retrieval_info
+    calls = [step[4]["tool"] for step in steps if "tool" in step[4]]
+    if calls:
+        # Each call stands in for at least one step of working the result out by hand, so the chain's
+        # mean step time per call, less the tools' own time, is a lower bound of the time saved
+        tool_time = sum(call["elapsed"] for call in calls)
+        time_saved = max(0.0, len(calls) * sum(step[2] for step in steps) / len(steps) - tool_time)
+        TOOL_TIME_SAVED.inc(time_saved, model=model)
+        metrics["tools"] = {"calls": len(calls), "errors": sum("error" in call for call in calls), "tool_time": tool_time, "time_saved": time_saved}
+    steps.append(("Final Answer", final_data['content'], thinking_time, raw_content, metrics))
+    failed = failed or is_failed(steps[-1])
+
+    if checkpoint:
+        if failed:
+            await save_checkpoint(chain_id, "failed")
+        else:
+            await save_checkpoint(chain_id, "done", messages=messages, steps=steps, total_thinking_time=total_thinking_time)
+
+    if persist:
+        await persist_chain(prompt, model, steps, depth=depth)
+
+    yield steps, total_thinking_time
+
+async def aresume_chain(chain_id, prompt=None, session=None, persist=PERSIST_CHAINS, **options):
+    # Continues chain_id from its last completed step, or starts it under that id if it has no checkpoint
+    saved = await load_checkpoint(chain_id)
+    if saved is not None:
+        prompt, options = saved["prompt"], saved["options"]
+    elif prompt is None:
+        raise KeyError(f"No checkpoint for chain {chain_id}")
+    with span("chain.resume", trace_id=chain_id, resumed=saved is not None):
+        async for item in agenerate_response(prompt, **options, session=session, persist=persist, checkpoint=True):
+            yield item
+
+def engine_loop():
+    # Sync callers share one event loop thread, so their chains multiplex over one connection pool
+    global _engine_loop
+    with _engine_lock:
+        if _engine_loop is None:
+            _engine_loop = asyncio.new_event_loop()
+            threading.Thread(target=_engine_loop.run_forever, name="reasoning-loop", daemon=True).start()
+            atexit.register(lambda: asyncio.run_coroutine_threadsafe(close_connections(), _engine_loop).result(5))
+        return _engine_loop
+
+async def in_context(coroutine, context):
+    # Awaits the coroutine with the variables of context, and stores what it set back into context for the
+    # next call; create_task only takes a context argument from Python 3.11
+    for variable, value in context.items():
+        variable.set(value)
+    try:
+        return await coroutine
+    finally:
+        for variable, value in contextvars.copy_context().items():
+            context.run(variable.set, value)
+
+def run_on_loop(coroutine, loop, context):
+    # Runs in the caller's context, so spans opened by the generator keep their parent across steps
+    return asyncio.run_coroutine_threadsafe(in_context(coroutine, context), loop).result()
+
+def iterate(generator):
+    loop = engine_loop()
+    context = contextvars.copy_context()
+    try:
+        while True:
+            try:
+                yield run_on_loop(generator.__anext__(), loop, context)
+            except StopAsyncIteration:
+                return
+    finally:
+        # Also runs when the caller stops early, e.g. a Streamlit rerun
+        run_on_loop(generator.aclose(), loop, context)
+
+def get_checkpoint(chain_id):
+    return run_on_loop(load_checkpoint(chain_id), engine_loop(), contextvars.copy_context())
+
+def resume_chain(chain_id, prompt=None, **options):
+    return iterate(aresume_chain(chain_id, prompt, **options))
+
+def call(messages, max_tokens, is_final_answer=False, model=None, backend="ollama"):
+    # Sync make_api_call for apps that keep their own reasoning loop
+    return run_on_loop(make_api_call(messages, max_tokens, is_final_answer, model, backend=backend), engine_loop(), contextvars.copy_context())
+
+def generate_response(prompt, system_prompt=None, model=None, max_steps=None, persist=PERSIST_CHAINS, backend="ollama", route=ROUTE, depth=DEPTH,
+                      tools=TOOLS_ENABLED, retrieval=RETRIEVAL):
+    # Sync wrapper for the Streamlit apps and thread-based callers
+    return iterate(agenerate_response(prompt, system_prompt=system_prompt, model=model, max_steps=max_steps, persist=persist, backend=backend, route=route, depth=depth,
+                                      tools=tools, retrieval=retrieval))
+
+SYSTEM_PROMPT = """You are an expert AI assistant with advanced reasoning capabilities. Your task is to provide detailed, step-by-step explanations of your thought process. For each step:
+
+1. Provide a clear, concise title describing the current reasoning phase.
+2. Elaborate on your thought process in the content section.
+3. Decide whether to continue reasoning or provide a final answer.
+
+Response Format:
+Use JSON with keys: 'title', 'content', 'next_action' (values: 'continue' or 'final_answer')
+
+Key Instructions:
+- Employ at least 5 distinct reasoning steps such as Edge Case Consideration, Precision Consideration, Alternative Hypothesis or Approach Evaluation and Elimination, etc.
+- Acknowledge your limitations as an AI and explicitly state what you can and cannot do.
+- Actively explore and evaluate alternative answers or approaches.
+- Critically assess your own reasoning; identify potential flaws or biases.
+- When re-examining, employ a fundamentally different approach or perspective.
+- Utilize at least 4 diverse methods to derive or verify your answer.
+- Incorporate relevant domain knowledge and best practices in your reasoning.
+- Quantify certainty levels for each step and the final conclusion when applicable.
+- Consider potential edge cases or exceptions to your reasoning.
+- Provide clear justifications for eliminating alternative hypotheses.
+
+"""
+important_message=""" 
+IMPORTANT: Respond STRICTLY with a single, well-formatted JSON object for each step. Do not include any text outside the JSON object. Think STEP by STEP. 
+
+Response Format:
+Use JSON with keys: 'title', 'content', 'next_action' (values: 'continue' or 'final_answer')
+
+Example of a valid JSON response:
+{"title": "Initial Problem Analysis", "content": "To approach this problem effectively, I'll first break down the given information into key components. This involves identifying...[detailed explanation]... By structuring the problem this way, we can systematically address each aspect.", "next_action": "continue"}
+
+"""
@@ -0,0 +1,55 @@
+import os
+import json
+import requests
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Base URL of api_server.py; the apps run chains in-process when unset
+COT_API_URL = os.getenv('COT_API_URL')
+
+class ChainError(Exception):
+    pass
+
+def step_from_dict(step):
+    return (step["title"], step["content"], step["thinking_time"], step["raw_content"], step["metrics"])
+
+def parse_events(lines):
+    # Server-Sent Events: "event:" and "data:" fields, dispatched on a blank line
+    event, data = "message", []
+    for line in lines:
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+def start_chain(prompt, api_url=COT_API_URL, session=None, **options):
+    http = session or requests
+    response = http.post(f"{api_url}/chains", json={"prompt": prompt, **options}, timeout=30)
+    response.raise_for_status()
+    return response.json()["chain_id"]
+
+def stream_chain(prompt, api_url=COT_API_URL, session=None, **options):
+    # Same contract as reasoning.generate_response: yields (steps, None) per step, then (steps, total time)
+    http = session or requests
+    chain_id = start_chain(prompt, api_url, http, **{key: value for key, value in options.items() if value is not None})
+    steps = []
+    with http.get(f"{api_url}/chains/{chain_id}/events", stream=True, timeout=(10, None)) as response:
+        response.raise_for_status()
+        for event, data in parse_events(response.iter_lines(decode_unicode=True)):
+            if event == "step":
+                steps.append(step_from_dict(data["step"]))
+                yield list(steps), None
+            elif event == "done":
+                yield list(steps), data["total_time"]
+                return
+            elif event == "error":
+                raise ChainError(data.get("error") or f"Chain {chain_id} {data.get('status')}")
+    raise ChainError(f"Event stream for chain {chain_id} ended early")
@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import asyncio
+import weakref
+import aiohttp
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from ollama_client import OllamaError
+from backends import BackendError, get_backend
+from tracing import span
+from metrics import CACHE_HITS, RETRIEVAL_LATENCY, RETRIEVALS
+
+# Few-shot retrieval: the stored chains whose queries are most similar to a new one, the best of which
+# is shown to the model as a worked example in place of starting from the generic example alone
+
+# Load environment variables
+load_dotenv()
+
+RETRIEVAL = os.getenv('RETRIEVAL', '').lower() in ('1', 'true', 'yes')
+# Embeddings come from this backend whatever backend the chain runs on
+RETRIEVAL_BACKEND = os.getenv('RETRIEVAL_BACKEND', 'ollama')
+# Most similar chains considered per query; the first that passes the filters becomes the example
+RETRIEVAL_K = int(os.getenv('RETRIEVAL_K', '5'))
+# Cosine similarity below which a stored query is not considered similar
+RETRIEVAL_MIN_SIMILARITY = float(os.getenv('RETRIEVAL_MIN_SIMILARITY', '0.75'))
+# Rated chains below this overall rating are skipped; unrated chains are used
+RETRIEVAL_MIN_SCORE = float(os.getenv('RETRIEVAL_MIN_SCORE', '0.7'))
+# Seconds between incremental index updates
+RETRIEVAL_REFRESH = float(os.getenv('RETRIEVAL_REFRESH', '60'))
+
+EMBEDDINGS_COLLECTION_NAME = "embeddings"
+# Stored chains read and embedded per request while indexing
+INDEX_BATCH = 64
+# Size of the example: steps shown and characters per step
+EXAMPLE_STEPS = 6
+EXAMPLE_STEP_CHARS = 240
+
+_indexes = weakref.WeakKeyDictionary()
+
+class Index:
+    # Unit vectors of the stored queries, in the order of the steps collection. Each refresh only reads
+    # chains stored after the last one indexed; vectors are kept in the embeddings collection, so other
+    # processes and restarts only embed queries nobody has embedded with the model yet.
+    def __init__(self):
+        self.ids = []
+        self.vectors = None
+        self.last_id = None
+        self.refreshed_at = None
+        self.task = None
+        self.error = None
+
+    def add(self, ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.vectors = vectors if self.vectors is None else np.vstack([self.vectors, vectors])
+        self.ids += ids
+
+    def search(self, vector, k):
+        # [(steps id, cosine similarity)], most similar first
+        if not self.ids:
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        similarities = self.vectors @ (vector / max(np.linalg.norm(vector), 1e-12))
+        top = np.argsort(-similarities)[:k]
+        return [(self.ids[i], float(similarities[i])) for i in top]
+
+    async def refresh(self, steps, embeddings, backend, session=None):
+        # Returns the number of chains added
+        model = backend.embed_model
+        added = 0
+        while True:
+            query = {"_id": {"$gt": self.last_id}} if self.last_id is not None else {}
+            docs = await steps.find(query, {"prompt": 1}).sort("_id", 1).limit(INDEX_BATCH).to_list()
+            if not docs:
+                break
+            ids = [doc["_id"] for doc in docs]
+            stored = {doc["_id"]: doc["vector"] async for doc in embeddings.find({"_id": {"$in": ids}, "model": model})}
+            if stored:
+                CACHE_HITS.inc(len(stored), backend=backend.name, model=model, cache="embedding")
+            missing = [doc for doc in docs if doc["_id"] not in stored and doc.get("prompt")]
+            if missing:
+                with span("retrieval.index", model=model, chains=len(missing)):
+                    vectors = await backend.embed([doc["prompt"] for doc in missing], model, session)
+                await embeddings.bulk_write([UpdateOne({"_id": doc["_id"]}, {"$set": {"model": model, "vector": vector}}, upsert=True)
+                                             for doc, vector in zip(missing, vectors)], ordered=False)
+                stored.update((doc["_id"], vector) for doc, vector in zip(missing, vectors))
+            indexed = [steps_id for steps_id in ids if steps_id in stored]
+            if indexed:
+                self.add(indexed, [stored[steps_id] for steps_id in indexed])
+            added += len(indexed)
+            self.last_id = ids[-1]
+            if len(docs) < INDEX_BATCH:
+                break
+        self.refreshed_at = time.monotonic()
+        return added
+
+    def ensure_fresh(self, steps, embeddings, backend, session=None):
+        # Refreshes in the background, so a query never waits for indexing; it searches what is indexed so far
+        stale = self.refreshed_at is None or time.monotonic() - self.refreshed_at > RETRIEVAL_REFRESH
+        if stale and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.refresh(steps, embeddings, backend, session))
+            self.task.add_done_callback(self.refreshed)
+
+    def refreshed(self, task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        self.error = None if error is None else str(error) or type(error).__name__
+        if error is not None:
+            # Retried after RETRIEVAL_REFRESH rather than on every query
+            self.refreshed_at = time.monotonic()
+            print(f"Failed to refresh the retrieval index: {self.error}")
+
+def get_index():
+    # One index per event loop, like the engine's sessions
+    loop = asyncio.get_running_loop()
+    index = _indexes.get(loop)
+    if index is None:
+        index = _indexes[loop] = Index()
+    return index
+
+def usable(doc):
+    # Only chains that reasoned in steps and reached a final answer without a failed call
+    steps = doc.get("steps") or []
+    return (len(steps) > 1 and steps[-1][0] == "Final Answer"
+            and not any(isinstance(step[4], dict) and step[4].get("failed") for step in steps))
+
+def shorten(text, limit=EXAMPLE_STEP_CHARS):
+    text = re.sub(r"\s+", " ", str(text)).strip()
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + " ..."
+
+def format_example(doc):
+    # Titles and the start of each step: the shape of a good chain without many prompt tokens
+    *reasoning, final = doc["steps"]
+    lines = [f"Query: {doc['prompt']}"]
+    lines += [f"{title}: {shorten(content)}" for title, content, *_ in reasoning[:EXAMPLE_STEPS]]
+    if len(reasoning) > EXAMPLE_STEPS:
+        lines.append(f"({len(reasoning) - EXAMPLE_STEPS} more steps)")
+    lines.append(f"Final Answer: {shorten(final[1])}")
+    return EXAMPLE_PROMPT + "\n".join(lines) + "\n\n"
+
+async def retrieve_example(prompt, steps, embeddings, feedback, session=None):
+    # Returns (example prompt or None, details); details are kept with the chain, including the latency
+    start_time = time.perf_counter()
+    backend = get_backend(RETRIEVAL_BACKEND)
+    index = get_index()
+    example = None
+    details = {"indexed": len(index.ids)}
+    try:
+        with span("retrieval", model=backend.embed_model, indexed=len(index.ids)) as retrieval_span:
+            index.ensure_fresh(steps, embeddings, backend, session)
+            if index.ids:
+                vector = (await backend.embed([prompt], session=session))[0]
+                candidates = [(steps_id, similarity) for steps_id, similarity in index.search(vector, RETRIEVAL_K)
+                              if similarity >= RETRIEVAL_MIN_SIMILARITY]
+                details["candidates"] = len(candidates)
+                if candidates:
+                    docs = {doc["_id"]: doc async for doc in steps.find({"_id": {"$in": [steps_id for steps_id, _ in candidates]}},
+                                                                        {"prompt": 1, "steps": 1, "feedback_id": 1})}
+                    feedback_ids = [doc["feedback_id"] for doc in docs.values() if doc.get("feedback_id")]
+                    scores = {doc["_id"]: doc.get("overall") async for doc in feedback.find({"_id": {"$in": feedback_ids}}, {"overall": 1})}
+                    for steps_id, similarity in candidates:
+                        doc = docs.get(steps_id)
+                        if doc is None or not usable(doc):
+                            continue
+                        score = scores.get(doc.get("feedback_id"))
+                        if score is not None and score < RETRIEVAL_MIN_SCORE:
+                            continue
+                        example = format_example(doc)
+                        details.update(example_id=str(steps_id), similarity=similarity, score=score, prompt=doc["prompt"], steps=len(doc["steps"]) - 1)
+                        break
+            retrieval_span.set(hit=example is not None, similarity=details.get("similarity"))
+    except (aiohttp.ClientError, asyncio.TimeoutError, OllamaError, BackendError, PyMongoError) as e:
+        details["error"] = str(e) or type(e).__name__
+    if index.error:
+        details["index_error"] = index.error
+    details["latency"] = time.perf_counter() - start_time
+    RETRIEVAL_LATENCY.observe(details["latency"], model=backend.embed_model)
+    RETRIEVALS.inc(outcome="error" if "error" in details else "hit" if example else "miss")
+    return example, details
+
+async def build_index():
+    # Embeds every stored chain that has no vector for the embedding model yet, e.g. before turning RETRIEVAL on
+    from reasoning import close_connections, get_collection, get_session
+    try:
+        start_time = time.time()
+        index = get_index()
+        added = await index.refresh(get_collection(), get_collection(EMBEDDINGS_COLLECTION_NAME), get_backend(RETRIEVAL_BACKEND), get_session())
+        print(f"Indexed {added} chains in {time.time() - start_time:.2f} seconds")
+    finally:
+        await close_connections()
+
+EXAMPLE_PROMPT = """Here is a worked example: a similar query solved earlier, shortened. Follow its approach where it fits, but reason about the new query on its own terms.
+"""
+
+if __name__ == "__main__":
+    asyncio.run(build_index())
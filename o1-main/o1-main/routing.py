@@ -0,0 +1,76 @@
+import os
+import re
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Default route for every chain, e.g. "llama3.2>hf.co/bartowski/Llama-3.1-Nemotron-70B-Instruct-HF-GGUF:IQ1_M@0.6";
+# unset keeps each chain on a single model
+ROUTE = os.getenv('ROUTE')
+# Self-reported certainty below which a step is re-run on the large model
+ROUTE_MIN_CERTAINTY = float(os.getenv('ROUTE_MIN_CERTAINTY', '0.6'))
+
+# Words the model uses instead of a number when asked to quantify certainty
+CERTAINTY_WORDS = {"very high": 0.95, "high": 0.85, "moderate": 0.6, "medium": 0.6, "low": 0.3, "very low": 0.1}
+CERTAINTY_PERCENT = re.compile(r"\b(?:certainty|confidence)\b[^.\n]{0,40}?(\d{1,3}(?:\.\d+)?)\s*%", re.IGNORECASE)
+CERTAINTY_FRACTION = re.compile(r"\b(?:certainty|confidence)\b[^.\n]{0,40}?(?<![\d.])(0?\.\d+|[01](?:\.0+)?)(?![\d.%])", re.IGNORECASE)
+CERTAINTY_WORD = re.compile(r"\b(?:certainty|confidence)\b[^.\n]{0,40}?\b(very high|very low|high|moderate|medium|low)\b", re.IGNORECASE)
+
+def to_fraction(value):
+    value = float(value)
+    return value / 100 if value > 1 else value
+
+def certainty(step_data):
+    # Self-reported certainty of a step as a fraction, or None when the step doesn't state one.
+    # The system prompt asks for certainty levels, which models give as a key or in the content.
+    for key in ("certainty", "confidence"):
+        value = step_data.get(key)
+        if isinstance(value, (int, float)):
+            return to_fraction(value)
+        if isinstance(value, str):
+            step_data = {"content": f"{key}: {value}"}
+            break
+    content = str(step_data.get("content", ""))
+    match = CERTAINTY_PERCENT.search(content)
+    if match:
+        return float(match.group(1)) / 100
+    match = CERTAINTY_FRACTION.search(content)
+    if match:
+        return float(match.group(1))
+    match = CERTAINTY_WORD.search(content)
+    if match:
+        return CERTAINTY_WORDS[match.group(1).lower()]
+    return None
+
+class Router:
+    # Intermediate steps run on the small model; the final answer, and any step the small model fails,
+    # parses badly or is unsure about, run on the large one
+
+    def __init__(self, small, large, min_certainty=ROUTE_MIN_CERTAINTY):
+        self.small = small
+        self.large = large
+        self.min_certainty = min_certainty
+
+    @classmethod
+    def parse(cls, spec):
+        # "small>large" or "small>large@min_certainty"
+        models, _, threshold = spec.partition("@")
+        small, separator, large = models.partition(">")
+        if not separator or not small.strip() or not large.strip():
+            raise ValueError(f"Route {spec!r} is not of the form small>large[@min_certainty]")
+        return cls(small.strip(), large.strip(), float(threshold) if threshold else ROUTE_MIN_CERTAINTY)
+
+    def escalation(self, step_data, metrics):
+        # Why a small-model step should be re-run on the large model, or None
+        if metrics.get("failed"):
+            return "failed"
+        if metrics.get("parse_error"):
+            return "parse_failure"
+        value = certainty(step_data)
+        if value is not None and value < self.min_certainty:
+            return "low_certainty"
+        return None
+
+    def __str__(self):
+        return f"{self.small}>{self.large}@{self.min_certainty:g}"
@@ -0,0 +1,77 @@
+import os
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from rater import rate_step
+from tracing import bind, span
+
+# Pipelined per-step rating configuration
+STEP_RATING = os.getenv('STEP_RATING', '0') == '1'
+STEP_RATING_THRESHOLD = float(os.getenv('STEP_RATING_THRESHOLD', '0.5'))
+STEP_RATING_WORKERS = int(os.getenv('STEP_RATING_WORKERS', '2'))
+
+class StepRater:
+    # Rates each finished step on the rater box while the next step is being generated.
+    # Nothing here blocks the reasoning loop until wait_all() at the end of the chain.
+
+    def __init__(self, query, threshold=STEP_RATING_THRESHOLD, workers=STEP_RATING_WORKERS):
+        self.query = query
+        self.threshold = threshold
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="step-rater")
+        self.titles = []
+        self.pending = {}
+        self.results = {}
+        self.checked = set()
+
+    def rate(self, previous_titles, title, content):
+        with span("step.rating", title=title) as rating_span:
+            rating = rate_step(self.query, previous_titles, title, content, self.session)
+            rating_span.set(**{criterion.lower(): value for criterion, value in rating["ratings"].items()})
+            return rating
+
+    def submit(self, index, title, content):
+        # index is the position of the step in the steps list
+        future = self.executor.submit(bind(self.rate), list(self.titles), title, content)
+        self.pending[index] = (title, future)
+        self.titles.append(title)
+
+    def _collect_done(self):
+        for index, (title, future) in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[index]
+            try:
+                self.results[index] = {"index": index, "title": title, **future.result()}
+            except Exception as e:
+                self.results[index] = {"index": index, "title": title, "ratings": {}, "error": str(e)}
+
+    def ratings(self):
+        self._collect_done()
+        return dict(self.results)
+
+    def correction_prompt(self):
+        # Non-blocking: builds a correction for low-rated steps that finished since the last call
+        self._collect_done()
+        corrections = []
+        for index in sorted(self.results):
+            if index in self.checked:
+                continue
+            self.checked.add(index)
+            rating = self.results[index]
+            failing = {criterion: value for criterion, value in rating["ratings"].items() if value < self.threshold}
+            if failing:
+                details = "; ".join(
+                    f"{criterion} {value:.2f}: {rating['comments'].get(criterion, '')}" for criterion, value in failing.items()
+                )
+                corrections.append(f"A reviewer rated your step '{rating['title']}' low ({details}).")
+        if not corrections:
+            return ""
+        return " ".join(corrections) + " Re-examine those steps with a fundamentally different approach before continuing.\n"
+
+    def wait_all(self):
+        wait([future for _, future in self.pending.values()])
+        self._collect_done()
+        self.executor.shutdown(wait=False)
+        self.session.close()
+        return [self.results[index] for index in sorted(self.results)]
@@ -0,0 +1,359 @@
+import os
+import sys
+import ast
+import math
+import time
+import asyncio
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+from metrics import TOOL_CALLS, TOOL_LATENCY
+
+# Deterministic tools a reasoning step can call instead of counting or calculating by hand. A step adds
+# 'tool' and 'tool_args' to its JSON (flat keys, since the step parser only handles one level of nesting);
+# the engine runs the tool locally and sends the result back before the next step.
+
+# Load environment variables
+load_dotenv()
+
+TOOLS_ENABLED = os.getenv('TOOLS', '').lower() in ('1', 'true', 'yes')
+# Seconds an expression may run in the sandbox process before it is killed and the call fails
+TOOL_TIMEOUT = float(os.getenv('TOOL_TIMEOUT', '1'))
+# Address space of the sandbox process; an expression that needs more fails with a MemoryError
+TOOL_MEMORY_MB = int(os.getenv('TOOL_MEMORY_MB', '512'))
+
+# Limits that keep a model-written expression from using unbounded time or memory
+MAX_EXPRESSION_LENGTH = 500
+MAX_SEQUENCE_LENGTH = 100000
+MAX_RANGE = 10000
+MAX_EXPONENT = 1000
+MAX_RESULT_LENGTH = 300
+MAX_BITS = 10000
+# Arguments of lcm, whose result can grow with each one
+MAX_ARGUMENTS = 100
+
+class ToolError(Exception):
+    pass
+
+def checked_size(value):
+    if isinstance(value, (str, bytes, list, tuple)) and len(value) > MAX_SEQUENCE_LENGTH:
+        raise ToolError(f"result longer than {MAX_SEQUENCE_LENGTH}")
+    if isinstance(value, int) and value.bit_length() > MAX_BITS:
+        raise ToolError("number too large")
+    return value
+
+def safe_mul(left, right):
+    # Checked before multiplying, so "a" * 10**9 fails without allocating
+    for sequence, count in ((left, right), (right, left)):
+        if isinstance(sequence, (str, list, tuple)) and isinstance(count, int) and len(sequence) * count > MAX_SEQUENCE_LENGTH:
+            raise ToolError(f"result longer than {MAX_SEQUENCE_LENGTH}")
+    return checked_size(left * right)
+
+def safe_pow(base, exponent):
+    if isinstance(exponent, (int, float)) and abs(exponent) > MAX_EXPONENT:
+        raise ToolError(f"exponent above {MAX_EXPONENT}")
+    return checked_size(base ** exponent)
+
+def safe_range(*args):
+    values = range(*args)
+    if len(values) > MAX_RANGE:
+        raise ToolError(f"range longer than {MAX_RANGE}")
+    return values
+
+def safe_factorial(value):
+    if value > MAX_EXPONENT:
+        raise ToolError(f"factorial above {MAX_EXPONENT}")
+    return math.factorial(value)
+
+def safe_comb(n, k=None):
+    # comb and perm take time in n, like factorial
+    if n > MAX_EXPONENT:
+        raise ToolError(f"comb above {MAX_EXPONENT}")
+    return math.comb(n, k)
+
+def safe_perm(n, k=None):
+    if n > MAX_EXPONENT:
+        raise ToolError(f"perm above {MAX_EXPONENT}")
+    return math.perm(n, k)
+
+def checked_arguments(arguments):
+    if len(arguments) > MAX_ARGUMENTS:
+        raise ToolError(f"more than {MAX_ARGUMENTS} arguments")
+    for argument in arguments:
+        checked_size(argument)
+    return arguments
+
+def safe_gcd(*arguments):
+    return math.gcd(*checked_arguments(arguments))
+
+def safe_lcm(*arguments):
+    # One argument at a time, so the result is checked before it grows further
+    result = 1
+    for argument in checked_arguments(arguments):
+        result = checked_size(math.lcm(result, argument))
+    return result
+
+MATH_NAMES = {
+    "sqrt": math.sqrt, "log": math.log, "log10": math.log10, "log2": math.log2, "exp": math.exp,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan, "floor": math.floor, "ceil": math.ceil,
+    "factorial": safe_factorial, "gcd": safe_gcd, "lcm": safe_lcm, "comb": safe_comb, "perm": safe_perm,
+    "abs": abs, "round": round, "min": min, "max": max, "pi": math.pi, "e": math.e,
+}
+PYTHON_NAMES = {
+    **MATH_NAMES,
+    "len": len, "sum": sum, "sorted": sorted, "reversed": reversed, "enumerate": enumerate, "zip": zip, "range": safe_range,
+    "list": list, "set": set, "tuple": tuple, "dict": dict, "str": str, "int": int, "float": float, "bool": bool,
+    "any": any, "all": all, "ord": ord, "chr": chr, "True": True, "False": False, "None": None,
+}
+# Methods of str, list and dict that neither mutate nor reach outside the value
+SAFE_METHODS = {
+    "count", "lower", "upper", "title", "strip", "lstrip", "rstrip", "split", "join", "replace", "find", "rfind", "index",
+    "startswith", "endswith", "isdigit", "isalpha", "isalnum", "isspace", "isupper", "islower", "keys", "values", "items", "get",
+}
+ARITHMETIC_NODES = (ast.Expression, ast.Constant, ast.BinOp, ast.UnaryOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv,
+                    ast.Mod, ast.Pow, ast.USub, ast.UAdd, ast.Call, ast.Name, ast.Load, ast.Tuple)
+PYTHON_NODES = ARITHMETIC_NODES + (
+    ast.BoolOp, ast.And, ast.Or, ast.Not, ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+    ast.Is, ast.IsNot, ast.IfExp, ast.Attribute, ast.Subscript, ast.Slice, ast.List, ast.Set, ast.Dict, ast.ListComp,
+    ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.comprehension, ast.Store, ast.keyword, ast.JoinedStr, ast.FormattedValue,
+)
+
+class Guard(ast.NodeTransformer):
+    # Routes * and ** through the size checks above
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        function = {ast.Mult: "_mul", ast.Pow: "_pow"}.get(type(node.op))
+        if function is None:
+            return node
+        return ast.copy_location(ast.Call(ast.Name(function, ast.Load()), [node.left, node.right], []), node)
+
+def evaluate(expression, names, nodes):
+    # Evaluates one expression after checking every node against a whitelist. Nothing outside names is
+    # reachable: no builtins, no dunder attributes, no statements, and at most one comprehension loop.
+    if not isinstance(expression, str) or not expression.strip():
+        raise ToolError("expected an expression")
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ToolError(f"expression longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ToolError(f"invalid expression: {e.msg}")
+    loops = 0
+    for node in ast.walk(tree):
+        if not isinstance(node, nodes):
+            raise ToolError(f"{type(node).__name__} is not allowed")
+        if isinstance(node, ast.Name) and node.id.startswith("_"):
+            raise ToolError(f"name {node.id} is not allowed")
+        if isinstance(node, ast.Attribute) and node.attr not in SAFE_METHODS:
+            raise ToolError(f"attribute {node.attr} is not allowed")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, str, bool, type(None))):
+            raise ToolError("only numbers, strings and booleans are allowed")
+        loops += isinstance(node, ast.comprehension)
+    if loops > 1:
+        raise ToolError("only one comprehension loop is allowed")
+    code = compile(ast.fix_missing_locations(Guard().visit(tree)), "<tool>", "eval")
+    try:
+        return checked_size(eval(code, {"__builtins__": {}, "_mul": safe_mul, "_pow": safe_pow, **names}))
+    except ToolError:
+        raise
+    except Exception as e:
+        raise ToolError(f"{type(e).__name__}: {e}")
+
+def calculator(expression):
+    result = evaluate(str(expression), MATH_NAMES, ARITHMETIC_NODES)
+    if isinstance(result, bool) or not isinstance(result, (int, float)):
+        raise ToolError("not an arithmetic expression")
+    return result
+
+def python(expression):
+    return evaluate(str(expression), PYTHON_NAMES, PYTHON_NODES)
+
+def count(text, substring, case_sensitive=False):
+    # Non-overlapping occurrences, ignoring case unless asked not to
+    text, substring = str(text), str(substring)
+    if not substring:
+        raise ToolError("substring is empty")
+    if not case_sensitive:
+        text, substring = text.lower(), substring.lower()
+    return text.count(substring)
+
+def length(text):
+    return len(str(text))
+
+def reverse(text):
+    return str(text)[::-1]
+
+def words(text):
+    return len(str(text).split())
+
+# Name -> (function, description for the prompt)
+TOOLS = {
+    "calculator": (calculator, "[expression]: arithmetic with + - * / // % **, parentheses and sqrt, log, factorial, gcd, comb, pi"),
+    "count": (count, "[text, substring]: occurrences of substring in text, ignoring case"),
+    "length": (length, "[text]: number of characters"),
+    "reverse": (reverse, "[text]: the text backwards"),
+    "words": (words, "[text]: number of words"),
+    "python": (python, "[expression]: one Python expression with len, sum, sorted, range, comprehensions and str/list methods"),
+}
+
+# Tools that evaluate model-written expressions. Their cost isn't bounded by their input's length, so they
+# run in the sandbox process, off the event loop and under TOOL_TIMEOUT; the string tools run in place.
+SANDBOXED = {"calculator", "python"}
+
+def call_tool(name, args):
+    # The result as shown to the model
+    try:
+        return "result", repr(TOOLS[name][0](*args))[:MAX_RESULT_LENGTH]
+    except (ToolError, TypeError, ValueError) as e:
+        return "error", str(e)
+    except MemoryError:
+        return "error", "out of memory"
+
+def sandbox_worker(connection, memory_mb):
+    # Main loop of the sandbox process
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 1024 * 1024, memory_mb * 1024 * 1024))
+    except (ImportError, ValueError, OSError):
+        # No address space limit on this platform; the time limit still applies
+        pass
+    while True:
+        try:
+            name, args = connection.recv()
+        except EOFError:
+            return
+        connection.send(call_tool(name, args))
+
+class Sandbox:
+    # One long-lived process, started on first use, so a call costs a round trip rather than a process start.
+    # A call that runs past the timeout gets the process killed; the next call starts a new one.
+    def __init__(self, timeout=TOOL_TIMEOUT, memory_mb=TOOL_MEMORY_MB):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.process = None
+        self.connection = None
+        # Calls come from worker threads of every event loop
+        self.lock = threading.Lock()
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=sandbox_worker, args=(child, self.memory_mb), name="tool-sandbox", daemon=True)
+        self.process.start()
+        child.close()
+
+    def stop(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+        self.process = self.connection = None
+
+    def ensure_started(self):
+        if self.process is None or not self.process.is_alive():
+            if self.process is not None:
+                self.stop()
+            self.start()
+
+    def call(self, name, args):
+        with self.lock:
+            self.ensure_started()
+            try:
+                self.connection.send((name, args))
+                if self.connection.poll(self.timeout):
+                    return self.connection.recv()
+            except (EOFError, OSError):
+                # The process died mid-call, e.g. killed by the memory limit
+                self.stop()
+                return "error", "sandbox process died"
+            self.stop()
+            return "error", f"timed out after {self.timeout:g} s"
+
+    async def acquire(self):
+        # Waits for the lock in a thread, off the event loop. A thread can't be cancelled: when the caller is
+        # cancelled first, the thread hands the lock straight back once it gets it, so later calls don't hang.
+        if self.lock.acquire(blocking=False):
+            return
+        handoff = threading.Lock()
+        state = {"taken": False, "abandoned": False}
+
+        def take():
+            self.lock.acquire()
+            with handoff:
+                if state["abandoned"]:
+                    self.lock.release()
+                else:
+                    state["taken"] = True
+
+        try:
+            await asyncio.to_thread(take)
+        except asyncio.CancelledError:
+            with handoff:
+                if state["taken"]:
+                    self.lock.release()
+                state["abandoned"] = True
+            raise
+
+    async def acall(self, name, args):
+        # Waits for the reply on the event loop, so a call costs one round trip to the process rather than
+        # a thread hand-off; Windows' proactor loop can't watch a pipe, so there it waits in a thread
+        if sys.platform == "win32":
+            return await asyncio.to_thread(self.call, name, args)
+        await self.acquire()
+        try:
+            self.ensure_started()
+            loop = asyncio.get_running_loop()
+            reply = loop.create_future()
+            descriptor = self.connection.fileno()
+            loop.add_reader(descriptor, lambda: reply.done() or reply.set_result(None))
+            try:
+                self.connection.send((name, args))
+                await asyncio.wait_for(reply, self.timeout)
+                return self.connection.recv()
+            finally:
+                loop.remove_reader(descriptor)
+        except asyncio.TimeoutError:
+            self.stop()
+            return "error", f"timed out after {self.timeout:g} s"
+        except (EOFError, OSError):
+            # The process died mid-call, e.g. killed by the memory limit
+            self.stop()
+            return "error", "sandbox process died"
+        except asyncio.CancelledError:
+            # Its reply would be read by the next call
+            self.stop()
+            raise
+        finally:
+            self.lock.release()
+
+sandbox = Sandbox()
+
+async def run_tool(name, args):
+    # Returns the call as stored in the step's metrics: name, args, result or error, and its time
+    start = time.perf_counter()
+    call = {"name": str(name), "args": args}
+    key = str(name).strip().lower()
+    if not isinstance(args, list):
+        args = [] if args is None else [args]
+    if key not in TOOLS:
+        outcome, value = "error", f"unknown tool {name!r}; available: {', '.join(TOOLS)}"
+    elif key in SANDBOXED:
+        outcome, value = await sandbox.acall(key, args)
+    else:
+        outcome, value = call_tool(key, args)
+    call[outcome] = value
+    call["elapsed"] = time.perf_counter() - start
+    TOOL_CALLS.inc(tool=call["name"], outcome="error" if "error" in call else "ok")
+    TOOL_LATENCY.observe(call["elapsed"], tool=call["name"])
+    return call
+
+def describe_call(call):
+    args = ", ".join(repr(arg) for arg in call["args"]) if isinstance(call["args"], list) else repr(call["args"])
+    outcome = call["result"] if "result" in call else f"error: {call['error']}"
+    return f"{call['name']}({args}) = {outcome}"
+
+TOOLS_PROMPT = """Tools: for counting, arithmetic and string manipulation, don't work the result out by hand. Add the keys 'tool' and 'tool_args' (a list) to the step's JSON, and the exact result will be sent to you before your next step. Available tools:
+""" + "".join(f"- {name} {description}\n" for name, (_, description) in TOOLS.items()) + """
+Example of a step calling a tool:
+{"title": "Counting the letter", "content": "I count the occurrences of 'r' in 'strawberry' with a tool.", "tool": "count", "tool_args": ["strawberry", "r"], "next_action": "continue"}
+
+"""
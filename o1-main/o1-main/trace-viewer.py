@@ -0,0 +1,109 @@
+import os
+import json
+import argparse
+from collections import defaultdict
+from datetime import datetime
+
+from tracing import TRACE_FILE
+
+BAR_WIDTH = 50
+# Attributes worth showing next to a span in the waterfall
+SHOWN_ATTRIBUTES = ("model", "step", "title", "attempt", "status_code", "eval_count", "tokens", "agent", "to_agent", "collection", "error")
+
+def load_spans(path):
+    spans = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                spans[record["trace_id"]].append(record)
+    return spans
+
+def list_traces(spans, limit):
+    rows = []
+    for trace_id, trace in spans.items():
+        start = min(record["start"] for record in trace)
+        end = max(record["start"] + record["duration"] for record in trace)
+        roots = [record["name"] for record in trace if record["parent_id"] is None]
+        rows.append((start, trace_id, ",".join(roots), end - start, len(trace)))
+    for start, trace_id, roots, duration, count in sorted(rows)[-limit:]:
+        print(f"{datetime.fromtimestamp(start):%Y-%m-%d %H:%M:%S}  {trace_id}  {roots:<12} {duration:8.2f}s  {count} spans")
+
+def describe(record):
+    attributes = record["attributes"]
+    details = [f"{key}={str(attributes[key])[:40]}" for key in SHOWN_ATTRIBUTES if attributes.get(key) is not None]
+    if record["status"] != "ok":
+        details.insert(0, record["status"].upper())
+    return " ".join(details)
+
+def print_waterfall(trace):
+    children = defaultdict(list)
+    by_id = {record["span_id"]: record for record in trace}
+    for record in trace:
+        parent = record["parent_id"] if record["parent_id"] in by_id else None
+        children[parent].append(record)
+
+    origin = min(record["start"] for record in trace)
+    total = max(record["start"] + record["duration"] for record in trace) - origin or 1
+
+    def walk(record, depth):
+        offset = int((record["start"] - origin) / total * BAR_WIDTH)
+        width = max(1, int(record["duration"] / total * BAR_WIDTH))
+        bar = " " * offset + "█" * min(width, BAR_WIDTH - offset)
+        label = ("  " * depth + record["name"])[:28]
+        print(f"{label:<28} |{bar:<{BAR_WIDTH}}| {record['duration'] * 1000:9.1f} ms  {describe(record)}")
+        for child in sorted(children[record["span_id"]], key=lambda r: r["start"]):
+            walk(child, depth + 1)
+
+    for root in sorted(children[None], key=lambda r: r["start"]):
+        walk(root, 0)
+
+def print_flame_summary(trace):
+    # Self time per span name: its duration minus the time covered by its children
+    child_time = defaultdict(float)
+    for record in trace:
+        if record["parent_id"]:
+            child_time[record["parent_id"]] += record["duration"]
+
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for record in trace:
+        summary = totals[record["name"]]
+        summary[0] += 1
+        summary[1] += record["duration"]
+        summary[2] += max(0.0, record["duration"] - child_time[record["span_id"]])
+
+    overall = sum(summary[2] for summary in totals.values()) or 1
+    print(f"\n{'span':<20} {'count':>6} {'total s':>10} {'self s':>10} {'self %':>7}")
+    for name, (count, total, self_time) in sorted(totals.items(), key=lambda item: -item[1][2]):
+        print(f"{name:<20} {count:>6} {total:>10.2f} {self_time:>10.2f} {self_time / overall:>7.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Waterfall and flame summary of traced reasoning chains")
+    parser.add_argument("trace_id", nargs="?", help="chain id (trace id); lists recent traces when omitted")
+    parser.add_argument("--file", default=TRACE_FILE or "traces.jsonl", help="span JSONL file (default: TRACE_FILE)")
+    parser.add_argument("--limit", type=int, default=20, help="number of traces to list")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"No trace file at {args.file}. Set TRACE_FILE to enable tracing.")
+        return
+
+    spans = load_spans(args.file)
+    if not args.trace_id:
+        list_traces(spans, args.limit)
+        return
+
+    # Allow a unique prefix of the chain id
+    matches = [trace_id for trace_id in spans if trace_id.startswith(args.trace_id)]
+    if len(matches) != 1:
+        print(f"{len(matches)} traces match {args.trace_id!r}")
+        return
+
+    trace = spans[matches[0]]
+    print(f"Trace {matches[0]}\n")
+    print_waterfall(trace)
+    print_flame_summary(trace)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import uuid
+import inspect
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Spans are appended here as JSON lines; tracing still assigns ids when unset but exports nothing
+TRACE_FILE = os.getenv('TRACE_FILE')
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+_export_file = None
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = time.time()
+        self.perf_start = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, duration):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+def export(record):
+    global _export_file
+    with _export_lock:
+        if _export_file is None:
+            _export_file = open(TRACE_FILE, "a", buffering=1)
+        _export_file.write(json.dumps(record, default=str) + "\n")
+
+def current_span():
+    return _current_span.get()
+
+def current_trace_id():
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+@contextmanager
+def span(name, trace_id=None, **attributes):
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+    current = Span(name, trace_id, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except GeneratorExit:
+        current.status = "cancelled"
+        raise
+    except BaseException as e:
+        current.status = "error"
+        current.attributes["error"] = str(e)
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Generator resumed from another context; restore the parent by hand
+            _current_span.set(parent)
+        if TRACE_FILE:
+            export(current.to_dict(time.perf_counter() - current.perf_start))
+
+def trace_generator(name, **attributes):
+    # Wraps a generator such as generate_response in one span covering all of its steps
+    def decorator(function):
+        if inspect.isasyncgenfunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                generator = function(*args, **kwargs)
+                try:
+                    with span(name, **attributes):
+                        async for item in generator:
+                            yield item
+                finally:
+                    await generator.aclose()
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                yield from function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def bind(function):
+    # Run function in a copy of the caller's context, so spans in worker threads keep their parent
+    context = contextvars.copy_context()
+    return functools.partial(context.run, function)
+
+def trace_openai_client(client, backend="ollama"):
+    # Adds a span per chat completion, e.g. each agent turn inside Swarm.run
+    completions = client.chat.completions
+    create = completions.create
+
+    @functools.wraps(create)
+    def traced_create(*args, **kwargs):
+        with span("completion", backend=backend, model=kwargs.get("model")) as completion_span:
+            response = create(*args, **kwargs)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                completion_span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+            return response
+
+    completions.create = traced_create
+    return client
@@ -0,0 +1,58 @@
+import re
+import json
+
+# Marker the apps put between the instructions and the user's query
+QUERY_MARKER = "Here is my first query: "
+FINAL_ANSWER_REQUEST = "Please provide the final answer"
+
+def estimate_tokens(text):
+    # Words and punctuation marks, close enough to BPE counts to compare prompt sizes
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+def token_report(before, after):
+    tokens_before = estimate_tokens(before)
+    tokens_after = estimate_tokens(after)
+    saved = 1 - tokens_after / tokens_before if tokens_before else 0
+    return {"tokens_before": tokens_before, "tokens_after": tokens_after, "saved": round(saved, 4)}
+
+def build_transcript(query, steps):
+    # steps are (title, content, ...) as stored by the apps; thinking time and raw_content are dropped
+    lines = [f"Query: {query}", ""] if query else []
+    for step in steps:
+        title, content = step[0], step[1]
+        match = re.match(r"Step (\d+): (.*)", title, re.S)
+        lines.append(f"{match.group(1)}. {match.group(2)}" if match else title)
+        lines.append(str(content).strip())
+        lines.append("")
+    return "\n".join(lines).strip()
+
+def steps_from_messages(messages):
+    query = None
+    steps = []
+    final_requested = False
+    for message in messages:
+        content = message.get("content") or ""
+        if message["role"] == "user":
+            if query is None and QUERY_MARKER in content:
+                query = content.split(QUERY_MARKER, 1)[1]
+            # Follow-ups only repeat 'continue' + important_message
+            final_requested = FINAL_ANSWER_REQUEST in content
+        elif message["role"] == "assistant":
+            try:
+                step_data = json.loads(content)
+            except json.JSONDecodeError:
+                continue  # The canned "Understood..." primer
+            if not isinstance(step_data, dict) or "content" not in step_data:
+                continue
+            if final_requested:
+                steps.append(("Final Answer", step_data["content"]))
+            else:
+                steps.append((f"Step {len(steps) + 1}: {step_data.get('title', '')}", step_data["content"]))
+    return query, steps
+
+def compact_messages(messages):
+    # A single user message with the numbered transcript, for the evaluation agent
+    query, steps = steps_from_messages(messages)
+    transcript = build_transcript(query, steps)
+    report = token_report("\n".join(message.get("content") or "" for message in messages), transcript)
+    return [{"role": "user", "content": transcript}], report
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import random
+import asyncio
+import itertools
+import aiohttp
+from dotenv import load_dotenv
+from ollama_client import OllamaError
+from backends import BackendError, get_backend
+from reasoning import (FINAL_ANSWER_REQUEST, PERSIST_CHAINS, chain_messages, check_for_follow_up, get_session, iterate,
+                       make_api_call, persist_chain)
+from rater import STEP_CRITERIA, build_step_rater_messages, parse_ratings
+from tracing import current_span, span, trace_generator
+from metrics import CHAIN_LATENCY, STEP_LATENCY, TREE_CANDIDATES
+
+# Tree-of-thought search: at every level each open path asks for several candidate next steps at once,
+# a short rating call scores them, and only the best paths are expanded further
+
+# Load environment variables
+load_dotenv()
+
+# Candidate next steps requested per open path
+TREE_BRANCHES = int(os.getenv('TREE_BRANCHES', '3'))
+# Open paths kept after each level
+TREE_BEAM = int(os.getenv('TREE_BEAM', '2'))
+# Steps before the final answer
+TREE_DEPTH = int(os.getenv('TREE_DEPTH', '6'))
+# Generated tokens, steps and ratings together. A level only starts as many candidates as fit in what is
+# left at their max_tokens, so the search stays within it; only the final answer's tokens come on top.
+TREE_TOKEN_BUDGET = int(os.getenv('TREE_TOKEN_BUDGET', '20000'))
+# Candidates are sampled warmer than a linear chain, so the branches differ
+TREE_TEMPERATURE = float(os.getenv('TREE_TEMPERATURE', '0.8'))
+# Model of the rating calls; defaults to the chain's model
+TREE_VALUE_MODEL = os.getenv('TREE_VALUE_MODEL')
+# Value of a candidate whose rating call failed or couldn't be parsed
+UNRATED_VALUE = 0.5
+# max_tokens of a candidate step, its rating call and the final answer
+STEP_TOKENS = 300
+VALUE_TOKENS = 150
+FINAL_TOKENS = 200
+
+# Options of agenerate_tree, for callers that pass options through
+TREE_OPTIONS = ("system_prompt", "model", "max_steps", "backend", "branches", "beam", "token_budget")
+
+class Node:
+    # One path through the tree: the messages so far, its steps and their values
+    def __init__(self, messages, steps=(), values=(), final=False):
+        self.messages = messages
+        self.steps = list(steps)
+        self.values = list(values)
+        self.final = final
+
+    @property
+    def score(self):
+        return sum(self.values) / len(self.values) if self.values else 0.0
+
+async def rate_candidate(prompt, node, step_data, model, session, backend):
+    # Mean of the rater.STEP_CRITERIA ratings of one short call, with the details kept for the step's metrics
+    messages = build_step_rater_messages(prompt, [step[0] for step in node.steps], step_data['title'], str(step_data['content']))
+    try:
+        with span("tree.value", model=model):
+            content, metrics = await backend.chat(messages, model, max_tokens=VALUE_TOKENS, temperature=0, session=session)
+    except (aiohttp.ClientError, asyncio.TimeoutError, OllamaError, BackendError) as e:
+        return None, {"error": str(e) or type(e).__name__}
+    parsed = parse_ratings(content, STEP_CRITERIA)
+    return parsed["overall"], {"ratings": parsed["ratings"], "eval_count": metrics.get("eval_count")}
+
+@trace_generator("tree")
+async def agenerate_tree(prompt, system_prompt=None, model=None, max_steps=None, session=None, persist=PERSIST_CHAINS, backend="ollama",
+                         branches=TREE_BRANCHES, beam=TREE_BEAM, token_budget=TREE_TOKEN_BUDGET):
+    # Same contract as reasoning.agenerate_response, but yields once, with the best path and its final answer,
+    # since the best path can change from one level to the next. max_steps is the depth of the tree.
+    backend_name, backend = backend, get_backend(backend)
+    model = model or backend.default_model
+    value_model = TREE_VALUE_MODEL or model
+    session = session or get_session()
+    max_steps = max_steps or TREE_DEPTH
+    seeds = itertools.count(random.randrange(2 ** 31))
+    current_span().set(backend=backend_name, model=model, branches=branches, beam=beam, depth=max_steps)
+    start_time = time.time()
+    tokens = 0
+    failed = 0
+
+    async def expand(node, level, seed):
+        nonlocal tokens
+        started = time.time()
+        step_data, raw_content, metrics = await make_api_call(node.messages, STEP_TOKENS, model=model, session=session, backend=backend_name,
+                                                              temperature=TREE_TEMPERATURE, seed=seed)
+        tokens += metrics.get("eval_count") or 0
+        if metrics.get("failed") or metrics.get("parse_error"):
+            return None
+        value, rating = await rate_candidate(prompt, node, step_data, value_model, session, backend)
+        tokens += rating.get("eval_count") or 0
+        metrics["value"] = {"value": value, **rating}
+        thinking_time = time.time() - started
+        STEP_LATENCY.observe(thinking_time, backend=backend_name, model=model)
+
+        messages = node.messages + [{"role": "assistant", "content": json.dumps(step_data)}]
+        follow_up = check_for_follow_up(raw_content, step_data)
+        if follow_up:
+            messages.append({"role": "user", "content": follow_up})
+        step = (f"Step {level}: {step_data['title']}", step_data['content'], thinking_time, raw_content, metrics)
+        return Node(messages, node.steps + [step], node.values + [UNRATED_VALUE if value is None else value],
+                    final=not follow_up and step_data.get('next_action') == 'final_answer')
+
+    frontier = [Node(chain_messages(prompt, system_prompt))]
+    finished = []
+    level = 0
+    budget_limited = False
+    while frontier and level < max_steps:
+        # As many candidates as fit in the budget if each used all of its max_tokens, spread over the open
+        # paths best first; frontier is sorted by score
+        affordable = (token_budget - tokens) // (STEP_TOKENS + VALUE_TOKENS)
+        expansions = [node for _ in range(branches) for node in frontier][:max(0, affordable)]
+        if len(expansions) < branches * len(frontier):
+            budget_limited = True
+        if not expansions:
+            break
+        level += 1
+        # Every candidate of every open path at once, so the level takes about as long as its slowest call
+        with span("tree.level", level=level, frontier=len(frontier), candidates=len(expansions)):
+            candidates = await asyncio.gather(*(expand(node, level, next(seeds)) for node in expansions))
+        children = [child for child in candidates if child is not None]
+        failed += len(candidates) - len(children)
+        TREE_CANDIDATES.inc(len(candidates) - len(children), outcome="failed")
+        if not children:
+            # Keep the paths that got this far rather than answer from nothing
+            break
+        finished += [child for child in children if child.final]
+        open_paths = sorted((child for child in children if not child.final), key=lambda child: child.score, reverse=True)
+        TREE_CANDIDATES.inc(len(children) - len(open_paths), outcome="finished")
+        TREE_CANDIDATES.inc(min(beam, len(open_paths)), outcome="kept")
+        TREE_CANDIDATES.inc(max(0, len(open_paths) - beam), outcome="pruned")
+        frontier = open_paths[:beam]
+
+    best = max(finished + frontier, key=lambda node: node.score)
+    # A path cut off by the depth or token budget still ends on its "continue" prompt
+    messages = best.messages[:-1] if best.messages[-1]["role"] == "user" else best.messages
+
+    final_start = time.time()
+    with span("step", step="final") as step_span:
+        final_data, raw_content, metrics = await make_api_call(messages + [FINAL_ANSWER_REQUEST], FINAL_TOKENS, is_final_answer=True, model=model,
+                                                               session=session, backend=backend_name)
+        step_span.set(title=final_data['title'], tokens=metrics.get("eval_count"))
+    tokens += metrics.get("eval_count") or 0
+    STEP_LATENCY.observe(time.time() - final_start, backend=backend_name, model=model)
+    total_time = time.time() - start_time
+    CHAIN_LATENCY.observe(total_time, backend=backend_name, model=model)
+
+    metrics["tree"] = {
+        "levels": level,
+        "branches": branches,
+        "beam": beam,
+        "max_depth": max_steps,
+        "finished_paths": len(finished),
+        "failed_candidates": failed,
+        "score": best.score,
+        "tokens": tokens,
+        "token_budget": token_budget,
+        "budget_exhausted": budget_limited,
+    }
+    steps = best.steps + [("Final Answer", final_data['content'], time.time() - final_start, raw_content, metrics)]
+    current_span().set(levels=level, score=best.score, tokens=tokens)
+
+    if persist:
+        await persist_chain(prompt, model, steps, tree=metrics["tree"])
+
+    # Wall-clock of the search; the steps of a level overlap
+    yield steps, total_time
+
+def generate_tree(prompt, **options):
+    # Sync wrapper, like reasoning.generate_response
+    return iterate(agenerate_tree(prompt, **options))
@@ -0,0 +1,143 @@
+import os
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import traceback
+import multiprocessing
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+import jobs
+import reasoning
+from tracing import span
+import metrics
+from metrics import QUEUE_DEPTH, start_exporters
+from rater import MONGO_URL
+
+# Load environment variables
+load_dotenv()
+
+# Chains one worker process runs at once; they are asyncio tasks, so this can be high
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '16'))
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '1'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+
+class ChainFailed(Exception):
+    pass
+
+class Worker:
+    def __init__(self, collection, concurrency=WORKER_CONCURRENCY, lease=jobs.JOB_LEASE, poll_interval=JOB_POLL_INTERVAL):
+        self.collection = collection
+        self.concurrency = concurrency
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+    async def serve(self):
+        await jobs.ensure_indexes(self.collection)
+        print(f"Worker {self.worker_id} running {self.concurrency} chains at once.")
+        await asyncio.gather(*(self.slot() for _ in range(self.concurrency)))
+
+    async def slot(self):
+        # Each slot claims and runs one job at a time, so a process never holds more jobs than it runs
+        while True:
+            job = await jobs.claim(self.collection, self.worker_id, self.lease)
+            if job is None:
+                if await jobs.fail_abandoned(self.collection):
+                    print("Failed jobs whose lease expired on the last attempt.")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            QUEUE_DEPTH.inc(queue="jobs")
+            try:
+                await self.run(job)
+            finally:
+                QUEUE_DEPTH.dec(queue="jobs")
+
+    async def keep_lease(self, job, chain):
+        # Renew well before expiry; if the lease was lost, stop the chain, since another worker owns the job now
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await jobs.renew(self.collection, job["_id"], self.worker_id, self.lease):
+                chain.cancel("lease lost")
+                return
+
+    async def execute(self, job):
+        steps, total_time = [], None
+        # Every attempt of a job is traced and checkpointed under the job's chain id, so a retry
+        # picks up after the last step the previous attempt completed
+        with span("worker.job", trace_id=job["chain_id"], job_id=str(job["_id"]), attempt=job["attempts"]):
+            async for steps, total_time in reasoning.aresume_chain(job["chain_id"], job["prompt"], persist=False, **job["options"]):
+                pass
+            failed = [step for step in steps if reasoning.is_failed(step)]
+            if failed:
+                raise ChainFailed(f"{failed[0][0]}: {failed[0][4]['errors'][-1]['message']}")
+            model = job["options"].get("model") or reasoning.get_backend(job["options"].get("backend", "ollama")).default_model
+            result_id = await reasoning.persist_chain(job["prompt"], model, steps, job_id=job["_id"], depth=steps[-1][4].get("depth", {}).get("mode"))
+        return result_id, total_time
+
+    async def run(self, job):
+        start_time = time.time()
+        chain = asyncio.create_task(self.execute(job))
+        lease = asyncio.create_task(self.keep_lease(job, chain))
+        try:
+            result_id, total_time = await chain
+            await jobs.complete(self.collection, job["_id"], self.worker_id, result_id, total_time)
+            print(f"Job {job['_id']} done in {time.time() - start_time:.2f} seconds (attempt {job['attempts']})")
+        except asyncio.CancelledError:
+            if lease.done():
+                print(f"Job {job['_id']} lost its lease; left to the worker that claimed it")
+                return
+            # Shutting down: hand the job back for another worker
+            await asyncio.shield(jobs.release(self.collection, job, self.worker_id))
+            raise
+        except Exception as e:
+            await jobs.fail(self.collection, job, self.worker_id, str(e))
+            print(f"Job {job['_id']} failed (attempt {job['attempts']}): {str(e)}")
+            traceback.print_exc()
+        finally:
+            lease.cancel()
+
+async def serve(concurrency):
+    client = AsyncMongoClient(MONGO_URL)
+    worker = Worker(jobs.get_jobs_collection(client), concurrency)
+    try:
+        await worker.serve()
+    finally:
+        await reasoning.close_connections()
+        await client.close()
+
+def run_process(concurrency, number=0):
+    # Each process serves its own metrics, on METRICS_PORT + its number
+    if metrics.METRICS_PORT:
+        metrics.METRICS_PORT = int(metrics.METRICS_PORT) + number
+    start_exporters()
+    try:
+        asyncio.run(serve(concurrency))
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(prog="python worker.py", description="Run queued reasoning chains from the jobs collection")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="worker processes, e.g. one per core")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="chains each process runs at once")
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        run_process(args.concurrency)
+        return
+    # Separate processes share nothing but the queue, exactly like workers on other hosts
+    processes = [multiprocessing.Process(target=run_process, args=(args.concurrency, number), name=f"worker-{number}")
+                 for number in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("Stopping, running jobs are handed back to the queue...")
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()